@@ -0,0 +1,52 @@
+'''Recording what goes over the wire, so that a run can be replayed later
+without a server (see replay.py).
+
+A capture file is a sequence of records, each a header line
+
+    <kind> <seconds since the capture started> <length>
+
+followed by length bytes of data and a newline. kind is RECEIVED for bytes
+read from the server, as they came out of the socket, and SENT for messages
+written to it.'''
+
+import time
+
+RECEIVED = 'r'
+SENT = 's'
+
+class Recorder(object):
+    """Writes a capture to a file object. The clock starts when the
+    recorder is made."""
+
+    def __init__(self, stream, clock=time.time):
+        self.stream = stream
+        self.clock = clock
+        self.start = clock()
+
+    def _write(self, kind, data):
+        self.stream.write('%s %.6f %d\n' % (kind, self.clock() - self.start, len(data)))
+        self.stream.write(data)
+        self.stream.write('\n')
+
+    def received(self, data):
+        self._write(RECEIVED, data)
+
+    def sent(self, data):
+        self._write(SENT, data)
+
+    def close(self):
+        self.stream.close()
+
+def read_capture(stream):
+    """Yield the (kind, time, data) records of a capture file"""
+    while True:
+        header = stream.readline()
+        if not header:
+            return
+        kind, when, length = header.split()
+        data = stream.read(int(length))
+        if stream.read(1) != '\n':
+            raise ValueError('truncated capture record at %s' % when)
+        yield kind, float(when), data
+
+# vim: et sw=4 ts=4
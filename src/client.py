@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import logging
+import optparse
 import sys
 import time
 
@@ -8,22 +9,16 @@ from twisted.internet import reactor
 from twisted.internet.protocol import Protocol, ReconnectingClientFactory
 
 # local imports
+from capture import Recorder
 import event
+from framing import FrameBuffer
+from instrument import Timings
 from message import * 
 from constants import *
 import mars_math
 import utils
 import strategies
-
-def similar(a, b, precision=0.95): 
-    d = abs(a - b)
-    return d <= ((1.0 - precision) * abs(a))
-
-def similar_position((x1, y1), (x2, y2)):
-    return similar(x1, x2) and similar(y1, y2)
-
-def similar_position(p1, p2):
-    return similar(p1.x, p2.x) and similar(p1.y, p2.y)
+from world import World
 
 class Map(object): 
     log = logging.getLogger('Map') 
@@ -44,12 +39,17 @@ class RoverController(object):
         time_limit -- int, time limit in seconds
         min_sensor -- float, minimum sensor range in meters 
         max_sensor -- float, max sensor range in meters
+        world -- world.World, the objects and martians seen; objects,
+                 martians and tracker are its
+        scheduler -- event.EventQueue, calls to make later such as
+                     compensating turns
+        timings -- instrument.Timings, latency of each stage of handling
+                   messages, reported and reset at the end of every run
         
     """
 
     log = logging.getLogger('RoverController') 
     telemetry_log = logging.getLogger('RoverController.telemetry') 
-    telemetry_log.setLevel(logging.INFO)
 
     def __init__(self, client):
         self.client = client
@@ -61,32 +61,38 @@ class RoverController(object):
         self.max_turn = -1
         self.max_hard_turn = -1 
         self.velocity = -1 
-        self.objects = []
         self.position = -1, -1
         self.direction = -1
         self.controls = ''
         self.initialized = False
         self.acceleration = ROLL
         self.origin = mars_math.Point(0.0, 0.0)
-        self.objects = []
-        self.martians = []
-
-        # holds up to three intervals
-        self.MAX_INTERVALS = 3
-        self.telemetry_intervals = []
-        self.martian_intervals = []
+        self.world = World()
+        self.scheduler = event.EventQueue(reactor)
+        self.timings = Timings()
 
     def noticeObject(self, object):
-        if object['kind'] == MARTIAN:
-            self.martians.append(object)
-
-        for o in self.objects:
-            if o['kind'] == object['kind'] \
-                    and similar_position(object['position'], o['position']):
-                break
-        else:
+        if self.world.notice(object):
             self.log.debug('found new object: %r', object)
-            self.objects.append(object)
+
+    @property
+    def objects(self):
+        '''The static objects seen, only ever appended to'''
+        return self.world.objects
+
+    @property
+    def martians(self):
+        return self.world.martians
+
+    @property
+    def tracker(self):
+        return self.world.tracker
+
+    @property
+    def world_version(self):
+        '''Incremented whenever a new object is noticed, so planners can
+        tell if anything changed since they last looked.'''
+        return self.world.version
 
     def recordCommunicationsData(self):
         '''This keeps track of communication data, like the rate that the
@@ -101,17 +107,13 @@ class RoverController(object):
         # If the amount of time we have to wait is longer than the average
         # amount of time between telemetry updates there's no reason in
         # scheduling the compensation since we'll have better logic soon
-        intervals = self.telemetry_intervals + [time.time()]
+        intervals = self.world.telemetry_intervals
+        intervals.append(time.time())
 
+        # the mean of the differences, which telescopes
         self.avg_interval = 0
         if len(intervals) > 1:
-            delta_sum = sum(y - x for x, y in zip(intervals[:-1], intervals[1:]))
-            interval_amt = (len(intervals) - 1)
-            self.avg_interval = delta_sum / interval_amt
-
-        self.telemetry_intervals = intervals
-        if len(intervals) > self.MAX_INTERVALS:
-            self.telemetry_intervals = intervals[1:]
+            self.avg_interval = (intervals[-1] - intervals[0]) / (len(intervals) - 1)
 
         # to prevent an update from being sent if it's going to be really close
          # to a telemetry update anyways
@@ -131,30 +133,35 @@ class RoverController(object):
 
     def setTelemetry(self, telemetry):
         """This is called when telemetry is updated"""
+        start = time.time()
         self.telemetry_log.debug('set: %r', telemetry) 
-        if self.acceleration != telemetry['acceleration']:
-            self.acceleration = telemetry['acceleration']
+        if self.acceleration != telemetry.acceleration:
+            self.acceleration = telemetry.acceleration
             self.telemetry_log.info('new acceleration: %r', self.acceleration)
 
-        self.turning = telemetry['turning']
-        self.position = mars_math.Point(*telemetry['position'])
-        self.velocity = telemetry['velocity']
-        self.direction = telemetry['direction']
-        for object in telemetry['objects']:
-            if 'position' in object:
-                object['position'] = mars_math.Point(*object['position'])
+        self.turning = telemetry.turning
+        self.client.controlsReported(telemetry.acceleration, telemetry.turning)
+        self.position = telemetry.position
+        self.velocity = telemetry.velocity
+        self.world.begin_frame()
+        for object in telemetry.objects:
             self.noticeObject(object)
-        self.direction = mars_math.Angle(mars_math.to_radians(telemetry['direction']))
+        self.world.end_frame(self.latest_mtime)
+        self.direction = mars_math.Angle(mars_math.to_radians(telemetry.direction))
         self.vector = mars_math.Vector(self.position, self.velocity, self.direction)
 
         self.recordCommunicationsData()
 
         # XXX: you can try out different strategies by altering this
-        if self.secondsBehind() < 0.2:
-            print "SECONDS BEHIND", self.secondsBehind()
+        behind = self.secondsBehind()
+        if behind < 0.2:
+            steer_start = time.time()
             strategies.current_strategy(self)
+            self.timings.add('strategy', time.time() - steer_start)
         else:
-            print "SKIPPING STEERING THIS UPDATE"
+            self.log.debug('%.3f seconds behind, skipping steering this update', behind)
+            self.timings.count('steering skipped')
+        self.timings.add('setTelemetry', time.time() - start)
 
 
     def secondsBehind(self): 
@@ -164,28 +171,38 @@ class RoverController(object):
         '''Since the simulation appears to run it real time this isn't strictly
         necessary, but it's nice to have it anyways since it is "correct".'''
         mtime = mtime / 1000.0 # martian time is sent in milliseconds
+        now = time.time()
         if self.time_start == None:
-            self.time_start = time.time() - 0.02
+            self.time_start = now - 0.02
+        elif now - mtime < self.time_start:
+            # sent later than it got here, so martian time started earlier
+            # than we thought, or runs faster than ours (as it does in the
+            # simulator with --warp)
+            self.time_start = now - mtime
         self.latest_mtime = mtime
 
-        intervals = self.martian_intervals + [mtime]
+        intervals = self.world.martian_intervals
+        intervals.append(mtime)
 
         self.avg_martian_interval = 0
         if len(intervals) > 1:
-            delta_sum = sum(y - x for x, y in zip(intervals[:-1], intervals[1:]))
-            interval_amt = (len(intervals) - 1)
-            self.avg_martian_interval = delta_sum / interval_amt
-
-        self.martian_intervals = intervals
-        if len(intervals) > self.MAX_INTERVALS:
-            self.martian_intervals = intervals[1:]
+            self.avg_martian_interval = (intervals[-1] - intervals[0]) / (len(intervals) - 1)
 
     def endRun(self): 
         self.time_start = None
+        self.world.end_run()
+        self.log.info('latency this run (ms):\n%s', self.timings.report())
+        self.timings.reset()
 
     def setInitial(self, initial):
         """This is called with initial data"""
         self.log.debug('received initial data: %r', initial)
+        extent = max(initial['dx'], initial['dy']) / 2.0
+        if (initial['dx'], initial['dy']) != self.map_size:
+            # a different map, so nothing seen so far applies
+            self.world.begin_session(extent)
+        else:
+            self.world.resize(extent)
         self.map_size = initial['dx'], initial['dy']
         self.time_start = None
         self.time_limit = initial['time_limit']
@@ -199,33 +216,59 @@ class RoverController(object):
         
 class TwistedClient(Protocol): 
     log = logging.getLogger('TwistedClient')
-    log.setLevel(logging.INFO)
 
     def __init__(self): 
         # for storing input
-        self.buf = []
+        self.buf = FrameBuffer()
         self.rover_ctl = RoverController(self)
+        # capture.Recorder for the bytes going in and out, if any
+        self.recorder = None
+        # (acceleration, turning) as they will be once the commands sent
+        # since the last telemetry arrive, None before the first telemetry
+        self.controls = None
+        # commands waiting to be written, and whether they will be written
+        # at the end of the current dataReceived or need a flush scheduled
+        self.pending = []
+        self.receiving = False
+        self.flush_call = None
 
     def connectionMade(self): 
         self.log.info("connection made")
         self.transport.setTcpNoDelay(True)
 
+    def connectionLost(self, reason):
+        if self.flush_call is not None and self.flush_call.active():
+            self.flush_call.cancel()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
     def dataReceived(self, data):
         """This is called by twisted every time the client socket receives data
         Args:
             data -- str, data
         """
-        self.buf.extend(data)
-        while True:
-            try:
-                idx = self.buf.index(';')
-            except ValueError:
-                break
-            msg_s = ''.join(self.buf[:idx + 1])
-            del self.buf[:idx + 1]
-            msg = Message.parse(msg_s) 
-            self.log.debug('msg: %r', msg)
-            self.messageReceived(msg)
+        start = time.time()
+        timings = self.rover_ctl.timings
+        if self.recorder is not None:
+            self.recorder.received(data)
+        self.receiving = True
+        try:
+            for msg_s in self.buf.feed(data):
+                self.frameReceived(msg_s)
+        finally:
+            self.receiving = False
+        self.flush()
+        # if this ended a run it counts towards the next one
+        timings.add('dataReceived', time.time() - start)
+
+    def frameReceived(self, msg_s):
+        """This is called with each message the server sends, unparsed"""
+        start = time.time()
+        msg = Message.parse(msg_s) 
+        self.rover_ctl.timings.add('parse', time.time() - start)
+        self.log.debug('msg: %r', msg)
+        self.messageReceived(msg)
 
     def messageReceived(self, msg): 
         """This is called every time the client receives a message.
@@ -241,17 +284,79 @@ class TwistedClient(Protocol):
             self.log.info('Successful!')
         elif msg['type'] == 'end':
             self.rover_ctl.endRun()
-            self.log.info('End of run (took %d martian seconds).' % msg['time_stamp'])
+            self.log.info('End of run (took %d martian seconds).', msg['time_stamp'])
         else:
             self.log.error('unhandled message:%r', msg['type']) 
 
+    def controlsReported(self, acceleration, turning):
+        """The server says the controls are (acceleration, turning). If
+        commands are still waiting to be written the report was made before
+        them, so it is ignored."""
+        if not self.pending:
+            self.controls = acceleration, turning
+
+    def sendCommand(self, accel=None, turn=None):
+        """Send a command to the rover, see Message.create. Parts of it that
+        wouldn't change the controls are left out, and if that leaves
+        nothing it isn't sent at all. Commands are written together at the
+        end of the reactor turn; see flush.
+        """
+        controls = self.controls
+        if controls is not None:
+            acceleration, turning = controls
+            if accel in (ACCELERATE, BRAKE):
+                after = ACCEL_STEPS[acceleration, accel]
+                if after == acceleration:
+                    accel = None
+                acceleration = after
+            if turn is not None:
+                after = TURN_STEPS[turning, turn]
+                if after == turning:
+                    turn = None
+                turning = after
+            self.controls = acceleration, turning
+        timings = self.rover_ctl.timings
+        command = COMMANDS.get((accel, turn))
+        if command is None:
+            timings.count('commands suppressed')
+            return
+        timings.count('commands sent')
+        self.pending.append(command)
+        if not self.receiving and self.flush_call is None:
+            self.flush_call = reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """Write the commands sent since the last flush in one go"""
+        if self.flush_call is not None:
+            if self.flush_call.active():
+                self.flush_call.cancel()
+            self.flush_call = None
+        if self.pending:
+            message = ''.join(self.pending)
+            del self.pending[:]
+            self.sendMessage(message)
+
     def sendMessage(self, message): 
-        self.log.info('send: %r', message)
-        return self.transport.write(message)
+        start = time.time()
+        self.log.debug('send: %r', message)
+        if self.recorder is not None:
+            self.recorder.sent(message)
+        result = self.transport.write(message)
+        self.rover_ctl.timings.add('sendMessage', time.time() - start)
+        return result
 
 class TwistedClientFactory(ReconnectingClientFactory):
     protocol = TwistedClient
     log = logging.getLogger('TwistedClient')
+    # file name to record the connection to, see capture.py
+    capture = None
+
+    def buildProtocol(self, addr):
+        client = ReconnectingClientFactory.buildProtocol(self, addr)
+        if self.capture is not None:
+            self.log.info('recording to %s', self.capture)
+            client.recorder = Recorder(open(self.capture, 'wb'))
+        return client
 
     def clientConnectionFailed(self, connector, reason):
         self.log.error('connection failed')
@@ -263,10 +368,18 @@ class TwistedClientFactory(ReconnectingClientFactory):
         reactor.stop() 
 
 if __name__ == '__main__':
-
-    if len(sys.argv) >= 3:
-        host = sys.argv[1]
-        port = int(sys.argv[2])
+    parser = optparse.OptionParser(usage='%prog [options] [host port]')
+    parser.add_option('--quiet', action='store_const', dest='profile',
+            const='production', default='debug',
+            help='only log warnings and errors, from a background thread')
+    parser.add_option('--record', metavar='FILE',
+            help='record the connection to FILE, see replay.py')
+    options, args = parser.parse_args()
+    utils.configure(options.profile)
+
+    if len(args) >= 2:
+        host = args[0]
+        port = int(args[1])
     else:
         # just use the default
         host = 'localhost'
@@ -274,6 +387,7 @@ if __name__ == '__main__':
 
     # this creates clients when connections occur
     clientFactory = TwistedClientFactory()
+    clientFactory.capture = options.record
 
     # the twisted reactor is a singleton in the app
     # you can do things with it like:
@@ -16,3 +16,12 @@ FORCE_TURN_DIST = 40.0
 FORCE_TURN_SQ = FORCE_TURN_DIST ** 2
 
 BLOAT = 1.3 # make things 30 percent bigger
+
+# Side of a grid cell in meters, for planners whose grid resolution follows
+# the size of the map
+GRID_CELL_SIZE = 2.0
+
+# The planners treat the rover as a point, so obstacles are made bigger by
+# the rover's radius and this much room to spare, in meters
+ROVER_RADIUS = 0.5
+SAFETY_MARGIN = 1.0
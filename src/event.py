@@ -1,30 +1,148 @@
-# really wish i knew twisted...
+'''Scheduling calls for later, like the compensating turns in steer_rover.
+
+An EventQueue keeps its events in a heap and arms a single reactor timer for
+the earliest one. Events can be given a tag; scheduling an event supersedes
+(cancels) any pending event with the same tag.'''
+
+import heapq
+import itertools
 
 LARGE_NUM = 1.0e6
 
 class Event(object):
-	def __init__(self, callback, args, time):
+	"""A call scheduled on an EventQueue
+
+	Instance variables:
+		callback -- function to call
+		args -- tuple of arguments to call it with
+		time -- float, reactor.seconds() at which to call it
+		tag -- the tag it was scheduled with, or None
+		cancelled -- bool
+		done -- bool, whether it has been popped off the queue (to run)
+	"""
+	__slots__ = ('callback', 'args', 'time', 'tag', 'cancelled', 'done')
+
+	def __init__(self, callback, args, time, tag=None):
 		self.callback = callback
 		self.args = args
 		self.time = time
-	
+		self.tag = tag
+		self.cancelled = False
+		self.done = False
+
 	def execute(self):
-		return self.callback(*args)
+		return self.callback(*self.args)
 
 class EventQueue(object):
-	def __init__(self):
+	"""Events in a heap ordered by time, with cancelled events left in the
+	heap until they come to the top (or the heap is compacted, once more than
+	half of it is cancelled). Inserting and cancelling are O(log n).
+
+	Instance variables:
+		reactor -- the reactor that runs the events
+		timer -- the IDelayedCall armed for the earliest event, or None
+		tagged -- dict, tag -> the pending Event with that tag
+	"""
+
+	def __init__(self, reactor=None):
+		if reactor is None:
+			from twisted.internet import reactor
+		self.reactor = reactor
 		self.queue = []
-	
+		self.counter = itertools.count()
+		self.cancelled = 0
+		self.tagged = {}
+		self.timer = None
+
+	def __len__(self):
+		return len(self.queue) - self.cancelled
+
+	def schedule(self, delay, callback, *args, **kwargs):
+		"""Call callback(*args) in delay seconds and return the Event. The
+		tag keyword argument cancels any pending event with the same tag."""
+		event = Event(callback, args, self.reactor.seconds() + delay,
+				kwargs.get('tag'))
+		self.insert(event)
+		return event
+
 	def insert(self, event):
-		self.queue.append(event)
-		self.queue.sort(key=lambda x: getattr(x, 'time'))
-	
+		if event.tag is not None:
+			self.cancel_tag(event.tag)
+			self.tagged[event.tag] = event
+		heapq.heappush(self.queue, (event.time, next(self.counter), event))
+		if self.queue[0][2] is event:
+			self._arm()
+
+	def cancel(self, event):
+		# an event that has been popped isn't in the queue to be counted
+		if event.cancelled or event.done:
+			return
+		event.cancelled = True
+		self.cancelled += 1
+		if event.tag is not None and self.tagged.get(event.tag) is event:
+			del self.tagged[event.tag]
+		if self.cancelled > len(self.queue) // 2:
+			self.queue = [entry for entry in self.queue if not entry[2].cancelled]
+			heapq.heapify(self.queue)
+			self.cancelled = 0
+		self._arm()
+
+	def cancel_tag(self, tag):
+		"""Cancel the pending event with tag, if there is one"""
+		event = self.tagged.get(tag)
+		if event is not None:
+			self.cancel(event)
+
+	def _peek(self):
+		queue = self.queue
+		while queue and queue[0][2].cancelled:
+			heapq.heappop(queue)
+			self.cancelled -= 1
+		return queue[0][2] if queue else None
+
 	def pop(self):
-		return self.queue.pop(0)
+		"""Remove and return the earliest pending event, or None"""
+		event = self._peek()
+		if event is not None:
+			heapq.heappop(self.queue)
+			event.done = True
+			if event.tag is not None and self.tagged.get(event.tag) is event:
+				del self.tagged[event.tag]
+		return event
 
 	def next_time(self):
 		'''Returns the number of seconds in the future for the next event or a
 		large number if no events are in the queue.'''
-		if not self.queue:
+		event = self._peek()
+		if event is None:
 			return LARGE_NUM
-		return self.queue[0].time - time.time()
+		return event.time - self.reactor.seconds()
+
+	def _arm(self):
+		"""Point the timer at the earliest event"""
+		event = self._peek()
+		if event is None:
+			if self.timer is not None and self.timer.active():
+				self.timer.cancel()
+			self.timer = None
+			return
+		delay = max(0.0, event.time - self.reactor.seconds())
+		if self.timer is not None and self.timer.active():
+			self.timer.reset(delay)
+		else:
+			self.timer = self.reactor.callLater(delay, self.run)
+
+	def run(self):
+		"""Execute the events that are due, then re-arm the timer"""
+		self.timer = None
+		now = self.reactor.seconds()
+		try:
+			while True:
+				event = self._peek()
+				if event is None or event.time > now:
+					break
+				self.pop()
+				event.execute()
+		finally:
+			# an event that raises mustn't stop the ones after it
+			self._arm()
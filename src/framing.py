@@ -0,0 +1,52 @@
+'''Splitting of the raw server byte stream into ';'-terminated messages'''
+
+class FrameBuffer(object):
+    """Accumulates data from the socket and hands out complete messages.
+
+    Data is kept in a single bytearray rather than a list of characters. The
+    offset up to which we know there is no terminator is remembered, so a
+    message that arrives over several reads is only scanned once.
+
+    Instance variables:
+        buf -- bytearray, unconsumed data
+        scan -- int, offset in buf where the next search for a terminator
+                starts
+    """
+
+    def __init__(self, terminator=';'):
+        self.terminator = terminator
+        self.buf = bytearray()
+        self.scan = 0
+
+    def __len__(self):
+        return len(self.buf)
+
+    def feed(self, data):
+        """Add data read from the socket and return the list of messages
+        (as str, terminator included) it completed.
+        """
+        buf = self.buf
+        buf.extend(data)
+        view = memoryview(buf)
+        frames = []
+        start = 0
+        scan = self.scan
+        while True:
+            idx = buf.find(self.terminator, scan)
+            if idx < 0:
+                break
+            scan = idx + 1
+            frames.append(view[start:scan].tobytes())
+            start = scan
+        del view
+        if start:
+            # only the tail of a partial message is left; this is short
+            del buf[:start]
+        self.scan = len(buf)
+        return frames
+
+    def clear(self):
+        del self.buf[:]
+        self.scan = 0
+
+# vim: et sw=4 ts=4
@@ -0,0 +1,98 @@
+'''Latency histograms and counters, cheap enough to leave on during a run'''
+
+import bisect
+
+# upper bounds of the histogram buckets in seconds, four to each doubling
+# from 10 microseconds to about 1.6 seconds; anything slower goes in one
+# more bucket on the end
+BUCKETS = [10e-6 * 2 ** (k / 4.0) for k in range(70)]
+
+class Histogram(object):
+    """Counts of values in fixed buckets. Percentiles are the upper bound of
+    the bucket they fall in, so they are at most 19% too high.
+
+    Instance variables:
+        counts -- list of int, one per bucket and one for values above the
+                  last
+        count -- int, values recorded
+        total -- float, their sum
+        max -- float, the largest
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """The value that fraction of the values are at most"""
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= wanted:
+                break
+        if i == len(self.bounds):
+            return self.max
+        return min(self.bounds[i], self.max)
+
+class Timings(object):
+    """A Histogram per stage and some counters, created as they are first
+    used. Timing a stage is just
+
+        start = time.time()
+        ...
+        timings.add('parse', time.time() - start)
+
+    Instance variables:
+        stages -- dict, stage name -> Histogram
+        counters -- dict, counter name -> int
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, stage, seconds):
+        try:
+            histogram = self.stages[stage]
+        except KeyError:
+            histogram = self.stages[stage] = Histogram()
+        histogram.add(seconds)
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def report(self):
+        """A table of the stages with their percentiles in milliseconds, and
+        the counters"""
+        lines = ['%-14s %7s %8s %8s %8s %8s %8s' % ('stage', 'count', 'mean',
+            'p50', 'p95', 'p99', 'max')]
+        for stage in sorted(self.stages):
+            h = self.stages[stage]
+            lines.append('%-14s %7d %8.3f %8.3f %8.3f %8.3f %8.3f' % ((stage, h.count)
+                + tuple(1000 * v for v in (h.mean(), h.percentile(0.5),
+                    h.percentile(0.95), h.percentile(0.99), h.max))))
+        for counter in sorted(self.counters):
+            lines.append('%-14s %7d' % (counter, self.counters[counter]))
+        return '\n'.join(lines)
+
+# vim: et sw=4 ts=4
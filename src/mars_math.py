@@ -1,14 +1,22 @@
+import logging
 import math
 import random
 
 import sys
 import constants
-from message import * 
+import message
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 r = math.sin(math.pi / 4) * 5
 BASE_POINTS = ((-5.0, 0.0), (0.0, 5.0), (5.0, 0.0), (-5.0, 0.0), (r, r), (r, -r), (-r, -r), (-r, r))
 del r
 
+log = logging.getLogger('mars_math')
+
 def to_radians(deg):
     return deg / 180.0 * math.pi
 
@@ -43,6 +51,8 @@ class Ellipse(object):
         self.max = max
 
 class Point(object):
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = float(x)
         self.y = float(y)
@@ -86,7 +96,7 @@ class Vector(object):
         self.angle = angle
 
         self.vx = self.speed * math.cos(self.angle.radians)
-        self.vy = self.speed * math.cos(self.angle.radians)
+        self.vy = self.speed * math.sin(self.angle.radians)
 
     def future_position(self, t):
         vec = Point(self.vx * t, self.vy * t)
@@ -103,24 +113,33 @@ def calculate_coefficients(dt, v, tv):
     k = a / (tv**2)
     return a, k
 
-# FIXME: this is for figuring out martian triangles
 def predicted_path(vec, omega, dt):
     '''omega is the guess of the maximum angular velocity of the object over
     the time interval, vec should be a Vector, dt is the time interval that
-    we're interested in measuring over.'''
-
-    straight_point = vec.future_position(dt)
+    we're interested in measuring over.
 
-    # FIXME: this approximation only works if dt is small, but it can be
-    # exactly computed if i spend a little bit more work to figure out the
-    # right equation... This is an overestimate.
+    Returns the corners of the cone the object can reach in dt at its
+    current speed, as Points (left, straight, right): where it ends up
+    turning left as hard as it can, going straight, and turning right. See
+    predict.reachable for the same thing for many objects at once.'''
 
-    # omega should be radians / second
-    angle = Angle(abs(omega) * dt)
-    right_angle = vec.angle + angle
-    left_angle = vec.angle + angle.invert()
+    straight_point = vec.future_position(dt)
 
-    leg_distance = math.sin(angle.radians) * vec.speed * dt
+    # omega should be radians / second; more than half a circle gets it
+    # nowhere new
+    turned = min(abs(omega) * dt, math.pi)
+    if turned == 0:
+        return straight_point, straight_point, straight_point
+
+    # the arc of length speed * dt through angle turned ends up a chord
+    # away, turned / 2 off the heading
+    chord = vec.speed * dt * math.sin(turned / 2) / (turned / 2)
+    corners = []
+    for sign in (1, -1):
+        angle = vec.angle.radians + sign * turned / 2
+        corners.append(vec.pos.add(Point(chord * math.cos(angle), chord * math.sin(angle))))
+    left, right = corners
+    return left, straight_point, right
 
 def angle_points_right(angle):
     half_pi = 0.5 * math.pi
@@ -167,6 +186,17 @@ def direction(p1, p2, v=None):
 def distance(p1, p2): 
     return math.hypot(p1.x - p2.x, p1.y-p2.y)
 
+def segment_distance(p, a, b):
+    """distance from p to the line segment from a to b"""
+    dx = b.x - a.x
+    dy = b.y - a.y
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return distance(p, a)
+    t = ((p.x - a.x) * dx + (p.y - a.y) * dy) / length_sq
+    t = max(0.0, min(1.0, t))
+    return math.hypot(p.x - (a.x + t * dx), p.y - (a.y + t * dy))
+
 def to_extent(point, radius): 
     """get the square extents around a radius"""
     big_radius = radius * constants.BLOAT # (bloat the object)
@@ -258,55 +288,174 @@ def predict_turn_amt(rover, intervals=5):
     #print 'PREDICTING THAT I WILL HAVE TURNED %3.3f DEGREES' % to_degrees(rover.avg_martian_interval * omega * intervals)
     return rover.avg_interval * omega * intervals
 
-def find_heading(rover, samples=96, max_dist=40.0):
-    """Find a direction (radians) that we should head to from source, given
-    objects and samples
-
-    Arguments:
-        source_vec: the source vector
-        objects -- a list of objects on the map
-    """
-
-    source_vec = rover.vector
-    objects = rover.map.objects
-
-    # Say there are n different possible headings we can take 0 ... i .. 2 pi
-    # The best heading is the one that is not occluded and that is nearest our
-    # destination, the origin
-
-    origin_dir, origin_distance = get_origin_dir_and_distance(source_vec.pos)
-
-    # this somehow prunes some of the objects out that aren't nearby
-    object_ranges = []
+def find_object_ranges(source_vec, pos, objects, origin_distance, max_dist,
+        regions=None):
+    """The directions from pos that are blocked by objects, as a list of
+    (score, RadianRange) where the score is between 0 and 1 and smaller for
+    closer objects. Objects further than max_dist or than the origin are
+    left out. regions is None or (x, y, radius) arrays of more circles to
+    keep away from, as returned by predict.reachable."""
+    circles = []
     for obj in objects:
-        if obj['kind'] == HOME:
+        if obj.kind == message.HOME:
             # we like home
             continue
-        adj_obj_radius = (1.1 * obj['radius']) + 0.4
-        extent_points = to_extent(obj['position'], adj_obj_radius)
-        extent_distance = min(distance(source_vec.pos, p) for p in extent_points)
+        if obj.radius is None:
+            # martians move, so there's no point in steering around where
+            # they were; see regions
+            continue
+        circles.append((obj.position, obj.radius))
+    if regions is not None:
+        circles.extend((Point(x, y), radius)
+                for x, y, radius in zip(*[r.ravel() for r in regions]))
+
+    object_ranges = []
+    for position, radius in circles:
+        adj_obj_radius = (1.1 * radius) + 0.4
+        extent_points = to_extent(position, adj_obj_radius)
+        extent_distance = min(distance(pos, p) for p in extent_points)
         # get rid of far away objects
         if extent_distance > origin_distance:
             continue
         if extent_distance > max_dist:
             continue
-        extent_dirs = [direction(source_vec.pos, p, source_vec) for p in extent_points]
+        extent_dirs = [direction(pos, p, source_vec) for p in extent_points]
         score = extent_distance / max_dist
         assert score <= 1.0
         object_ranges.append((score, RadianRange.make_smallest_range(extent_dirs)))
+    return object_ranges
+
+def occlusion_scores(directions, range_lists):
+    """For each list of object ranges (as returned by find_object_ranges),
+    score every direction between 0 and 1 for how occluded it is: the score
+    of the first range containing it, or 1.0.
+
+    Returns a list of lists of scores, one per range list."""
+    result = []
+    for object_ranges in range_lists:
+        scores = []
+        for d in directions:
+            score = 1.0
+            for obj_score, obj_range in object_ranges:
+                if d in obj_range:
+                    score = min(obj_score, score)
+                    break
+            scores.append(score)
+        result.append(scores)
+    return result
+
+def object_range_arrays(source_vec, pos, objects, origin_distance, max_dist,
+        regions=None):
+    """find_object_ranges with numpy. Returns (scores, a, b) arrays, where
+    a[k] and b[k] are the ends of the k-th range as in RadianRange."""
+    statics = [obj for obj in objects
+            if obj.radius is not None and obj.kind != message.HOME]
+    x = numpy.array([obj.position.x for obj in statics], dtype=float)
+    y = numpy.array([obj.position.y for obj in statics], dtype=float)
+    radius = numpy.array([obj.radius for obj in statics], dtype=float)
+    if regions is not None:
+        x, y, radius = [numpy.concatenate((a, r.ravel()))
+                for a, r in zip((x, y, radius), regions)]
+    if not len(x):
+        empty = numpy.zeros(0)
+        return empty, empty, empty
+    # see to_extent
+    big_radius = ((1.1 * radius) + 0.4) * constants.BLOAT
+    # corners in the same order as to_extent, shape (4, n)
+    cx = numpy.array([x - big_radius, x - big_radius, x + big_radius, x + big_radius]) - pos.x
+    cy = numpy.array([y - big_radius, y + big_radius, y - big_radius, y + big_radius]) - pos.y
+    extent_distance = numpy.hypot(cx, cy).min(axis=0)
+    keep = (extent_distance <= origin_distance) & (extent_distance <= max_dist)
+    cx, cy, extent_distance = cx[:, keep], cy[:, keep], extent_distance[keep]
+
+    # see direction
+    edge = (cx == 0) | (cy == 0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        theta = numpy.arctan(cy / cx)
+    theta = numpy.where(numpy.sin(theta) * cy < 0, theta + math.pi, theta)
+    for k in numpy.nonzero(edge.any(axis=0))[0]:
+        # the rare corner straight along an axis needs the perturbing
+        # version
+        for c in range(4):
+            theta[c, k] = direction(pos, Point(pos.x + cx[c, k], pos.y + cy[c, k]), source_vec)
+
+    # see RadianRange.make_smallest_range
+    m1 = theta.min(axis=0)
+    m2 = theta.max(axis=0)
+    small = (m2 - m1) <= math.pi
+    a = numpy.where(small, m1, m2)
+    b = numpy.where(small, m2, m1)
+    return extent_distance / max_dist, a, b
+
+def range_arrays(object_ranges):
+    """Turn a list of (score, RadianRange) into (scores, a, b) arrays"""
+    return (numpy.array([score for score, r in object_ranges]),
+            numpy.array([r.a for score, r in object_ranges]),
+            numpy.array([r.b for score, r in object_ranges]))
+
+def batch_occlusion_scores(directions, range_sets):
+    """Same as occlusion_scores, but all directions are checked against all
+    ranges at once with numpy. range_sets is a list of (scores, a, b) as
+    returned by object_range_arrays. Returns a (len(range_sets),
+    len(directions)) array."""
+    directions = numpy.asarray(directions, dtype=float)
+    n_sets = len(range_sets)
+    width = max([len(scores) for scores, a, b in range_sets] + [1])
+    # padding ranges have a > b and contain nothing
+    all_a = numpy.empty((n_sets, width))
+    all_a.fill(numpy.inf)
+    all_b = numpy.empty((n_sets, width))
+    all_b.fill(-numpy.inf)
+    obj_scores = numpy.ones((n_sets, width))
+    for h, (scores, a, b) in enumerate(range_sets):
+        all_a[h, :len(a)] = a
+        all_b[h, :len(b)] = b
+        obj_scores[h, :len(scores)] = scores
+    d = directions[numpy.newaxis, :, numpy.newaxis]
+    a = all_a[:, numpy.newaxis, :]
+    b = all_b[:, numpy.newaxis, :]
+    # see RadianRange.__contains__
+    inside = numpy.where(a < b, (a <= d) & (d <= b),
+            ((a <= d) & (d <= 2 * math.pi)) | ((0 <= d) & (d <= b)))
+    first = inside.argmax(axis=2)
+    hit = inside.any(axis=2)
+    scores = obj_scores[numpy.arange(n_sets)[:, numpy.newaxis], first]
+    return numpy.where(hit, numpy.minimum(scores, 1.0), 1.0)
+
+def find_heading(rover, samples=96, max_dist=40.0, horizons=(0.0,), vectorize=True,
+        regions=None):
+    """Find a direction (radians) that we should head to from source, given
+    objects and samples
 
-    def origin_score(direction):
-        """return a score between 0 and 1 for how close the direction is toward the origin"""
-        return vector_sim(direction, origin_dir)
+    Arguments:
+        rover -- the rover, for its vector, objects and turning state
+        samples -- number of directions to try
+        max_dist -- float, objects further away than this are ignored
+        horizons -- the directions are scored from where the rover will be
+                    after each of these many seconds, and the scores averaged
+        vectorize -- score with numpy if it's available
+        regions -- None or (x, y, radius) arrays of circles to steer around
+                   as well as rover.objects, such as where the martians
+                   could get to (see predict.martian_regions)
+    """
+
+    source_vec = rover.vector
+    objects = rover.objects
+
+    # Say there are n different possible headings we can take 0 ... i .. 2 pi
+    # The best heading is the one that is not occluded and that is nearest our
+    # destination, the origin
 
-    def occlusion_score(direction):
-        """return a score between 0 and 1 for how occluded that direction is"""
-        score = 1.0
-        for obj_score, obj_range in object_ranges:
-            if direction in obj_range:
-                score = min(obj_score, score)
-                break
-        return score
+    vectorize = vectorize and numpy is not None
+    object_ranges = object_range_arrays if vectorize else find_object_ranges
+    origin_dirs = []
+    range_lists = []
+    for t in horizons:
+        pos = source_vec.future_position(t) if t else source_vec.pos
+        origin_dir, origin_distance = get_origin_dir_and_distance(pos)
+        origin_dirs.append(origin_dir)
+        range_lists.append(object_ranges(source_vec, pos, objects, origin_distance,
+            max_dist, regions))
 
     # We want the samples to be more densely packed in front of the rover than
     # behind
@@ -326,9 +475,32 @@ def find_heading(rover, samples=96, max_dist=40.0):
     directions = sorted(d + source_vec.angle.radians for d in (front_samples + side_samples + back_samples))
 
     # Force a turn if objects are mostly in front of the rover
-    force_turn = any(occlusion_score(d) < 0.5 for d in front_samples if abs(to_degrees(d - predict_turn_amt(rover) )) <= (constants.SMALL_ANGLE * constants.BLOAT))
+    turn_amt = predict_turn_amt(rover)
+    ahead = [d for d in front_samples if abs(to_degrees(d - turn_amt)) <= (constants.SMALL_ANGLE * constants.BLOAT)]
+
+    # the samples ahead are only checked from where the rover is now, and
+    # scored along with everything else
+    candidates = directions + ahead
+    n = len(directions)
+    if vectorize:
+        occlusion = batch_occlusion_scores(candidates, range_lists)
+        force_turn = bool((occlusion[0, n:] < 0.5).any())
+        two_pi = 2.0 * math.pi
+        d = numpy.array(directions)
+        score = numpy.zeros(n)
+        for h, origin_dir in enumerate(origin_dirs):
+            # see vector_sim
+            score += occlusion[h, :n] + (1.0 - ((d - origin_dir) % two_pi) / math.pi)
+        angle = directions[int((score / len(horizons)).argmax())]
+    else:
+        occlusion = occlusion_scores(candidates, range_lists)
+        force_turn = any(o < 0.5 for o in occlusion[0][n:])
+        def score(i):
+            d = directions[i]
+            return sum(occ[i] + vector_sim(d, origin_dir)
+                    for occ, origin_dir in zip(occlusion, origin_dirs)) / len(horizons)
+        angle = directions[max(range(n), key=score)]
 
-    angle_score, angle = max(((occlusion_score(d) + origin_score(d), d) for d in directions), key=lambda x: x[0])
     angle = TurnAngle(angle - source_vec.angle.radians)
     return angle, force_turn
 
@@ -363,7 +535,7 @@ def steer_to_point(rover_vec, omega, dest):
     #print '(nx, ny), angle = %s, %s' % ((nx, ny), turning_angle)
 
     if (x_prime * nx < 0) or (y_prime * ny < 0):
-        print 'atan got fucked up: x, y = %s, nx, ny = %s' % ((x_prime, y_prime), (nx, ny))
+        log.warning('atan got fucked up: x, y = %s, nx, ny = %s', (x_prime, y_prime), (nx, ny))
         turning_angle = normalize_turn_angle(turning_angle + math.pi)
 
     # Adjust the turn angle to take into account the rover vector
@@ -1,79 +1,4 @@
-import math
-
-MESS_TELEMETRY = 1
-
-def safe_split(s, sep, n):
-	split = s.split(sep, n - 1)
-	while len(split) < n:
-		split.append('')
-	return split
-
-def parse_message(data):
-	type = data[0]
-	mess_dict = {}
-	if type == 'I':
-		mess_dict['type'] = 'initial'
-		_, dx, dy, time_limit, min_sens, max_sens, max_speed, max_turn, max_hard_turn = data.strip().split(' ')
-		mess_dict['dx'] = dx
-		mess_dict['dy'] = dy
-		mess_dict['time_limit'] = int(time_limit)
-		mess_dict['min_sens'] = float(min_sens)
-		mess_dict['max_sens'] = float(max_sens)
-		mess_dict['max_speed'] = float(max_speed)
-		mess_dict['max_turn'] = float(max_turn)
-		mess_dict['max_hard_turn'] = float(max_hard_turn)
-	if type == 'T':
-		mess_dict['type'] = 'telemetry'
-		_, time_stamp, vehicle_ctl, vx, vy, dir, speed, object_str = safe_split(data, ' ', 8)
-		print 'object_str = %r' % object_str
-		mess_dict['time_stamp'] = int(time_stamp)
-		mess_dict['accel_state'] = vehicle_ctl[0]
-		mess_dict['turn_state'] = vehicle_ctl[1]
-		mess_dict['x_pos'] = float(vx)
-		mess_dict['y_pos'] = float(vy)
-		mess_dict['direction'] = {'degrees': float(dir), 'radians': float(dir) * math.pi / 180.0}
-		mess_dict['speed'] = float(speed)
-		mess_dict['objects'] = []
-
-		# parse the objects string
-		if object_str:
-			objects = object_str.split(' ')
-			while objects:
-				obj = {}
-				if objects[0] == 'b':
-					_, x_pos, y_pos, radius = objects[:4]
-					obj['type'] = 'boulder'
-					obj['x_pos'] = float(x_pos)
-					obj['y_pos'] = float(y_pos)
-					obj['radius'] = float(radius)
-					objects = objects[4:]
-				elif objects[0] == 'c':
-					_, x_pos, y_pos, radius = objects[:4]
-					obj['type'] = 'crater'
-					obj['x_pos'] = float(x_pos)
-					obj['y_pos'] = float(y_pos)
-					obj['radius'] = float(radius)
-					objects = objects[4:]
-				elif objects[0] == 'h':
-					_, x_pos, y_pos, radius = objects[:4]
-					obj['type'] = 'home'
-					obj['x_pos'] = float(x_pos)
-					obj['y_pos'] = float(y_pos)
-					obj['radius'] = float(radius)
-					objects = objects[4:]
-				elif objects[0] == 'm':
-					_, x_pos, y_pos, dir, speed = objects[:5]
-					obj['type'] = 'martian'
-					obj['x_pos'] = float(x_pos)
-					obj['y_pos'] = float(y_pos)
-					obj['dir'] = {'degrees': float(dir), 'radians': float(dir) * math.pi / 180.0}
-					obj['speed'] = float(speed)
-					obj['radius'] = 0.4
-					objects = objects[5:]
-
-				mess_dict['objects'].append(obj)
-
-	return mess_dict
+import mars_math
 
 # Acceleration states
 ROLL = '-'
@@ -92,6 +17,114 @@ BOULDER = 'b'
 HOME = 'h'
 MARTIAN = 'm'
 
+ACCEL_STATES = (ACCELERATE, BRAKE, ROLL)
+TURN_STATES = (LEFT, STRAIGHT, RIGHT, HARDLEFT, HARDRIGHT)
+STATIC_OBJECTS = (CRATER, BOULDER, HOME)
+
+# messages that carry nothing but a time stamp
+SIMPLE_MESSAGES = {
+	'B': 'crash',
+	'C': 'crater',
+	'K': 'killed',
+	'S': 'success',
+	}
+
+INITIAL_FIELDS = ('dx', 'dy', 'time_limit', 'min_sensor', 'max_sensor',
+		'max_speed', 'max_turn', 'max_hard_turn')
+
+# each command moves the controls one place along these
+ACCEL_ORDER = (BRAKE, ROLL, ACCELERATE)
+TURN_ORDER = (HARDRIGHT, RIGHT, STRAIGHT, LEFT, HARDLEFT)
+
+def _steps(order, up, down):
+	"""(state, command) -> the state after the command"""
+	last = len(order) - 1
+	steps = {}
+	for i, state in enumerate(order):
+		steps[state, up] = order[min(last, i + 1)]
+		steps[state, down] = order[max(0, i - 1)]
+	return steps
+
+ACCEL_STEPS = _steps(ACCEL_ORDER, ACCELERATE, BRAKE)
+TURN_STEPS = _steps(TURN_ORDER, LEFT, RIGHT)
+
+# (accel, turn) -> the command to send, for accel one of ACCELERATE, BRAKE,
+# ROLL or None (leave the acceleration alone) and turn one of LEFT, RIGHT or
+# None. (ROLL, None) and (None, None) are missing; there's nothing to send.
+COMMANDS = {}
+for _accel in (ACCELERATE, BRAKE, ROLL, None):
+	for _turn in (LEFT, RIGHT, None):
+		_command = (_accel if _accel in (ACCELERATE, BRAKE) else '') + (_turn or '')
+		if _command:
+			COMMANDS[_accel, _turn] = _command + ';'
+del _accel, _turn, _command
+
+
+class Record(object):
+	"""Base for the parsed records below. They use __slots__ since one is
+	allocated per object per telemetry update."""
+	__slots__ = ()
+
+	def __repr__(self):
+		return '%s(%s)' % (self.__class__.__name__,
+				', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__))
+
+class Telemetry(Record):
+	"""The rover state sent with a telemetry message
+
+	Instance variables:
+		acceleration -- one of the acceleration states
+		turning -- one of the turn states
+		position -- mars_math.Point
+		direction -- float, degrees
+		velocity -- float, meters per second
+		objects -- list of StaticObject and MartianSighting
+	"""
+	__slots__ = ('acceleration', 'turning', 'position', 'direction',
+			'velocity', 'objects')
+
+	def __init__(self, acceleration, turning, position, direction, velocity,
+			objects):
+		self.acceleration = acceleration
+		self.turning = turning
+		self.position = position
+		self.direction = direction
+		self.velocity = velocity
+		self.objects = objects
+
+class StaticObject(Record):
+	"""A boulder, crater or home base
+
+	Instance variables:
+		kind -- CRATER, BOULDER or HOME
+		position -- mars_math.Point
+		radius -- float, meters
+	"""
+	__slots__ = ('kind', 'position', 'radius')
+
+	def __init__(self, kind, position, radius):
+		self.kind = kind
+		self.position = position
+		self.radius = radius
+
+class MartianSighting(Record):
+	"""A martian seen in one telemetry update
+
+	Instance variables:
+		position -- mars_math.Point
+		direction -- float, degrees
+		speed -- float, meters per second
+	"""
+	__slots__ = ('position', 'direction', 'speed')
+
+	kind = MARTIAN
+	radius = None
+
+	def __init__(self, position, direction, speed):
+		self.position = position
+		self.direction = direction
+		self.speed = speed
+
 
 class Message(object): 
 	@classmethod
@@ -99,19 +132,10 @@ class Message(object):
 		"""Create a message to send to the rover via the server.
 		Args:
 			accel -- None or str, or a accel state
-			turn -- None or str, one of turn states
+			turn -- None or str, LEFT or RIGHT
 		"""
-		msg = ""
-		if accel in (ACCELERATE, BRAKE):
-			msg += accel
-		else:
-			assert accel in (ROLL, None)
-
-		if turn:
-			assert turn in [LEFT, RIGHT]
-			msg += turn
-		assert msg
-		msg += ";"
+		msg = COMMANDS.get((accel, turn))
+		assert msg, (accel, turn)
 		return msg
 
 	@classmethod
@@ -125,95 +149,84 @@ class Message(object):
 			'telemetry': telemetry 
 			...
 			}
+
+		The tokens are walked once with an index; the helpers below take the
+		token list and the index to start at and return the parsed value along
+		with the index of the next unparsed token.
 		"""
 		tokens = msg.split() 
 		assert tokens[-1] == ';'
-		tokens.pop()
-		assert tokens
+		end = len(tokens) - 1
+		assert end
 		result = {
 				'type': '',
-				'telemetry': {}, 
+				'telemetry': None, 
 				'time_stamp': -1,
 				'end': False,
 				'score': -1,
 				'duration': -1,
 				}
-		token = tokens.pop(0) 
+		token = tokens[0]
 		if token == 'T':
 			result['type'] = 'telemetry'
-			result['time_stamp'] = cls.parse_float(tokens)
-			result['telemetry'] = cls.parse_telemetry(tokens)
-		elif token == 'B': 
-			result['type'] = 'crash'
-			result['time_stamp'] = cls.parse_float(tokens)
-		elif token == 'C':
-			result['type'] = 'crater'
-			result['time_stamp'] = cls.parse_float(tokens)
-		elif token == 'K':
-			result['type'] = 'killed'
-			result['time_stamp'] = cls.parse_float(tokens)
+			result['time_stamp'] = float(tokens[1])
+			result['telemetry'] = cls.parse_telemetry(tokens, 2, end)
+		elif token in SIMPLE_MESSAGES:
+			result['type'] = SIMPLE_MESSAGES[token]
+			result['time_stamp'] = float(tokens[1])
 		elif token == 'E':
 			result['type'] = 'end'
-			result['duration'] = cls.parse_float(tokens)
-		elif token == 'S':
-			result['type'] = 'success'
-			result['time_stamp'] = cls.parse_float(tokens)
+			result['duration'] = float(tokens[1])
 		elif token == 'I':
 			result['type'] = 'initial'
-			result['initial'] = cls.parse_initial(tokens)
+			result['initial'] = cls.parse_initial(tokens, 1)
 		else:
 			raise ValueError('unknown message type: ' + token)
 		return result
 
 	@classmethod
-	def parse_initial(cls, tokens): 
-		import mars_math
-		x = {} 
-		for i in ['dx', 'dy', 'time_limit', 'min_sensor', 'max_sensor',
-				'max_speed', 'max_turn', 'max_hard_turn']:
-			x[i] = cls.parse_float(tokens)  
+	def parse_initial(cls, tokens, i): 
+		x = dict(zip(INITIAL_FIELDS, map(float, tokens[i:i + len(INITIAL_FIELDS)])))
 		x['max_turn'] = mars_math.to_radians(x['max_turn'])
 		x['max_hard_turn'] = mars_math.to_radians(x['max_hard_turn'])
 		return x
 
 	@classmethod
-	def parse_controls(cls, tokens): 
-		accel, turn = tokens.pop(0)
-		assert accel in [ACCELERATE, BRAKE, ROLL]
-		assert turn in [LEFT, STRAIGHT, RIGHT, HARDLEFT, HARDRIGHT]
+	def parse_controls(cls, token): 
+		accel, turn = token
+		assert accel in ACCEL_STATES
+		assert turn in TURN_STATES
 		return accel, turn
 
 	@classmethod
-	def parse_telemetry(cls, tokens): 
-		tel = {} 
-		tel['acceleration'], tel['turning'] = cls.parse_controls(tokens)
-		tel['position'] = cls.parse_float(tokens), cls.parse_float(tokens) 
-		tel['direction'] = cls.parse_float(tokens) 
-		tel['velocity'] = cls.parse_float(tokens) 
-		tel['objects'] = cls.parse_objects(tokens) 
-		return tel
+	def parse_telemetry(cls, tokens, i, end): 
+		accel, turn = cls.parse_controls(tokens[i])
+		return Telemetry(accel, turn,
+				mars_math.Point(float(tokens[i + 1]), float(tokens[i + 2])),
+				float(tokens[i + 3]),
+				float(tokens[i + 4]),
+				cls.parse_objects(tokens, i + 5, end))
 
 	@classmethod
-	def parse_objects(cls, tokens): 
+	def parse_objects(cls, tokens, i, end): 
+		Point = mars_math.Point
 		objects = []
-		while tokens:
-			object = {}
-			objects.append(object) 
-			kind = tokens.pop(0)
-			object['kind'] = kind
-			assert kind in [MARTIAN, CRATER, BOULDER, HOME]
-			object['position'] = cls.parse_float(tokens), cls.parse_float(tokens) 
-			if object['kind'] == MARTIAN:
-				object['direction'] = cls.parse_float(tokens)
-				object['speed'] = cls.parse_float(tokens)
-				object['radius'] = None
+		append = objects.append
+		while i < end:
+			kind = tokens[i]
+			if kind == MARTIAN:
+				append(MartianSighting(
+					Point(float(tokens[i + 1]), float(tokens[i + 2])),
+					float(tokens[i + 3]),
+					float(tokens[i + 4])))
+				i += 5
 			else:
-				object['radius'] = cls.parse_float(tokens) 
+				assert kind in STATIC_OBJECTS
+				append(StaticObject(kind,
+					Point(float(tokens[i + 1]), float(tokens[i + 2])),
+					float(tokens[i + 3])))
+				i += 4
+		assert i == end, 'truncated object list'
 		return objects
 
-	@classmethod
-	def parse_float(cls, tokens): 
-		atom = tokens.pop(0) 
-		return float(atom) 
-
 # vim: noet st=4 sw=4
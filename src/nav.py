@@ -1,34 +1,838 @@
+import logging
 import math
 import time
 import heapq
 
 import mars_math
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class PathNotFound(Exception):
     pass
 
-def A_star(start, goal, successors, edge_cost, heuristic_cost_to_goal=lambda position, goal:0):
+class OutOfTime(PathNotFound):
+    """An anytime search ran out of time before finding any path"""
+    pass
+
+INFINITY = float('inf')
+
+def A_star(start, goal, successors, edge_cost, heuristic_cost_to_goal=lambda position, goal:0, stats=None):
   """Very general a-star search. Start and goal are objects to be compared
   with the 'is' operator, successors is a function that, given a node, returns
   other nodes reachable therefrom, edge_cost is a function that returns the
   cost to travel between two nodes, and heuristic_cost_to_goal is an
   admissible heuristic function that gives an underestimate of the cost from a
-  position to the goal."""
+  position to the goal.
+
+  Nodes must be hashable. The open list is ordered by f = g + h, ties going to
+  the node with the larger g (the one closer to the goal). If stats is a dict
+  the number of nodes expanded and pushed and the peak size of the open list
+  are stored in it."""
+  best_cost = {start: 0}
+  parent = {start: None}
   closed = set()
-  open = [(0, 0, (start,))]
-  while open:
-    heuristic_cost, cost_so_far, path = heapq.heappop(open)
-    tail = path[-1]
-    if tail in closed:
-      continue
-    if tail == goal:
-      return path
-    closed.add(tail)
-    for new_tail in successors(tail):
-      new_cost_so_far = cost_so_far + edge_cost(tail, new_tail)
-      new_heuristic_cost = new_cost_so_far + heuristic_cost_to_goal(new_tail, goal)
-      heapq.heappush(open, (new_cost_so_far, new_heuristic_cost, path+(new_tail,)))
-  raise PathNotFound('No path found.')
+  open = [(heuristic_cost_to_goal(start, goal), 0, start)]
+  expanded = 0
+  pushed = 1
+  peak = 1
+  try:
+    while open:
+      estimate, neg_cost_so_far, tail = heapq.heappop(open)
+      if tail in closed:
+        continue
+      if tail == goal:
+        path = []
+        while tail is not None:
+          path.append(tail)
+          tail = parent[tail]
+        path.reverse()
+        return tuple(path)
+      closed.add(tail)
+      expanded += 1
+      cost_so_far = -neg_cost_so_far
+      for new_tail in successors(tail):
+        if new_tail in closed:
+          continue
+        new_cost_so_far = cost_so_far + edge_cost(tail, new_tail)
+        if new_cost_so_far >= best_cost.get(new_tail, INFINITY):
+          continue
+        best_cost[new_tail] = new_cost_so_far
+        parent[new_tail] = tail
+        new_estimate = new_cost_so_far + heuristic_cost_to_goal(new_tail, goal)
+        heapq.heappush(open, (new_estimate, -new_cost_so_far, new_tail))
+        pushed += 1
+        if len(open) > peak:
+          peak = len(open)
+    raise PathNotFound('No path found.')
+  finally:
+    if stats is not None:
+      stats['expanded'] = expanded
+      stats['pushed'] = pushed
+      stats['peak_open'] = peak
+
+def _sign(x):
+    return (x > 0) - (x < 0)
+
+def _jump(i, j, di, dj, goal, walkable):
+    """Move from (i, j) in direction (di, dj) until reaching a jump point:
+    the goal, a cell with a forced neighbour or, for diagonal moves, a cell
+    from which a straight move reaches one. Returns None if an obstacle or
+    the edge of the grid comes first."""
+    while True:
+        i += di
+        j += dj
+        if not walkable(i, j):
+            return None
+        if (i, j) == goal:
+            return i, j
+        # the blocked cell is checked first since on open ground that's
+        # enough to rule out a forced neighbour
+        if di and dj:
+            if (not walkable(i - di, j) and walkable(i - di, j + dj)) or \
+                    (not walkable(i, j - dj) and walkable(i + di, j - dj)):
+                return i, j
+            if _jump(i, j, di, 0, goal, walkable) is not None or \
+                    _jump(i, j, 0, dj, goal, walkable) is not None:
+                return i, j
+        elif di:
+            if (not walkable(i, j + 1) and walkable(i + di, j + 1)) or \
+                    (not walkable(i, j - 1) and walkable(i + di, j - 1)):
+                return i, j
+        else:
+            if (not walkable(i + 1, j) and walkable(i + 1, j + dj)) or \
+                    (not walkable(i - 1, j) and walkable(i - 1, j + dj)):
+                return i, j
+
+_ALL_DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1), (-1, -1), (-1, 0), (0, -1), (-1, 1)]
+
+def _pruned_directions(node, parent, walkable):
+    """The directions worth searching from node when it was reached from
+    parent: the natural neighbours plus any forced by obstacles."""
+    if parent is None:
+        return _ALL_DIRECTIONS
+    i, j = node
+    di = _sign(i - parent[0])
+    dj = _sign(j - parent[1])
+    if di and dj:
+        result = [(0, dj), (di, 0), (di, dj)]
+        if not walkable(i - di, j):
+            result.append((-di, dj))
+        if not walkable(i, j - dj):
+            result.append((di, -dj))
+    elif di:
+        result = [(di, 0)]
+        if not walkable(i, j + 1):
+            result.append((di, 1))
+        if not walkable(i, j - 1):
+            result.append((di, -1))
+    else:
+        result = [(0, dj)]
+        if not walkable(i + 1, j):
+            result.append((1, dj))
+        if not walkable(i - 1, j):
+            result.append((-1, dj))
+    return result
+
+def jump_point_search(start, goal, walkable, stats=None):
+    """A* on a uniform cost 8-connected grid that only expands jump points
+    (Harabor and Grastien 2011), skipping the many equivalent paths across
+    open ground. Diagonal moves may cut corners, as in MapGrid.adjacent.
+
+    start and goal are (i, j) cells and walkable(i, j) tells whether a cell
+    is on the grid and free. Returns the path as a tuple of every cell on
+    it, like A_star. stats is filled in as for A_star, counting jump points.
+    """
+    def distance(a, b):
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+
+    best_cost = {start: 0}
+    parent = {start: None}
+    closed = set()
+    open = [(distance(start, goal), 0, start)]
+    expanded = 0
+    pushed = 1
+    peak = 1
+    try:
+        while open:
+            estimate, neg_cost_so_far, node = heapq.heappop(open)
+            if node in closed:
+                continue
+            if node == goal:
+                return _fill_path(node, parent)
+            closed.add(node)
+            expanded += 1
+            cost_so_far = -neg_cost_so_far
+            i, j = node
+            for di, dj in _pruned_directions(node, parent[node], walkable):
+                jump_point = _jump(i, j, di, dj, goal, walkable)
+                if jump_point is None or jump_point in closed:
+                    continue
+                new_cost_so_far = cost_so_far + distance(node, jump_point)
+                if new_cost_so_far >= best_cost.get(jump_point, INFINITY):
+                    continue
+                best_cost[jump_point] = new_cost_so_far
+                parent[jump_point] = node
+                heapq.heappush(open, (new_cost_so_far + distance(jump_point, goal),
+                    -new_cost_so_far, jump_point))
+                pushed += 1
+                if len(open) > peak:
+                    peak = len(open)
+        raise PathNotFound('No path found.')
+    finally:
+        if stats is not None:
+            stats['expanded'] = expanded
+            stats['pushed'] = pushed
+            stats['peak_open'] = peak
+
+def _fill_path(node, parent):
+    """Follow the parents back from node, putting back the cells between
+    jump points"""
+    path = [node]
+    while parent[node] is not None:
+        prev = parent[node]
+        di = _sign(prev[0] - node[0])
+        dj = _sign(prev[1] - node[1])
+        i, j = node
+        while (i, j) != prev:
+            i += di
+            j += dj
+            path.append((i, j))
+        node = prev
+    path.reverse()
+    return tuple(path)
+
+def line_of_sight(a, b, walkable):
+    """Whether the straight line between the centers of cells a and b only
+    crosses walkable cells. walkable is a function of (i, j) as returned by
+    MapGrid.walkable_function. A line through the corner where four cells
+    meet needs both cells beside the corner to be free."""
+    i, j = a
+    i1, j1 = b
+    ni = abs(i1 - i)
+    nj = abs(j1 - j)
+    si = 1 if i1 > i else -1
+    sj = 1 if j1 > j else -1
+    # step to the next cell the line enters, comparing where it leaves the
+    # current one in integers
+    ti = tj = 0
+    while ti < ni or tj < nj:
+        crossing = (1 + 2 * ti) * nj - (1 + 2 * tj) * ni
+        if crossing == 0:
+            if not walkable(i + si, j) or not walkable(i, j + sj):
+                return False
+            i += si
+            j += sj
+            ti += 1
+            tj += 1
+        elif crossing < 0:
+            i += si
+            ti += 1
+        else:
+            j += sj
+            tj += 1
+        if not walkable(i, j):
+            return False
+    return True
+
+def string_pull(path, walkable):
+    """Shorten a path of cells to the waypoints where it has to turn: from
+    each waypoint, the next one is the furthest cell along the path that can
+    be seen from it (see line_of_sight). Going straight between the centers
+    of the waypoints never crosses an obstacle.
+
+    The furthest visible cell is found by trying cells 2, 4, 8... steps
+    ahead and then bisecting, so each line is tested O(log n) times rather
+    than once per cell, and the total work is O(n log n) in the length of
+    the path."""
+    path = list(path)
+    last = len(path) - 1
+    if last < 2:
+        return path
+    result = [path[0]]
+    anchor = 0
+    while anchor < last:
+        origin = path[anchor]
+        # the next cell along the path is always reachable
+        good = anchor + 1
+        bad = None
+        step = 2
+        while good < last:
+            k = min(anchor + step, last)
+            if line_of_sight(origin, path[k], walkable):
+                good = k
+                step *= 2
+            else:
+                bad = k
+                break
+        if bad is not None:
+            while bad - good > 1:
+                middle = (good + bad) // 2
+                if line_of_sight(origin, path[middle], walkable):
+                    good = middle
+                else:
+                    bad = middle
+        result.append(path[good])
+        anchor = good
+    return result
+
+class DStarLite(object):
+    """Incremental search (D* Lite, Koenig and Likhachev 2002). The search
+    runs backwards from the goal and is kept between calls, so when the
+    start moves or some edges get more expensive only the part of the
+    search that depends on them is redone.
+
+    Nodes are compared as dictionary keys. neighbours is a function that
+    returns the nodes adjacent to a node (the graph must be undirected),
+    edge_cost(a, b) the cost of moving from a to b, which may be INFINITY
+    for a blocked edge, and heuristic_cost(a, b) an admissible, consistent
+    estimate of the cost between two nodes.
+
+    Instance variables:
+        start, goal -- nodes
+        g -- dict, node -> cost to the goal as of its last expansion
+        rhs -- dict, node -> one step lookahead cost to the goal
+        expanded -- int, nodes expanded by the last call to compute
+    """
+
+    def __init__(self, start, goal, neighbours, edge_cost, heuristic_cost):
+        self.start = start
+        self.goal = goal
+        self.neighbours = neighbours
+        self.edge_cost = edge_cost
+        self.heuristic_cost = heuristic_cost
+        self.g = {}
+        self.rhs = {goal: 0.0}
+        self.km = 0.0
+        self.last_start = start
+        # heap with lazy deletion: an entry is current only if its key is
+        # the one in self.queued
+        self.queue = []
+        self.queued = {}
+        self.expanded = 0
+        self._push(goal, (heuristic_cost(start, goal), 0.0))
+
+    def _push(self, node, key):
+        self.queued[node] = key
+        heapq.heappush(self.queue, (key, node))
+
+    def _top(self):
+        queue = self.queue
+        queued = self.queued
+        while queue:
+            key, node = queue[0]
+            if queued.get(node) == key:
+                return key, node
+            heapq.heappop(queue)
+        return (INFINITY, INFINITY), None
+
+    def key(self, node):
+        m = min(self.g.get(node, INFINITY), self.rhs.get(node, INFINITY))
+        return (m + self.heuristic_cost(self.start, node) + self.km, m)
+
+    def _update(self, node):
+        g = self.g
+        if node != self.goal:
+            edge_cost = self.edge_cost
+            best = INFINITY
+            for n in self.neighbours(node):
+                cost = edge_cost(node, n) + g.get(n, INFINITY)
+                if cost < best:
+                    best = cost
+            self.rhs[node] = best
+        if g.get(node, INFINITY) != self.rhs.get(node, INFINITY):
+            self._push(node, self.key(node))
+        else:
+            self.queued.pop(node, None)
+
+    def compute(self):
+        """Repair the search until the cost from the start is known"""
+        g = self.g
+        rhs = self.rhs
+        start = self.start
+        self.expanded = 0
+        while True:
+            top_key, node = self._top()
+            if node is None:
+                break
+            if not (top_key < self.key(start)
+                    or rhs.get(start, INFINITY) != g.get(start, INFINITY)):
+                break
+            new_key = self.key(node)
+            if top_key < new_key:
+                self._push(node, new_key)
+                continue
+            del self.queued[node]
+            self.expanded += 1
+            if g.get(node, INFINITY) > rhs.get(node, INFINITY):
+                g[node] = rhs[node]
+                for n in self.neighbours(node):
+                    self._update(n)
+            else:
+                g[node] = INFINITY
+                self._update(node)
+                for n in self.neighbours(node):
+                    self._update(n)
+
+    def move_start(self, start):
+        """The rover has moved to start"""
+        if start == self.start:
+            return
+        self.km += self.heuristic_cost(self.last_start, start)
+        self.last_start = start
+        self.start = start
+
+    def edges_changed(self, nodes):
+        """The cost of the edges leaving nodes has changed"""
+        for node in nodes:
+            self._update(node)
+
+    def path(self):
+        """Return the current best path as a tuple of nodes, after repairing
+        the search"""
+        self.compute()
+        g = self.g
+        if g.get(self.start, INFINITY) == INFINITY:
+            raise PathNotFound('No path found.')
+        edge_cost = self.edge_cost
+        node = self.start
+        path = [node]
+        while node != self.goal:
+            node = min(self.neighbours(node),
+                    key=lambda n: edge_cost(node, n) + g.get(n, INFINITY))
+            path.append(node)
+        return tuple(path)
+
+# heuristic weight AnytimeAStar starts with, and how much it is lowered by
+# each time a path is found
+EPSILON = 2.5
+EPSILON_STEP = 0.5
+
+class AnytimeAStar(object):
+    """Anytime search (ARA*, Likhachev, Gordon and Thrun 2003). A first path
+    is found quickly by weighting the heuristic by epsilon, then epsilon is
+    lowered towards 1 and the path improved, reusing the search done so
+    far. improve stops at a deadline and carries on where it left off the
+    next time it is called.
+
+    The arguments are as for A_star; heuristic_cost must be consistent for
+    the bound to hold.
+
+    Instance variables:
+        start, goal -- nodes
+        path -- tuple of nodes, the best path found so far, or None
+        bound -- the cost of path is at most bound times the shortest
+        epsilon -- float, current heuristic weight
+        expanded -- int, nodes expanded by the last call to improve
+    """
+
+    def __init__(self, start, goal, successors, edge_cost, heuristic_cost,
+            epsilon=EPSILON, epsilon_step=EPSILON_STEP):
+        self.start = start
+        self.goal = goal
+        self.successors = successors
+        self.edge_cost = edge_cost
+        self.heuristic_cost = heuristic_cost
+        self.epsilon = float(epsilon)
+        self.epsilon_step = epsilon_step
+        self.g = {start: 0.0}
+        self.parent = {start: None}
+        # heap with lazy deletion like DStarLite's
+        self.open = []
+        self.queued = {}
+        self.closed = set()
+        # nodes whose cost went down after they were expanded in this round
+        self.incons = set()
+        self.path = None
+        self.bound = INFINITY
+        self.expanded = 0
+        self._push(start)
+
+    def _push(self, node):
+        g = self.g[node]
+        key = (g + self.epsilon * self.heuristic_cost(node, self.goal), -g)
+        self.queued[node] = key
+        heapq.heappush(self.open, (key, node))
+
+    def done(self):
+        """True once path is known to be the shortest"""
+        return self.bound <= 1.0
+
+    def _search(self, deadline):
+        """Expand nodes until no node could give a path shorter than
+        epsilon times the best. Returns False if the deadline passed first."""
+        open = self.open
+        queued = self.queued
+        closed = self.closed
+        incons = self.incons
+        g = self.g
+        parent = self.parent
+        goal = self.goal
+        successors = self.successors
+        edge_cost = self.edge_cost
+        expanded = 0
+        try:
+            while open:
+                key, node = open[0]
+                if queued.get(node) != key:
+                    heapq.heappop(open)
+                    continue
+                if key[0] >= g.get(goal, INFINITY):
+                    break
+                # look at the clock every so often, but always make some
+                # progress
+                if expanded and not expanded % 32 and deadline is not None \
+                        and time.time() > deadline:
+                    return False
+                heapq.heappop(open)
+                del queued[node]
+                closed.add(node)
+                expanded += 1
+                cost = g[node]
+                for n in successors(node):
+                    new_cost = cost + edge_cost(node, n)
+                    if new_cost < g.get(n, INFINITY):
+                        g[n] = new_cost
+                        parent[n] = node
+                        if n in closed:
+                            incons.add(n)
+                        else:
+                            self._push(n)
+            return True
+        finally:
+            self.expanded += expanded
+
+    def improve(self, deadline=None):
+        """Improve the path until time.time() passes deadline (or it is the
+        shortest), and return it. Returns None if no path was found in
+        time; raises PathNotFound if there isn't one."""
+        self.expanded = 0
+        g = self.g
+        goal = self.goal
+        heuristic_cost = self.heuristic_cost
+        while not self.done():
+            if not self._search(deadline):
+                break
+            goal_cost = g.get(goal, INFINITY)
+            if goal_cost == INFINITY:
+                raise PathNotFound('No path found.')
+            path = []
+            node = goal
+            while node is not None:
+                path.append(node)
+                node = self.parent[node]
+            path.reverse()
+            self.path = tuple(path)
+            if self.epsilon <= 1.0:
+                self.bound = 1.0
+                break
+            # no path can be shorter than the lowest unweighted f of the
+            # nodes left to expand
+            nodes = set(self.queued)
+            nodes.update(self.incons)
+            lowest = min([g[n] + heuristic_cost(n, goal) for n in nodes] or [INFINITY])
+            if lowest > 0:
+                self.bound = max(1.0, min(self.epsilon, goal_cost / lowest))
+            else:
+                self.bound = self.epsilon
+            self.epsilon = max(1.0, self.epsilon - self.epsilon_step)
+            # next round: everything left to expand, with the new weight
+            self.incons = set()
+            self.closed = set()
+            self.open = []
+            self.queued = {}
+            for n in nodes:
+                self._push(n)
+        return self.path
+
+# side of a ClusterGraph cluster, in cells
+CLUSTER_SIZE = 16
+
+# entrances at least this wide get a transition at each end instead of one
+# in the middle
+WIDE_ENTRANCE = 6
+
+class ClusterGraph(object):
+    """The abstract graph for hierarchical path finding (HPA*, Botea et al.
+    2004) over a MapGrid.
+
+    The grid is cut into square clusters. Wherever a run of free cells lines
+    both sides of the border between two clusters there is an entrance, and
+    each entrance gets one or two transitions: pairs of cells facing each
+    other across the border. The cells of the transitions are the nodes of
+    the graph; nodes in the same cluster are joined by the cost of the
+    shortest path between them inside the cluster.
+
+    Everything is worked out the first time it's needed and cached. New
+    obstacles only throw away what was cached for their own cluster, and for
+    the border and neighbouring cluster if they are on a border.
+
+    Instance variables:
+        grid -- the MapGrid
+        cluster_size -- int, side of a cluster in cells
+    """
+
+    def __init__(self, grid, cluster_size=CLUSTER_SIZE):
+        self.grid = grid
+        self.cluster_size = cluster_size
+        # border -> list of (cell, cell) transitions; a border is (ci, cj, di,
+        # dj), between cluster (ci, cj) and (ci + di, cj + dj)
+        self.transitions = {}
+        # cluster -> {node: {node: cost}} for the nodes in the cluster
+        self.edges = {}
+
+    def cluster(self, node):
+        i, j = node
+        return i // self.cluster_size, j // self.cluster_size
+
+    def cluster_cells(self, cluster):
+        """(start_i, end_i, start_j, end_j) bounds of a cluster, inclusive"""
+        cs = self.cluster_size
+        ci, cj = cluster
+        return (ci * cs, min(self.grid.grid_width, (ci + 1) * cs) - 1,
+                cj * cs, min(self.grid.grid_height, (cj + 1) * cs) - 1)
+
+    def borders(self, cluster):
+        """The borders of a cluster that lie inside the grid"""
+        ci, cj = cluster
+        n_i = (self.grid.grid_width - 1) // self.cluster_size
+        n_j = (self.grid.grid_height - 1) // self.cluster_size
+        result = []
+        if ci > 0:
+            result.append((ci - 1, cj, 1, 0))
+        if ci < n_i:
+            result.append((ci, cj, 1, 0))
+        if cj > 0:
+            result.append((ci, cj - 1, 0, 1))
+        if cj < n_j:
+            result.append((ci, cj, 0, 1))
+        return result
+
+    def border_transitions(self, border):
+        try:
+            return self.transitions[border]
+        except KeyError:
+            pass
+        ci, cj, di, dj = border
+        start_i, end_i, start_j, end_j = self.cluster_cells((ci, cj))
+        walkable = self.grid.walkable_function()
+        if di:
+            # cells (end_i, j) face (end_i + 1, j)
+            pairs = [((end_i, j), (end_i + 1, j)) for j in range(start_j, end_j + 1)]
+        else:
+            pairs = [((i, end_j), (i, end_j + 1)) for i in range(start_i, end_i + 1)]
+        result = []
+        run = []
+        for a, b in pairs + [(None, None)]:
+            if a is not None and walkable(*a) and walkable(*b):
+                run.append((a, b))
+                continue
+            if len(run) >= WIDE_ENTRANCE:
+                result.append(run[0])
+                result.append(run[-1])
+            elif run:
+                result.append(run[len(run) // 2])
+            run = []
+        self.transitions[border] = result
+        return result
+
+    def cluster_edges(self, cluster):
+        """{node: {node: cost}} for the nodes of a cluster, with the edges
+        inside the cluster and across its borders"""
+        try:
+            return self.edges[cluster]
+        except KeyError:
+            pass
+        edges = {}
+        for border in self.borders(cluster):
+            for a, b in self.border_transitions(border):
+                if self.cluster(a) != cluster:
+                    a, b = b, a
+                edges.setdefault(a, {})[b] = self.grid.cost(a, b)
+        nodes = list(edges)
+        for k, node in enumerate(nodes):
+            # costs are symmetric, so each pair only needs searching once
+            others = nodes[k + 1:]
+            distances = self.cluster_distances(node, cluster, others)
+            for other in others:
+                if other in distances:
+                    edges[node][other] = edges[other][node] = distances[other]
+        self.edges[cluster] = edges
+        return edges
+
+    def cluster_successors(self, cluster):
+        """function giving the free neighbours of a cell inside cluster"""
+        start_i, end_i, start_j, end_j = self.cluster_cells(cluster)
+        adjacent = self.grid.adjacent
+        def successors(node):
+            for n in adjacent(node):
+                if start_i <= n[0] <= end_i and start_j <= n[1] <= end_j:
+                    yield n
+        return successors
+
+    def cluster_distances(self, source, cluster, targets=None):
+        """Cost of the shortest path inside cluster from source to every cell
+        of the cluster it can reach (Dijkstra), or only until all of targets
+        have been reached"""
+        successors = self.cluster_successors(cluster)
+        cost = self.grid.cost
+        distances = {}
+        remaining = None if targets is None else set(targets)
+        open = [(0.0, source)]
+        while open:
+            d, node = heapq.heappop(open)
+            if node in distances:
+                continue
+            distances[node] = d
+            if remaining is not None:
+                remaining.discard(node)
+                if not remaining:
+                    break
+            for n in successors(node):
+                if n not in distances:
+                    heapq.heappush(open, (d + cost(node, n), n))
+        return distances
+
+    def cells_blocked(self, cells):
+        """Forget what depends on cells that have become obstacles"""
+        cs = self.cluster_size
+        for i, j in cells:
+            ci, cj = i // cs, j // cs
+            self.edges.pop((ci, cj), None)
+            # cells on the edge of a cluster also change the entrances
+            # across that border, and so the cluster on the other side
+            for border, on_border, other in (
+                    ((ci - 1, cj, 1, 0), i % cs == 0, (ci - 1, cj)),
+                    ((ci, cj, 1, 0), i % cs == cs - 1, (ci + 1, cj)),
+                    ((ci, cj - 1, 0, 1), j % cs == 0, (ci, cj - 1)),
+                    ((ci, cj, 0, 1), j % cs == cs - 1, (ci, cj + 1))):
+                if on_border:
+                    self.transitions.pop(border, None)
+                    self.edges.pop(other, None)
+
+    def precompute(self):
+        """Work out the whole graph now rather than as it's needed"""
+        cs = self.cluster_size
+        for ci in range((self.grid.grid_width + cs - 1) // cs):
+            for cj in range((self.grid.grid_height + cs - 1) // cs):
+                self.cluster_edges((ci, cj))
+
+    def path(self, start, goal, stats=None):
+        """Find a path of cells from start to goal, as a tuple of cells like
+        A_star. stats gets the A_star counters of the search over the graph,
+        plus 'refined', the number of cells expanded refining it."""
+        if not self.grid.walkable_function()(*goal):
+            raise PathNotFound('Goal is an obstacle.')
+        start_cluster = self.cluster(start)
+        goal_cluster = self.cluster(goal)
+
+        # connect start and goal to the nodes of their clusters
+        from_start = self.cluster_distances(start, start_cluster)
+        to_goal = self.cluster_distances(goal, goal_cluster)
+        start_edges = dict(self.cluster_edges(start_cluster).get(start, {}))
+        for n in self.cluster_edges(start_cluster):
+            if n in from_start and n != start:
+                start_edges[n] = from_start[n]
+        if goal in from_start and start_cluster == goal_cluster:
+            start_edges[goal] = from_start[goal]
+
+        def edges_of(node):
+            if node == start:
+                return start_edges
+            edges = self.cluster_edges(self.cluster(node)).get(node, {})
+            if node in to_goal and self.cluster(node) == goal_cluster:
+                edges = dict(edges)
+                edges[goal] = to_goal[node]
+            return edges
+
+        abstract = A_star(start, goal, lambda node: edges_of(node).keys(),
+                lambda a, b: edges_of(a)[b], self.grid.distance, stats)
+
+        # refine: search cell by cell inside each cluster the path crosses
+        path = [start]
+        refine_stats = {}
+        refined = 0
+        for a, b in zip(abstract[:-1], abstract[1:]):
+            cluster = self.cluster(a)
+            if cluster != self.cluster(b):
+                path.append(b)
+                continue
+            leg = A_star(a, b, self.cluster_successors(cluster), self.grid.cost,
+                    self.grid.distance, refine_stats)
+            refined += refine_stats['expanded']
+            path.extend(leg[1:])
+        if stats is not None:
+            stats['refined'] = refined
+        return tuple(path)
+
+# footprint radii are rounded up to this many cells, so that obstacles of
+# about the same size share one
+FOOTPRINT_STEP = 0.25
+
+# the center of an obstacle is placed in one of this many parts of its cell
+# along each side, and its footprint covers the cells within reach of
+# anywhere in that part
+FOOTPRINT_PARTS = 4
+
+class Footprint(object):
+    """The cells an obstacle covers, as offsets from the cell of its center:
+    every cell with some point no further than the radius from some point
+    of the part (part_i, part_j) of the center's cell, so wherever in that
+    part the center is. The radius is given in cells along i and along j
+    since the cells needn't be square.
+
+    Instance variables:
+        offsets -- list of (di, dj)
+        reach_i, reach_j -- int, the largest abs(di) and abs(dj) there
+                            might be
+        mask -- numpy array of bools, True at [reach_i + di, reach_j + dj]
+                for each offset, or None without numpy
+    """
+    __slots__ = ('offsets', 'reach_i', 'reach_j', 'mask')
+
+    def __init__(self, radius_i, radius_j, part_i=0, part_j=0, parts=FOOTPRINT_PARTS):
+        self.reach_i = reach_i = int(radius_i) + 1
+        self.reach_j = reach_j = int(radius_j) + 1
+        # where the center can be, in cells from the corner of its cell
+        low_i, high_i = float(part_i) / parts, float(part_i + 1) / parts
+        low_j, high_j = float(part_j) / parts, float(part_j + 1) / parts
+        # (gap_i / radius_i) ** 2 + (gap_j / radius_j) ** 2 <= 1, multiplied
+        # out so that a radius of 0 leaves just the cells the center can be
+        # in
+        ri_sq = radius_i * radius_i
+        rj_sq = radius_j * radius_j
+        bound = ri_sq * rj_sq
+        self.offsets = []
+        for di in range(-reach_i, reach_i + 1):
+            # cell di spans [di, di + 1]
+            gap_i = max(0.0, di - high_i, low_i - (di + 1))
+            for dj in range(-reach_j, reach_j + 1):
+                gap_j = max(0.0, dj - high_j, low_j - (dj + 1))
+                if gap_i * gap_i * rj_sq + gap_j * gap_j * ri_sq <= bound:
+                    self.offsets.append((di, dj))
+        self.mask = None
+        if numpy is not None:
+            self.mask = numpy.zeros((2 * reach_i + 1, 2 * reach_j + 1), dtype=bool)
+            for di, dj in self.offsets:
+                self.mask[reach_i + di, reach_j + dj] = True
+
+_footprints = {}
+
+def footprint(radius_i, radius_j, part_i=0, part_j=0):
+    """The Footprint for radii in cells and a part of the center's cell,
+    made the first time it's needed and kept for every grid after that"""
+    # rounded up, so the footprint is never too small; the small amount off
+    # keeps floating point error from rounding up a whole step
+    key = (int(math.ceil(radius_i / FOOTPRINT_STEP - 1e-9)),
+            int(math.ceil(radius_j / FOOTPRINT_STEP - 1e-9)), part_i, part_j)
+    try:
+        return _footprints[key]
+    except KeyError:
+        made = _footprints[key] = Footprint(key[0] * FOOTPRINT_STEP,
+                key[1] * FOOTPRINT_STEP, part_i, part_j)
+        return made
 
 class MapGrid(object):
     """a map grid centered on the origin with width w and height h and resolution
@@ -49,14 +853,32 @@ class MapGrid(object):
     0...........          
     
     """
-    def __init__(self, width, height, resolution): 
+    log = logging.getLogger('MapGrid')
+
+    def __init__(self, width, height, resolution, inflation=0.0): 
+        """Obstacles are stamped inflation meters bigger than they are, so
+        that a path that keeps out of the blocked cells keeps the rover
+        (which is then treated as a point) that far from them. Every cell
+        that comes that close is blocked, so the blocked cells reach up to
+        a cell further than that."""
         self.width = float(width)
         self.height = float(height)
+        self.inflation = inflation
         resolution = int(resolution)
         self.grid_width = resolution
         self.grid_height = resolution
         self.resolution = resolution
-        self.obstacles = set()  
+        self._new_obstacles()
+        # incremental search kept by incremental_path, and the cells blocked
+        # since it last ran
+        self.planner = None
+        self.blocked_since_plan = set()
+        # cluster graph kept by hierarchical_path
+        self.hierarchy = None
+        # search kept by path when given a budget
+        self.anytime = None
+        # search counters from the last call to path, see A_star
+        self.stats = {}
 
     def node(self, x, y): 
         adj_x = x + (self.width / 2.0)
@@ -92,33 +914,191 @@ class MapGrid(object):
         y -= self.height / 2.0
         return mars_math.Point(x, y)
 
+    def footprint(self, point, radius):
+        """The Footprint of an obstacle radius meters across centered at
+        point, inflated"""
+        x, y = point
+        # where point is in its cell, as in node
+        at_i = self.grid_width * (x + self.width / 2.0) / self.width
+        at_j = self.grid_height * (y + self.height / 2.0) / self.height
+        part_i = min(int((at_i - int(at_i)) * FOOTPRINT_PARTS), FOOTPRINT_PARTS - 1)
+        part_j = min(int((at_j - int(at_j)) * FOOTPRINT_PARTS), FOOTPRINT_PARTS - 1)
+        radius += self.inflation
+        return footprint((self.grid_width / self.width) * radius,
+                (self.grid_height / self.height) * radius, part_i, part_j)
+
     def add_obstacle(self, point, radius):
-        """Add an obstacle to the grid
+        """Add an obstacle to the grid, blocking every cell that comes
+        within radius (plus the inflation) of its center
+        Args:
+            point -- (x, y) of its center
+            radius -- float, meters
+        """
+        center_i, center_j = self._decode(self.node(*point))
+        stamp = self.footprint(point, radius)
+        w = self.grid_width
+        h = self.grid_height
+
+        self.log.debug('adding obstacle at %s, radius %s', point, radius)
+        if stamp.reach_i <= center_i < w - stamp.reach_i \
+                and stamp.reach_j <= center_j < h - stamp.reach_j:
+            cells = [(center_i + di, center_j + dj) for di, dj in stamp.offsets]
+        else:
+            # clipped by the edge of the map
+            cells = [(center_i + di, center_j + dj) for di, dj in stamp.offsets
+                    if 0 <= center_i + di < w and 0 <= center_j + dj < h]
+        if self.planner is not None or self.hierarchy is not None \
+                or self.anytime is not None:
+            self._cells_blocked([c for c in cells if c not in self.obstacles])
+        self.obstacles.update(cells)
+
+    def _new_obstacles(self):
+        """Start with no obstacles"""
+        self.obstacles = set()
+
+    def is_blocked(self, node):
+        return node in self.obstacles
+
+    def clear_cell(self, node):
+        """Make node free, as tests and benchmarks do to keep the start and
+        goal clear of random obstacles. The searches kept by the grid are
+        dropped, as they only expect cells to be blocked."""
+        self.obstacles.discard(node)
+        self._forget_searches()
+
+    def _forget_searches(self):
+        self.planner = None
+        self.blocked_since_plan = set()
+        self.hierarchy = None
+        self.anytime = None
+
+    def _cells_blocked(self, cells):
+        """Tell the searches kept by the grid that cells became obstacles"""
+        if self.planner is not None:
+            self.blocked_since_plan.update(cells)
+        if self.hierarchy is not None:
+            self.hierarchy.cells_blocked(cells)
+        if cells:
+            # the anytime search can't take back what it expanded
+            self.anytime = None
+
+    def add_obstacles(self, obstacles):
+        """Add several obstacles at once
         Args:
+            obstacles -- iterable of (point, radius) pairs as taken by
+                         add_obstacle
         """
-        # find the units this will take up on the grid
-        gwidth = int(round((self.resolution / self.width) * radius, 0))
-        gheight = int(round((self.resolution / self.height) * radius, 0))
-
-        node = self.node(*point)
-        center_i, center_j = self._decode(node)
-        start_i = max(0, center_i - gwidth)
-        end_i = min(self.grid_width, center_i + gwidth)
-        start_j = max(0, center_j - gheight)
-        end_j = min(self.grid_height, center_j + gheight)
-
-        print "adding obstacle from:", self.coord(self._encode(start_i, start_j)), "to", self.coord(self._encode(end_i, end_j))
-        for i in range(start_i, end_i + 1):
-            for j in range(start_j, end_j + 1):
-                self.obstacles.add(self._encode(i, j))
-
-    def path(self, start, goal):
-        """Find a path from start to goal"""
+        for point, radius in obstacles:
+            self.add_obstacle(point, radius)
+
+    def path(self, start, goal, jump_points=False, budget=None):
+        """Find a path from start to goal. If jump_points is True use jump
+        point search, which gives a path just as short but is usually much
+        faster on open ground.
+
+        If budget is given (in seconds) an anytime search is used instead,
+        and the best path it found in that time is returned. The path may
+        be up to self.stats['bound'] times longer than the shortest. The
+        search is kept, and later calls carry on improving the path until it
+        is the shortest, unless the goal changes or obstacles are added. A
+        new search is also started from a new start once the old one is
+        done. Raises OutOfTime if no path was found in time; the search
+        carries on at the next call."""
         start_ = self.node(start.x, start.y) 
         goal_ = self.node(goal.x, goal.y)
-        result = A_star(start_, goal_, self.adjacent, self.cost, self.distance) 
+        self.stats = {}
+        if budget is not None:
+            deadline = time.time() + budget
+            search = self.anytime
+            if search is None or search.goal != goal_ \
+                    or (search.start != start_ and search.done()):
+                search = self.anytime = AnytimeAStar(start_, goal_,
+                        self.adjacent, self.cost, self.distance)
+            result = search.improve(deadline)
+            self.stats = {'expanded': search.expanded, 'bound': search.bound,
+                    'epsilon': search.epsilon}
+            if result is None:
+                raise OutOfTime('No path found yet.')
+        elif jump_points:
+            result = jump_point_search(start_, goal_, self.walkable_function(), self.stats)
+        else:
+            result = A_star(start_, goal_, self.adjacent, self.cost, self.distance, self.stats) 
         return map(self.coord, result)
 
+    def string_pull(self, path):
+        """Reduce a path of points returned by one of the path methods to
+        the few waypoints that can be joined by straight lines clear of
+        obstacles, see the string_pull function. The waypoints are the
+        centers of their cells (see center) rather than the corners path
+        returns, since that is what line_of_sight checks the lines
+        between."""
+        cells = [self.cell(p) for p in path]
+        return map(self.center, string_pull(cells, self.walkable_function()))
+
+    def center(self, node):
+        """The middle of a cell, where coord is its corner"""
+        corner = self.coord(node)
+        return mars_math.Point(corner.x + 0.5 * self.width / self.grid_width,
+                corner.y + 0.5 * self.height / self.grid_height)
+
+    def cell(self, point):
+        """Like node, but rounding to the nearest cell corner. coord(node)
+        is a cell's corner, and rounding makes cell(coord(node)) == node
+        despite floating point error."""
+        i = int(round(self.grid_width * (point.x + self.width / 2.0) / self.width))
+        j = int(round(self.grid_height * (point.y + self.height / 2.0) / self.height))
+        return self._encode(i, j)
+
+    def walkable_function(self):
+        """Return a function of (i, j) telling whether that cell is on the
+        grid and not an obstacle"""
+        w = self.grid_width
+        h = self.grid_height
+        obstacles = self.obstacles
+        def walkable(i, j):
+            return 0 <= i < w and 0 <= j < h and (i, j) not in obstacles
+        return walkable
+
+    def incremental_path(self, start, goal):
+        """Find a path from start to goal like path, but keep the search
+        around so that the next call only repairs what changed because of
+        the rover moving and obstacles being added in between."""
+        start_ = self.node(start.x, start.y) 
+        goal_ = self.node(goal.x, goal.y)
+        planner = self.planner
+        if planner is None or planner.goal != goal_:
+            planner = self.planner = DStarLite(start_, goal_, self._adjacent,
+                    self.blocked_cost, self.distance)
+        else:
+            planner.move_start(start_)
+            # entering a newly blocked cell is now impossible
+            changed = set()
+            for node in self.blocked_since_plan:
+                changed.update(self._adjacent(node))
+            planner.edges_changed(changed)
+        self.blocked_since_plan = set()
+        return map(self.coord, planner.path())
+
+    def hierarchical_path(self, start, goal, cluster_size=CLUSTER_SIZE):
+        """Find a path from start to goal by first searching a graph of
+        the entrances between clusters of cells, then searching cell by cell
+        only inside the clusters that path goes through. The path is close
+        to the shortest one but not always the shortest. The cluster graph
+        is kept and only updated around new obstacles."""
+        if self.hierarchy is None or self.hierarchy.cluster_size != cluster_size:
+            self.hierarchy = ClusterGraph(self, cluster_size)
+        start_ = self.node(start.x, start.y) 
+        goal_ = self.node(goal.x, goal.y)
+        self.stats = {}
+        return map(self.coord, self.hierarchy.path(start_, goal_, self.stats))
+
+    def blocked_cost(self, node1, node2):
+        """cost of moving from node1 to node2, which is infinite when node2
+        is an obstacle"""
+        if node2 in self.obstacles:
+            return INFINITY
+        return self.distance(node1, node2)
+
     def adjacent(self, node): 
         for i in self._adjacent(node):
             if i not in self.obstacles:
@@ -146,6 +1126,96 @@ class MapGrid(object):
         if i > 0 and j + 1 < h: # UP LEFT
             yield self._encode(i - 1, j + 1)
 
+class ArrayMapGrid(MapGrid):
+    """A MapGrid that keeps the blocked cells in a boolean numpy array
+    instead of a set of nodes. Obstacles are stamped with one array
+    operation each, and it takes far less memory than the set at high
+    resolutions.
+
+    Nodes, coordinates and paths are the same as for MapGrid.
+
+    Instance variables:
+        blocked -- numpy array of bools, indexed by [i, j]
+    """
+    def __init__(self, width, height, resolution, inflation=0.0):
+        if numpy is None:
+            raise ImportError('ArrayMapGrid needs numpy')
+        super(ArrayMapGrid, self).__init__(width, height, resolution, inflation)
+
+    def _new_obstacles(self):
+        self.blocked = numpy.zeros((self.grid_width, self.grid_height), dtype=bool)
+        # self.blocked as nested lists, rebuilt after obstacles are added;
+        # indexing lists is much faster than indexing arrays one element at
+        # a time
+        self._rows = None
+
+    @property
+    def obstacles(self):
+        """The blocked nodes as a set, like MapGrid.obstacles, but made
+        afresh on every read: changing it doesn't change the grid. Use
+        is_blocked and clear_cell for that."""
+        return set(zip(*[a.tolist() for a in numpy.nonzero(self.blocked)]))
+
+    def is_blocked(self, node):
+        i, j = node
+        return self.rows()[i][j]
+
+    def clear_cell(self, node):
+        self.blocked[node] = False
+        self._rows = None
+        self._forget_searches()
+
+    def add_obstacle(self, point, radius):
+        """Add an obstacle to the grid
+        Args:
+            point -- (x, y) of its center
+            radius -- float, meters
+        """
+        stamp = self.footprint(point, radius)
+        reach_i, reach_j = stamp.reach_i, stamp.reach_j
+
+        center_i, center_j = self._decode(self.node(*point))
+        start_i = max(0, center_i - reach_i)
+        end_i = min(self.grid_width - 1, center_i + reach_i)
+        start_j = max(0, center_j - reach_j)
+        end_j = min(self.grid_height - 1, center_j + reach_j)
+
+        mask = stamp.mask[start_i - center_i + reach_i:end_i - center_i + reach_i + 1,
+                start_j - center_j + reach_j:end_j - center_j + reach_j + 1]
+        window = self.blocked[start_i:end_i + 1, start_j:end_j + 1]
+        if self.planner is not None or self.hierarchy is not None \
+                or self.anytime is not None:
+            new_i, new_j = numpy.nonzero(mask & ~window)
+            self._cells_blocked(
+                    zip((new_i + start_i).tolist(), (new_j + start_j).tolist()))
+        window |= mask
+        self._rows = None
+
+    def rows(self):
+        if self._rows is None:
+            self._rows = self.blocked.tolist()
+        return self._rows
+
+    def walkable_function(self):
+        w = self.grid_width
+        h = self.grid_height
+        rows = self.rows()
+        def walkable(i, j):
+            return 0 <= i < w and 0 <= j < h and not rows[i][j]
+        return walkable
+
+    def adjacent(self, node):
+        rows = self.rows()
+        for i, j in self._adjacent(node):
+            if not rows[i][j]:
+                yield i, j
+
+    def blocked_cost(self, node1, node2):
+        i, j = node2
+        if self.rows()[i][j]:
+            return INFINITY
+        return self.distance(node1, node2)
+
 if __name__ == '__main__':
     m = MapGrid(10, 10, 100)
     ts = time.time()
@@ -0,0 +1,93 @@
+'''Where the martians could get to in the next second or so.
+
+A martian seen at some position, heading and speed can turn either way at
+up to omega radians per second, and speed up or slow down a little, so
+after t seconds it is somewhere in a cone ahead of where it was seen.
+reachable bounds the cone at a few times with discs, for all the martians
+at once, and steering treats the discs as obstacles.
+
+This needs numpy; without it martian_regions returns None.'''
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# seconds ahead at which the martians are bounded
+HORIZONS = (0.0, 0.5, 1.0, 1.5)
+
+# meters
+MARTIAN_RADIUS = 0.4
+
+# meters per second squared, how quickly a martian might change its speed
+MARTIAN_ACCEL = 3.0
+
+# fractions of the full turn at which the edge of the cone is sampled
+TURN_FRACTIONS = (0.0, 1.0 / 3, 2.0 / 3, 1.0)
+
+def sighting_arrays(martians):
+    """(x, y, heading, speed) arrays for a list of MartianSighting, with the
+    heading in radians"""
+    x = numpy.array([m.position.x for m in martians], dtype=float)
+    y = numpy.array([m.position.y for m in martians], dtype=float)
+    heading = numpy.radians([m.direction for m in martians])
+    speed = numpy.array([m.speed for m in martians], dtype=float)
+    return x, y, heading, speed
+
+def reachable(martians, omega, horizons=HORIZONS, accel=MARTIAN_ACCEL):
+    """Discs around where each martian could be after each of horizons
+    seconds, if it turns no faster than omega radians per second.
+
+    Returns (x, y, radius) arrays of shape (len(martians), len(horizons)).
+    """
+    x, y, heading, speed = [a[:, numpy.newaxis, numpy.newaxis]
+            for a in sighting_arrays(martians)]
+    t = numpy.asarray(horizons, dtype=float)[numpy.newaxis, :, numpy.newaxis]
+    fractions = numpy.asarray(TURN_FRACTIONS)[numpy.newaxis, numpy.newaxis, :]
+
+    # turning through more than half a circle gets nowhere new
+    turned = numpy.minimum(abs(omega) * t, math.pi) * fractions
+    travelled = speed * t
+    # following an arc of length travelled through angle turned ends up
+    # chord away, turned / 2 off the heading
+    chord = travelled * numpy.sinc(turned / (2 * math.pi))
+    along = chord * numpy.cos(turned / 2)
+    across = chord * numpy.sin(turned / 2)
+
+    # the centre is halfway between going straight and the sharpest turn,
+    # and turning the other way is the mirror image
+    middle = (along[..., 0] + along[..., -1]) / 2
+    radius = numpy.hypot(along - middle[..., numpy.newaxis], across).max(axis=2)
+    radius += 0.5 * accel * t[..., 0] ** 2 + MARTIAN_RADIUS
+
+    heading = heading[..., 0]
+    return (x[..., 0] + middle * numpy.cos(heading),
+            y[..., 0] + middle * numpy.sin(heading),
+            radius)
+
+def martian_regions(rover, horizons=HORIZONS):
+    """reachable for the martians the rover can see, assuming they turn as
+    hard as the rover can, or None if there are none (or no numpy)"""
+    if not rover.martians or numpy is None:
+        return None
+    return reachable(rover.martians, rover.max_hard_turn, horizons)
+
+def segment_blocked(a, b, regions, margin=0.0):
+    """Whether the segment from Point a to Point b comes within margin of
+    any of the discs in regions, as returned by reachable"""
+    if regions is None:
+        return False
+    x, y, radius = [numpy.ravel(r) for r in regions]
+    dx = b.x - a.x
+    dy = b.y - a.y
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        t = 0.0
+    else:
+        t = numpy.clip(((x - a.x) * dx + (y - a.y) * dy) / length_sq, 0.0, 1.0)
+    return bool((numpy.hypot(x - (a.x + t * dx), y - (a.y + t * dy))
+        < radius + margin).any())
+
+# vim: et sw=4 ts=4
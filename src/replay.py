@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+'''Replay a capture made with client.py (see capture.py) through the client,
+without a server, and report how long parsing and steering took per frame.
+
+    python src/replay.py [--realtime] capture_file
+
+By default the capture is fed in as fast as the client takes it. This
+doesn't run the reactor, so compensating turns scheduled on the reactor
+never happen. With --realtime the data is fed in by the reactor at the
+times it was recorded.'''
+
+import optparse
+import sys
+import time
+
+from twisted.internet import reactor
+
+import capture
+import client
+import instrument
+from message import Message
+import strategies
+
+class ReplayTransport(object):
+    """Stands in for the socket, keeping what the client writes"""
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def setTcpNoDelay(self, enabled):
+        pass
+
+class FrameTiming(object):
+    """How long one frame took, in seconds
+
+    Instance variables:
+        type -- str, the message type, see Message.parse
+        parse -- Message.parse
+        strategy -- the steering strategy, 0 if it didn't run
+        total -- parsing and handling the message
+    """
+    __slots__ = ('type', 'parse', 'strategy', 'total')
+
+    def __init__(self, type, parse, strategy, total):
+        self.type = type
+        self.parse = parse
+        self.strategy = strategy
+        self.total = total
+
+class ReplayClient(client.TwistedClient):
+    """A TwistedClient that times every frame it handles
+
+    Instance variables:
+        timings -- list of FrameTiming
+    """
+
+    def __init__(self):
+        client.TwistedClient.__init__(self)
+        self.timings = []
+        self.strategy_time = 0.0
+
+    def frameReceived(self, msg_s):
+        start = time.time()
+        msg = Message.parse(msg_s)
+        parsed = time.time()
+        self.strategy_time = 0.0
+        self.messageReceived(msg)
+        self.timings.append(FrameTiming(msg['type'], parsed - start,
+            self.strategy_time, time.time() - start))
+
+def replay(stream, realtime=False):
+    """Feed the data received in a capture to a new ReplayClient and return
+    the client; what it sent is in client.transport.written"""
+    replay_client = ReplayClient()
+    replay_client.makeConnection(ReplayTransport())
+    records = [(when, data) for kind, when, data in capture.read_capture(stream)
+            if kind == capture.RECEIVED]
+
+    strategy = strategies.current_strategy
+    def timed_strategy(rover):
+        start = time.time()
+        try:
+            return strategy(rover)
+        finally:
+            replay_client.strategy_time += time.time() - start
+
+    strategies.current_strategy = timed_strategy
+    try:
+        if realtime:
+            for when, data in records:
+                reactor.callLater(when, replay_client.dataReceived, data)
+            last = records[-1][0] if records else 0.0
+            reactor.callLater(last + 0.5, reactor.stop)
+            reactor.run()
+        else:
+            for when, data in records:
+                replay_client.dataReceived(data)
+    finally:
+        strategies.current_strategy = strategy
+    return replay_client
+
+def summarize(timings):
+    """An instrument.Timings of a list of FrameTiming, with parse and frame
+    for every frame and strategy for the telemetry ones"""
+    summary = instrument.Timings()
+    for t in timings:
+        summary.count('frames')
+        summary.add('parse', t.parse)
+        summary.add('frame', t.total)
+        if t.type == 'telemetry':
+            summary.count('telemetry')
+            summary.add('strategy', t.strategy)
+    return summary
+
+def report(timings, out=sys.stdout):
+    """Write a summary of a list of FrameTiming to out, in the same table
+    as the client's latency report (see instrument.Timings.report)"""
+    out.write(summarize(timings).report() + '\n')
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [--realtime] capture_file')
+    parser.add_option('--realtime', action='store_true', default=False,
+            help='feed the data in at the times it was recorded')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('expected a capture file')
+
+    stream = open(args[0], 'rb')
+    recorded = sum(1 for kind, when, data in capture.read_capture(stream)
+            if kind == capture.SENT)
+    stream.seek(0)
+    replay_client = replay(stream, options.realtime)
+    report(replay_client.timings)
+    print '%d messages sent (%d in the capture)' % (
+            len(replay_client.transport.written), recorded)
+
+# vim: et sw=4 ts=4
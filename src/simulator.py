@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+'''A stand-in for the contest server, for running the client without it.
+
+    python src/simulator.py [--port 17676] [--warp 1.0] [map_file]
+
+It speaks the same protocol as the real server: each run starts with an I
+message, then there is a T message every TELEMETRY_INTERVAL seconds of
+simulated time along with B, C, K and S when they happen, and the run
+finishes with an E message. The connection is closed after the last run.
+
+Map files are the contest's JSON world files:
+
+    {"size": 200.0, "timeLimit": 30000,
+     "vehicleParams": {"maxSpeed": 20.0, "accel": 2.0, "brake": 3.0,
+                       "turn": 20.0, "hardTurn": 60.0, "rotAccel": 120.0,
+                       "frontView": 60.0, "rearView": 30.0},
+     "martianParams": {... the same fields ...},
+     "runs": [{"vehicle": {"x": -80.0, "y": -80.0, "dir": 45.0},
+               "martians": [{"x": 50.0, "y": 50.0, "dir": 180.0}]}],
+     "craters": [{"x": 0.0, "y": 30.0, "r": 5.0}],
+     "boulders": [{"x": 30.0, "y": 0.0, "r": 2.0}]}
+
+Anything left out is taken from DEFAULT_MAP. The physics are a guess at
+the real server's: speed changes at accel (or brake) less a drag that makes
+maxSpeed the top speed, and the turn rate moves towards the rate of the
+current turn state at rotAccel. Objects are seen up to frontView meters
+away all round the rover, rather than in the real server's ellipse.
+
+The warp factor scales simulated time against wall clock time; with --warp
+10 a run takes a tenth as long as it would on the real server.'''
+
+import copy
+import json
+import logging
+import math
+import optparse
+
+from twisted.internet import reactor
+from twisted.internet.protocol import Factory, Protocol
+
+from framing import FrameBuffer
+from message import ACCELERATE, BRAKE, ROLL, LEFT, RIGHT, HARDLEFT, HARDRIGHT, STRAIGHT, \
+        ACCEL_ORDER, ACCEL_STEPS, TURN_ORDER, TURN_STEPS
+
+# simulated seconds between telemetry messages
+TELEMETRY_INTERVAL = 0.1
+# simulated seconds per physics step
+STEP = 0.02
+
+ROVER_RADIUS = 0.5
+MARTIAN_RADIUS = 0.4
+HOME_RADIUS = 5.0
+
+DEFAULT_MAP = {
+    'size': 200.0,
+    'timeLimit': 30000,
+    'vehicleParams': {'maxSpeed': 20.0, 'accel': 2.0, 'brake': 3.0,
+        'turn': 20.0, 'hardTurn': 60.0, 'rotAccel': 120.0,
+        'frontView': 60.0, 'rearView': 30.0},
+    'martianParams': {'maxSpeed': 12.0, 'accel': 2.0, 'brake': 3.0,
+        'turn': 20.0, 'hardTurn': 60.0, 'rotAccel': 120.0,
+        'frontView': 50.0, 'rearView': 30.0},
+    'runs': [{'vehicle': {'x': -80.0, 'y': -80.0, 'dir': 45.0}, 'martians': []}],
+    'craters': [],
+    'boulders': [],
+    }
+
+def load_map(stream):
+    """Read a map file, filling in what it leaves out from DEFAULT_MAP"""
+    world = copy.deepcopy(DEFAULT_MAP)
+    loaded = json.load(stream)
+    for key in ('vehicleParams', 'martianParams'):
+        world[key].update(loaded.pop(key, {}))
+    world.update(loaded)
+    return world
+
+class Body(object):
+    """Something that drives around: the rover or a martian
+
+    Instance variables:
+        x, y -- float, meters
+        direction -- float, degrees
+        speed -- float, meters per second
+        rotation -- float, degrees per second, anticlockwise
+        accel -- one of ACCEL_ORDER
+        turn -- one of TURN_ORDER
+        params -- dict, the vehicleParams or martianParams of the map
+    """
+    __slots__ = ('x', 'y', 'direction', 'speed', 'rotation', 'accel', 'turn', 'params')
+
+    def __init__(self, x, y, direction, params):
+        self.x = float(x)
+        self.y = float(y)
+        self.direction = float(direction)
+        self.speed = 0.0
+        self.rotation = 0.0
+        self.accel = ROLL
+        self.turn = STRAIGHT
+        self.params = params
+
+    def command(self, accel=None, turn=None):
+        """Move the control states one step towards accel (ACCELERATE or
+        BRAKE) and turn (LEFT or RIGHT)"""
+        if accel is not None:
+            self.accel = ACCEL_STEPS[self.accel, accel]
+        if turn is not None:
+            self.turn = TURN_STEPS[self.turn, turn]
+
+    def step(self, dt):
+        params = self.params
+        max_speed = params['maxSpeed']
+        drag = params['accel'] / (max_speed * max_speed)
+        change = -drag * self.speed * self.speed
+        if self.accel == ACCELERATE:
+            change += params['accel']
+        elif self.accel == BRAKE:
+            change -= params['brake']
+        self.speed = max(0.0, min(max_speed, self.speed + change * dt))
+
+        target = {HARDLEFT: params['hardTurn'], LEFT: params['turn'],
+                STRAIGHT: 0.0, RIGHT: -params['turn'],
+                HARDRIGHT: -params['hardTurn']}[self.turn]
+        most = params['rotAccel'] * dt
+        self.rotation += max(-most, min(most, target - self.rotation))
+        self.direction = (self.direction + self.rotation * dt + 180.0) % 360.0 - 180.0
+
+        radians = math.radians(self.direction)
+        self.x += self.speed * dt * math.cos(radians)
+        self.y += self.speed * dt * math.sin(radians)
+
+    def distance(self, x, y):
+        return math.hypot(self.x - x, self.y - y)
+
+class Simulation(object):
+    """One run on a map. This knows nothing of the network, so it can be
+    stepped directly.
+
+    Instance variables:
+        time -- float, simulated seconds since the run started
+        rover -- Body
+        martians -- list of Body
+        outcome -- None while the run goes on, then 'S', 'C', 'K' or None
+                   with over set for running out of time
+        over -- bool
+    """
+
+    def __init__(self, world, run=0):
+        self.world = world
+        self.size = float(world['size'])
+        self.time_limit = world['timeLimit'] / 1000.0
+        start = world['runs'][run]
+        vehicle = start['vehicle']
+        self.rover = Body(vehicle['x'], vehicle['y'], vehicle['dir'], world['vehicleParams'])
+        self.martians = [Body(m['x'], m['y'], m['dir'], world['martianParams'])
+                for m in start.get('martians', [])]
+        self.craters = [(c['x'], c['y'], c['r']) for c in world['craters']]
+        self.boulders = [(b['x'], b['y'], b['r']) for b in world['boulders']]
+        self.time = 0.0
+        self.outcome = None
+        self.over = False
+
+    def stamp(self):
+        return int(round(self.time * 1000))
+
+    def initial_message(self):
+        params = self.world['vehicleParams']
+        return 'I %.3f %.3f %d %.3f %.3f %.3f %.3f %.3f ;' % (self.size, self.size,
+                self.world['timeLimit'], params['rearView'], params['frontView'],
+                params['maxSpeed'], params['turn'], params['hardTurn'])
+
+    def command(self, msg):
+        """Apply a command from the client, like 'al;'"""
+        accel = turn = None
+        for c in msg.rstrip(';'):
+            if c in (ACCELERATE, BRAKE):
+                accel = c
+            elif c in (LEFT, RIGHT):
+                turn = c
+        self.rover.command(accel, turn)
+
+    def telemetry_message(self):
+        rover = self.rover
+        view = rover.params['frontView']
+        parts = ['T %d %s%s %.3f %.3f %.1f %.3f' % (self.stamp(), rover.accel,
+            rover.turn, rover.x, rover.y, rover.direction, rover.speed)]
+        for kind, objects in (('b', self.boulders), ('c', self.craters),
+                ('h', [(0.0, 0.0, HOME_RADIUS)])):
+            for x, y, r in objects:
+                if rover.distance(x, y) - r <= view:
+                    parts.append('%s %.3f %.3f %.3f' % (kind, x, y, r))
+        for martian in self.martians:
+            if rover.distance(martian.x, martian.y) <= view:
+                parts.append('m %.3f %.3f %.1f %.3f' % (martian.x, martian.y,
+                    martian.direction, martian.speed))
+        parts.append(';')
+        return ' '.join(parts)
+
+    def end_message(self):
+        # the score is the time taken if the rover made it home, otherwise
+        # the whole time limit
+        score = self.stamp() if self.outcome == 'S' else self.world['timeLimit']
+        return 'E %d %d ;' % (self.stamp(), score)
+
+    def steer_martian(self, martian):
+        """Chase the rover if it is in sight, otherwise keep away from the
+        edge of the map"""
+        rover = self.rover
+        martian.accel = ACCELERATE
+        if martian.distance(rover.x, rover.y) <= martian.params['frontView']:
+            x, y = rover.x, rover.y
+        elif max(abs(martian.x), abs(martian.y)) > self.size * 0.4:
+            x, y = 0.0, 0.0
+        else:
+            martian.turn = STRAIGHT
+            return
+        wanted = math.degrees(math.atan2(y - martian.y, x - martian.x))
+        off = (wanted - martian.direction + 180.0) % 360.0 - 180.0
+        if abs(off) < 3.0:
+            martian.turn = STRAIGHT
+        elif abs(off) < 20.0:
+            martian.turn = LEFT if off > 0 else RIGHT
+        else:
+            martian.turn = HARDLEFT if off > 0 else HARDRIGHT
+
+    def step(self, dt):
+        """Advance by dt simulated seconds; returns the list of B, C, K or
+        S messages that happened"""
+        events = []
+        rover = self.rover
+        rover.step(dt)
+        half = self.size / 2.0
+        rover.x = max(-half, min(half, rover.x))
+        rover.y = max(-half, min(half, rover.y))
+        for martian in self.martians:
+            self.steer_martian(martian)
+            martian.step(dt)
+        self.time += dt
+
+        for x, y, r in self.boulders:
+            d = rover.distance(x, y)
+            if d < r + ROVER_RADIUS:
+                # bounce: stop, and back off to the edge of the boulder
+                events.append('B %d ;' % self.stamp())
+                rover.speed = 0.0
+                if d > 0:
+                    scale = (r + ROVER_RADIUS) / d
+                    rover.x = x + (rover.x - x) * scale
+                    rover.y = y + (rover.y - y) * scale
+        for x, y, r in self.craters:
+            if rover.distance(x, y) < r:
+                self.outcome = 'C'
+        for martian in self.martians:
+            if rover.distance(martian.x, martian.y) < ROVER_RADIUS + MARTIAN_RADIUS:
+                self.outcome = 'K'
+        if self.outcome is None and rover.distance(0.0, 0.0) < HOME_RADIUS:
+            self.outcome = 'S'
+        if self.outcome is not None:
+            events.append('%s %d ;' % (self.outcome, self.stamp()))
+            self.over = True
+        elif self.time >= self.time_limit:
+            self.over = True
+        return events
+
+    def advance(self, duration):
+        """Step through duration simulated seconds, stopping early if the
+        run ends; returns the messages that happened"""
+        events = []
+        steps = int(round(duration / STEP))
+        for i in xrange(steps):
+            events.extend(self.step(STEP))
+            if self.over:
+                break
+        return events
+
+class SimulatorProtocol(Protocol):
+    """Runs every run of the map for one client"""
+    log = logging.getLogger('SimulatorProtocol')
+
+    def connectionMade(self):
+        self.buf = FrameBuffer()
+        self.run = 0
+        self.timer = None
+        self.startRun()
+
+    def startRun(self):
+        self.sim = Simulation(self.factory.world, self.run)
+        self.log.info('starting run %d', self.run)
+        self.transport.write(self.sim.initial_message())
+        self.transport.write(self.sim.telemetry_message())
+        self.schedule()
+
+    def schedule(self):
+        self.timer = reactor.callLater(TELEMETRY_INTERVAL / self.factory.warp, self.tick)
+
+    def tick(self):
+        self.timer = None
+        sim = self.sim
+        events = sim.advance(TELEMETRY_INTERVAL)
+        self.transport.write(''.join(events))
+        if not sim.over:
+            self.transport.write(sim.telemetry_message())
+            self.schedule()
+            return
+        self.transport.write(sim.end_message())
+        self.log.info('run %d over: %s at %d ms', self.run, sim.outcome, sim.stamp())
+        self.run += 1
+        if self.run < len(self.factory.world['runs']):
+            self.startRun()
+        else:
+            self.transport.loseConnection()
+
+    def dataReceived(self, data):
+        for msg in self.buf.feed(data):
+            self.sim.command(msg)
+
+    def connectionLost(self, reason):
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+
+class SimulatorFactory(Factory):
+    protocol = SimulatorProtocol
+
+    def __init__(self, world=None, warp=1.0):
+        assert warp > 0, warp
+        self.world = world if world is not None else copy.deepcopy(DEFAULT_MAP)
+        self.warp = warp
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] [map_file]')
+    parser.add_option('--port', type='int', default=17676)
+    parser.add_option('--warp', type='float', default=1.0,
+            help='simulated seconds per second')
+    options, args = parser.parse_args()
+    world = load_map(open(args[0])) if args else None
+
+    logging.basicConfig(level=logging.INFO)
+    reactor.listenTCP(options.port, SimulatorFactory(world, options.warp))
+    reactor.run()
+
+# vim: et sw=4 ts=4
@@ -1,15 +1,21 @@
 '''Steering strategies'''
 
+import itertools
+import logging
 import math
+import threading
 import time
 
 import mars_math
+import predict
 from message import *
 from constants import *
 from nav import * 
-from twisted.internet import reactor
-from nav import MapGrid
+from twisted.internet import threads
+from nav import ArrayMapGrid, MapGrid
 
+# tag of the compensating turns steer_rover schedules on rover.scheduler
+COMPENSATE = 'compensate'
 
 def steer_rover(f):
 	'''Decorates the function passed in by adding in steering logic. The
@@ -54,48 +60,110 @@ def steer_rover(f):
 		#compensate_time = t - PROCESSING_TIME
 		compensate_time = t
 
+		# this decision supersedes any compensating turn still pending from the
+		# last one
+		rover.scheduler.cancel_tag(COMPENSATE)
+
 		# if the angle is small we should just keep moving forward
 		if not force_turn and (abs(turn_angle.degrees) < SMALL_ANGLE) and (origin_distance > FORCE_TURN_DIST):
 			if rover.turning == 'L' or (rover.turning == 'l' and turn_angle.degrees < 0):
-				rover.client.sendMessage(Message.create(accel, RIGHT))
+				rover.client.sendCommand(accel, RIGHT)
 			elif rover.turning == 'R' or (rover.turning == 'r' and turn_angle.degrees < 0):
-				rover.client.sendMessage(Message.create(accel, LEFT))
+				rover.client.sendCommand(accel, LEFT)
 			else:
-				rover.client.sendMessage(Message.create(accel))
+				rover.client.sendCommand(accel)
 			return
 
 		if (abs(turn_angle.degrees) < SMALL_ANGLE) and (origin_distance < FORCE_TURN_DIST):
 			rover.log.info('Forcing turn due to home proximity')
 
-		if t >= rover.avg_interval:
-			sched_time = 'until next telemetry update [~%1.4f seconds]' % (rover.avg_interval / INTERVAL_SCALE)
-		else:
-			sched_time = 'for %1.3f seconds' % t
+		if rover.log.isEnabledFor(logging.DEBUG):
+			if t >= rover.avg_interval:
+				sched_time = 'until next telemetry update [~%1.4f seconds]' % (rover.avg_interval / INTERVAL_SCALE)
+			else:
+				sched_time = 'for %1.3f seconds' % t
+			rover.log.debug('Scheduling %s turn %s (targeting %3.3f degrees)',
+					'right' if turn_angle.radians < 0 else 'left', sched_time, abs(turn_angle.degrees))
 		if turn_angle.radians < 0:
-			rover.log.debug('Scheduling right turn %s (targeting %3.3f degrees)' % (sched_time, abs(turn_angle.degrees),))
-			rover.client.sendMessage(Message.create(accel, RIGHT))
+			rover.client.sendCommand(accel, RIGHT)
 
 			if 0 < compensate_time < rover.avg_interval:
-				def turn_left():
-					rover.client.sendMessage(Message.create(accel, LEFT))
-				reactor.callLater(compensate_time, turn_left)
+				rover.scheduler.schedule(compensate_time, rover.client.sendCommand,
+						accel, LEFT, tag=COMPENSATE)
 		else:
-			rover.log.debug('Scheduling left turn %s (targeting %3.3f degrees)' % (sched_time, abs(turn_angle.degrees),))
-			rover.client.sendMessage(Message.create(accel, LEFT))
+			rover.client.sendCommand(accel, LEFT)
 
 			if 0 < compensate_time < rover.avg_interval:
-				def turn_right():
-					rover.client.sendMessage(Message.create(accel, RIGHT))
-				reactor.callLater(compensate_time, turn_right)
+				rover.scheduler.schedule(compensate_time, rover.client.sendCommand,
+						accel, RIGHT, tag=COMPENSATE)
 	return new_func
 
+class PlanRequest(object):
+    """What a path is planned from, copied off the rover so that planning can
+    run on another thread while telemetry keeps changing the rover.
+
+    Instance variables:
+        generation -- int, PathStrategy.generation when this was made
+        map_size -- (width, height)
+        objects -- world.Snapshot of the objects in rover.world
+        resolution -- int, grid resolution to plan with
+        start, goal -- mars_math.Point
+    """
+    __slots__ = ('generation', 'map_size', 'objects', 'resolution', 'start', 'goal')
+
+    def __init__(self, generation, rover, resolution):
+        self.generation = generation
+        self.map_size = rover.map_size
+        self.objects = rover.world.snapshot()
+        self.resolution = resolution
+        self.start = rover.vector.pos
+        self.goal = mars_math.find_home_point(rover.vector.pos)
+
 class PathStrategy(object): 
-    def __init__(self): 
+    log = logging.getLogger('PathStrategy')
+
+    def __init__(self, incremental=False, array_grid=False, hierarchical=False,
+            background=False, budget=None): 
+        """If incremental is True the path is repaired with
+        MapGrid.incremental_path on every telemetry update rather than
+        searched for from scratch every update_path_interval seconds. If
+        array_grid is True obstacles are kept in a nav.ArrayMapGrid (this
+        needs numpy). If hierarchical is True paths are found with
+        MapGrid.hierarchical_path on a grid whose resolution follows the map
+        size.
+
+        If background is True paths are planned in a thread (see
+        requestPath) and the rover keeps following the last path until the
+        new one is ready.
+
+        If budget is given paths are found with the anytime search of
+        MapGrid.path, spending at most about budget seconds per update, and
+        the path is improved on every update until it is the shortest."""
+        self.incremental = incremental
+        self.hierarchical = hierarchical
+        self.background = background
+        self.budget = budget
+        # whether the anytime search can still improve self.path
+        self.improving = False
+        self.grid_class = ArrayMapGrid if array_grid else MapGrid
         self.last_path_update = 0
         self.update_path_interval = 5.0
         self.update_no = 0
         self.path = []
+        # self.grid and self.stamped are only used by planPath, which holds
+        # grid_lock
         self.grid = None
+        self.grid_lock = threading.Lock()
+        # number of rover.objects already stamped onto self.grid
+        self.stamped = 0
+        # incremented for each path requested; a path planned for an older
+        # request than the one self.path was planned for is stale
+        self.generation = 0
+        self.adopted = 0
+        self.in_flight = False
+        # request waiting for the one in flight to finish
+        self.queued = None
+        self.defer_to_thread = threads.deferToThread
 
     def getRotation(self, rover):
         """Get the desired turn angle for the rover
@@ -105,59 +173,159 @@ class PathStrategy(object):
             turn angle, force turn
         """
         # init the path
-        if self.path == [] or (self.update_path_interval < time.time() - self.last_path_update):
-            self.grid = MapGrid(rover.map_size[0], rover.map_size[1], 100 if self.update_no == 0 else 201)
-            print "UPDATING PATHS", self.update_path_interval, self.last_path_update, time.time() - self.last_path_update
-            process_start = time.time()
-            self.recalculatePath(rover) 
-            process_end = time.time()
+        if self.path == [] or self.incremental or self.improving or (self.update_path_interval < time.time() - self.last_path_update):
+            self.log.debug('updating path, last update %.3f seconds ago',
+                    time.time() - self.last_path_update)
+            if self.background:
+                self.requestPath(rover)
+            else:
+                self.recalculatePath(rover) 
 
         shift = rover.secondsBehind()
-        print "TIME SHIFT", shift
         expected_pos = rover.vector.future_position(shift + .1)
 
-        # find the nearest path member and head to the next one
-        def dist(p):
-            return math.hypot(expected_pos.x - p.x, expected_pos.y - p.y)
-        
-        nearest_idx = min((dist(p), i) for i, p in enumerate(self.path))[1]
-        try:
-            next = self.path[nearest_idx + 1]
-        except IndexError:
-            next = self.path[-1]
+        # find the nearest leg of the path and head to its end
+        path = self.path
+        if not path:
+            # nothing planned yet, head straight home
+            path = [mars_math.find_home_point(expected_pos)]
+        if len(path) == 1:
+            next = path[0]
+        else:
+            segment_distance = mars_math.segment_distance
+            nearest_idx = min((segment_distance(expected_pos, path[i], path[i + 1]), i)
+                    for i in range(len(path) - 1))[1]
+            next = path[nearest_idx + 1]
+
+        # the planner doesn't know about martians, so if one could get in
+        # the way of this leg steer around it instead
+        regions = predict.martian_regions(rover)
+        if predict.segment_blocked(expected_pos, next, regions):
+            self.log.debug('a martian could get in the way of %s', next)
+            return mars_math.find_heading(rover, regions=regions)
 
         angle = mars_math.direction(expected_pos, next)
         ta = mars_math.TurnAngle(angle - rover.vector.angle.radians)
-        print "Heading to", next, ta.radians * 57.77
+        self.log.debug('heading to %s, turning %.1f degrees (%.3f seconds behind)',
+                next, ta.degrees, shift)
         return ta, False
 
+    def resolution(self, rover):
+        """The grid resolution to plan with"""
+        if self.hierarchical:
+            return int(math.ceil(max(rover.map_size) / GRID_CELL_SIZE))
+        return 100 if self.update_no == 0 else 201
+
+    def updateGrid(self, rover, resolution):
+        """Bring self.grid up to date with the objects the rover (or a
+        PlanRequest) has seen.
+
+        rover.objects is only ever appended to, so only the objects added
+        since the last update need to be stamped. A new grid is made (and
+        everything stamped again) if the map size or resolution changed.
+        """
+        width, height = rover.map_size
+        objects = rover.objects
+        if self.grid is None or self.grid.resolution != resolution \
+                or (self.grid.width, self.grid.height) != (width, height) \
+                or self.stamped > len(objects):
+            self.grid = self.grid_class(width, height, resolution,
+                    ROVER_RADIUS + SAFETY_MARGIN)
+            self.stamped = 0
+        self.grid.add_obstacles(self.obstacles(
+            itertools.islice(objects, self.stamped, None)))
+        self.stamped = len(objects)
+
+    @staticmethod
+    def obstacles(objects):
+        for object in objects:
+            if object.kind in (CRATER, BOULDER):
+                yield (object.position.x, object.position.y), object.radius
+
+    def planPath(self, request):
+        """Plan a path for a PlanRequest. Returns the list of waypoints, or
+        None if there is no path. This may run on a worker thread."""
+        with self.grid_lock:
+            self.updateGrid(request, request.resolution)
+            if self.incremental:
+                find_path = self.grid.incremental_path
+            elif self.hierarchical:
+                find_path = self.grid.hierarchical_path
+            elif self.budget is not None:
+                grid = self.grid
+                find_path = lambda start, goal: grid.path(start, goal, budget=self.budget)
+            else:
+                find_path = self.grid.path
+            try:
+                path = find_path(request.start, request.goal)
+            except OutOfTime:
+                self.improving = True
+                return None
+            except PathNotFound:
+                self.log.warning('unable to find a path from %s to %s',
+                        request.start, request.goal)
+                self.improving = False
+                return None
+            self.improving = self.grid.stats.get('bound', 1.0) > 1.0
+            return self.grid.string_pull(path)
+
     def recalculatePath(self, rover): 
-        print "RECALCULATE"
-        for object in rover.objects:
-            if object['kind'] in (CRATER, BOULDER):
-                self.grid.add_obstacle((object['position'].x, object['position'].y), max(2, (1.3 * object['radius'])))
-        pos = rover.vector.pos
-        try:
-            path = self.grid.path(pos, mars_math.find_home_point(rover.vector.pos))
-        except PathNotFound:
-            print "UNABLE TO CALC PATH"
+        """Plan a new path right away"""
+        self.generation += 1
+        request = PlanRequest(self.generation, rover, self.resolution(rover))
+        self.adoptPath(request.generation, self.planPath(request))
+
+    def requestPath(self, rover):
+        """Plan a new path on a worker thread. Only one plan runs at a time;
+        if one is already running this request waits for it, replacing any
+        older request that was waiting."""
+        self.generation += 1
+        request = PlanRequest(self.generation, rover, self.resolution(rover))
+        self.last_path_update = time.time()
+        if self.in_flight:
+            self.queued = request
+        else:
+            self._startPlan(request)
+
+    def _startPlan(self, request):
+        self.in_flight = True
+        d = self.defer_to_thread(self.planPath, request)
+        d.addCallback(lambda path: self.adoptPath(request.generation, path))
+        d.addErrback(self._planFailed)
+        d.addBoth(self._planDone)
+
+    def _planFailed(self, failure):
+        self.log.error('path planning failed: %s', failure.getTraceback())
+
+    def _planDone(self, result):
+        self.in_flight = False
+        if self.queued is not None:
+            request, self.queued = self.queued, None
+            self._startPlan(request)
+
+    def adoptPath(self, generation, path):
+        """Start following a newly planned path, unless there is no path or
+        the path being followed was planned for a newer request. A path
+        finished after newer ones were requested is still adopted, as it is
+        newer than the one being followed."""
+        if path is None:
+            return
+        if generation <= self.adopted and self.path:
+            self.log.debug('dropping stale path %d (following %d)', generation, self.adopted)
             return
-        # add every 15 meters
-        self.path = [path.pop(0)]
-        end = path.pop()
-        while path:
-            point = path.pop(0)
-            prev = self.path[-1]
-            dist = math.hypot(prev.x - point.x, prev.y - point.y)
-            if dist < 17:
-                continue
-            self.path.append(point)
-        self.path.append(end)
+        self.path = path
+        self.adopted = generation
         self.last_path_update = time.time()
+        self.update_no += 1
+
+def steer_around_martians(rover):
+    """mars_math.find_heading, keeping clear of where the martians in sight
+    could get to"""
+    return mars_math.find_heading(rover, regions=predict.martian_regions(rover))
 
 # This is the default / most simple strategy.  This is called on every
 # setTelemetry update
-basic_strategy = steer_rover(mars_math.find_heading)
+basic_strategy = steer_rover(steer_around_martians)
 
 path_strategizer = PathStrategy()
 
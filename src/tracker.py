@@ -0,0 +1,196 @@
+'''Following martians from one telemetry update to the next.
+
+The server doesn't say which martian is which, so each update's sightings
+are matched to the tracks of the martians seen before: a sighting goes to
+the nearest track whose predicted position is within GATE of it, looked up
+in a spatial hash of the predictions. Sightings that match nothing start
+new tracks, and tracks that go more than MAX_MISSED updates without a
+sighting are dropped, so the tracker only ever holds about as many tracks as there are
+martians about.'''
+
+import itertools
+import math
+
+import mars_math
+
+# meters; a sighting further than this from where a track was expected to
+# be is a different martian
+GATE = 5.0
+
+# updates a track can go unseen before it is dropped
+MAX_MISSED = 10
+
+# states kept per track
+HISTORY = 8
+
+# most tracks kept; past this the ones unseen longest are dropped first
+CAPACITY = 64
+
+# weight of the newest measurement in the velocity and turn rate estimates
+SMOOTHING = 0.5
+
+class TrackState(object):
+    """Where a martian was seen
+
+    Instance variables:
+        time -- float, martian seconds
+        x, y -- float, meters
+        heading -- float, radians
+        speed -- float, meters per second
+    """
+    __slots__ = ('time', 'x', 'y', 'heading', 'speed')
+
+    def __init__(self, time, sighting):
+        self.time = time
+        self.x = sighting.position.x
+        self.y = sighting.position.y
+        self.heading = mars_math.to_radians(sighting.direction)
+        self.speed = sighting.speed
+
+class Track(object):
+    """One martian, as seen over several updates
+
+    Instance variables:
+        id -- int, unique to the MartianTracker
+        last -- TrackState, the latest sighting
+        missed -- int, updates since it was last seen
+        vx, vy -- float, estimated velocity in meters per second
+        turn_rate -- float, estimated turn rate in radians per second, left
+                     positive
+    """
+    __slots__ = ('id', 'states', 'count', 'last', 'missed', 'vx', 'vy',
+            'turn_rate')
+
+    def __init__(self, id, state, history=HISTORY):
+        self.id = id
+        # ring buffer, the next state goes in states[count % len(states)]
+        self.states = [None] * history
+        self.count = 0
+        self.missed = 0
+        self.vx = state.speed * math.cos(state.heading)
+        self.vy = state.speed * math.sin(state.heading)
+        self.turn_rate = 0.0
+        self.last = None
+        self.record(state)
+
+    def record(self, state):
+        self.states[self.count % len(self.states)] = state
+        self.count += 1
+        self.last = state
+
+    def update(self, state):
+        """Add a sighting, updating the estimates"""
+        last = self.last
+        dt = state.time - last.time
+        if dt > 0:
+            a = SMOOTHING
+            self.vx += a * ((state.x - last.x) / dt - self.vx)
+            self.vy += a * ((state.y - last.y) / dt - self.vy)
+            turned = mars_math.normalize_turn_angle(state.heading - last.heading)
+            self.turn_rate += a * (turned / dt - self.turn_rate)
+        self.missed = 0
+        self.record(state)
+
+    def history(self):
+        """The states kept, oldest first"""
+        n = len(self.states)
+        if self.count <= n:
+            return self.states[:self.count]
+        start = self.count % n
+        return self.states[start:] + self.states[:start]
+
+    def predict(self, time):
+        """Where the martian should be at time, as (x, y)"""
+        dt = time - self.last.time
+        return self.last.x + self.vx * dt, self.last.y + self.vy * dt
+
+    def __repr__(self):
+        return 'Track(id=%d, x=%.1f, y=%.1f, vx=%.1f, vy=%.1f, missed=%d)' % (
+                self.id, self.last.x, self.last.y, self.vx, self.vy, self.missed)
+
+class MartianTracker(object):
+    """The tracks of the martians seen lately
+
+    Instance variables:
+        tracks -- dict, id -> Track
+        gate -- float, see GATE
+        max_missed -- int, see MAX_MISSED
+        capacity -- int, see CAPACITY
+    """
+
+    def __init__(self, gate=GATE, max_missed=MAX_MISSED, history=HISTORY,
+            capacity=CAPACITY):
+        self.gate = gate
+        self.max_missed = max_missed
+        self.history = history
+        self.capacity = capacity
+        self.tracks = {}
+        self.ids = itertools.count()
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __iter__(self):
+        return self.tracks.itervalues()
+
+    def reset(self):
+        self.tracks.clear()
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.gate)), int(math.floor(y / self.gate))
+
+    def update(self, time, sightings):
+        """Match the MartianSightings of the update at time (in martian
+        seconds) to tracks. Returns the tracks seen, in the order of
+        sightings."""
+        states = [TrackState(time, s) for s in sightings]
+
+        # the predictions go in cells as big as the gate, so anything in
+        # range of a sighting is in its cell or one of the eight around it
+        cells = {}
+        predicted = {}
+        for track in self.tracks.itervalues():
+            x, y = predicted[track.id] = track.predict(time)
+            cells.setdefault(self._cell(x, y), []).append(track)
+
+        pairs = []
+        gate_sq = self.gate ** 2
+        for k, state in enumerate(states):
+            i, j = self._cell(state.x, state.y)
+            for di in (-1, 0, 1):
+                for dj in (-1, 0, 1):
+                    for track in cells.get((i + di, j + dj), ()):
+                        x, y = predicted[track.id]
+                        d = (x - state.x) ** 2 + (y - state.y) ** 2
+                        if d <= gate_sq:
+                            pairs.append((d, k, track.id))
+
+        # closest pairs first, each sighting and track used once
+        matched = [None] * len(states)
+        taken = set()
+        for d, k, id in sorted(pairs):
+            if matched[k] is not None or id in taken:
+                continue
+            track = matched[k] = self.tracks[id]
+            track.update(states[k])
+            taken.add(id)
+
+        for k, state in enumerate(states):
+            if matched[k] is None:
+                track = matched[k] = Track(next(self.ids), state, self.history)
+                self.tracks[track.id] = track
+                taken.add(track.id)
+
+        for id, track in self.tracks.items():
+            if id not in taken:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[id]
+        if len(self.tracks) > self.capacity:
+            evict = sorted(self.tracks.itervalues(),
+                    key=lambda track: (-track.missed, track.id))
+            for track in evict[:len(self.tracks) - self.capacity]:
+                del self.tracks[track.id]
+        return matched
+
+# vim: et sw=4 ts=4
@@ -1,7 +1,131 @@
+'''Logging setup.
+
+There are two profiles, picked with configure:
+
+    debug -- everything from DEBUG up, written to stderr as it happens
+    production -- only warnings and errors, formatted and written to stderr
+                  in batches by a background thread, so that the reactor
+                  never waits on a write
+
+Log with the arguments separate from the format string, as in
+log.debug('found %r', object), so that nothing is formatted unless the
+record is going to be written. In the production profile the formatting
+happens later on the writer thread, so arguments shouldn't be changed
+after they are logged.'''
+
 import sys
 import logging
+import Queue
+import threading
+
+FORMAT = '%(asctime)s %(name)-15s %(levelname)-8s %(message)s'
+DATE_FORMAT = '%m-%d %H:%M'
+
+PROFILES = {
+    'debug': {
+        'level': logging.DEBUG,
+        # loggers that are noisier than is useful at DEBUG
+        'loggers': {
+            'RoverController.telemetry': logging.INFO,
+            'TwistedClient': logging.INFO,
+            },
+        'background': False,
+        },
+    'production': {
+        'level': logging.WARNING,
+        'loggers': {},
+        'background': True,
+        },
+    }
+
+# what the logging module looks up for every record, as it was before
+# configure turned any of it off
+RECORD_DEFAULTS = logging._srcfile, logging.logThreads, logging.logProcesses
+
+class BackgroundHandler(logging.Handler):
+    """Queues records for a thread that formats them and writes them out in
+    batches, so that logging only costs the thread that logs a queue put.
+    If the queue is full records are dropped and counted in dropped."""
+
+    def __init__(self, stream=sys.stderr, capacity=10000, batch=100):
+        logging.Handler.__init__(self)
+        self.stream = stream
+        self.batch = batch
+        self.queue = Queue.Queue(capacity)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._write, name='log writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        queue = self.queue
+        while True:
+            records = [queue.get()]
+            try:
+                while len(records) < self.batch:
+                    records.append(queue.get_nowait())
+            except Queue.Empty:
+                pass
+            lines = []
+            stop = False
+            for record in records:
+                if record is None:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+            if lines:
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+            for record in records:
+                queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Wait until everything queued so far is written"""
+        if self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        logging.Handler.close(self)
 
-logging.basicConfig(level=logging.DEBUG, 
-        format='%(asctime)s %(name)-15s %(levelname)-8s %(message)s',
-        datefmt='%m-%d %H:%M', stream=sys.stderr)
+def configure(profile='debug', stream=sys.stderr):
+    """Set up logging with one of PROFILES, replacing the handlers of any
+    earlier configuration"""
+    settings = PROFILES[profile]
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    if settings['background']:
+        handler = BackgroundHandler(stream)
+        # skip looking up the caller, thread and process of every record;
+        # the format doesn't use them
+        logging._srcfile = None
+        logging.logThreads = 0
+        logging.logProcesses = 0
+    else:
+        handler = logging.StreamHandler(stream)
+        logging._srcfile, logging.logThreads, logging.logProcesses = RECORD_DEFAULTS
+    handler.setFormatter(logging.Formatter(FORMAT, DATE_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(settings['level'])
+    for name in PROFILES['debug']['loggers']:
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    for name, level in settings['loggers'].items():
+        logging.getLogger(name).setLevel(level)
+    return handler
 
+configure()
@@ -0,0 +1,204 @@
+'''What the rover knows about the map'''
+
+import collections
+import itertools
+import math
+
+from message import MARTIAN
+from tracker import MartianTracker
+
+# the object positions sent by the server are only accurate to a few percent
+PRECISION = 0.95
+
+# smallest side of an ObjectIndex cell, in meters
+MIN_CELL_SIZE = 1.0
+
+# telemetry arrival times kept to average the interval between updates
+MAX_INTERVALS = 3
+
+def similar(a, b, precision=PRECISION): 
+    d = abs(a - b)
+    return d <= ((1.0 - precision) * abs(a))
+
+def similar_position(p1, p2):
+    return similar(p1.x, p2.x) and similar(p1.y, p2.y)
+
+class ObjectIndex(object):
+    """Spatial hash of the objects that have been seen, used to tell whether
+    a sighting is a new object or one we already know about.
+
+    Two objects of the same kind are the same object if similar_position
+    holds for them. The tolerance of similar_position grows with the
+    distance from the origin, so the cells are made as big as the tolerance
+    at the edge of the map; everything similar to a position is then in the
+    cells its tolerance box touches, which is usually just one or two.
+
+    Instance variables:
+        cell_size -- float, side of a cell in meters
+        cells -- dict, (kind, i, j) -> list of objects
+        version -- int, incremented every time an object is added
+    """
+
+    def __init__(self, extent=0.0, precision=PRECISION):
+        """extent is the largest coordinate (in absolute value) expected on
+        the map, i.e. half its width or height"""
+        self.precision = precision
+        self.tolerance = 1.0 - precision
+        self.cell_size = max(MIN_CELL_SIZE, self.tolerance * extent)
+        self.cells = {}
+        self.version = 0
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.cells.itervalues())
+
+    def _cell(self, v):
+        return int(math.floor(v / self.cell_size))
+
+    def find(self, kind, position):
+        """Return a known object of kind similar to position, or None"""
+        x, y = position.x, position.y
+        tx = self.tolerance * abs(x)
+        ty = self.tolerance * abs(y)
+        cells = self.cells
+        precision = self.precision
+        for i in xrange(self._cell(x - tx), self._cell(x + tx) + 1):
+            for j in xrange(self._cell(y - ty), self._cell(y + ty) + 1):
+                for o in cells.get((kind, i, j), ()):
+                    if similar(x, o.position.x, precision) \
+                            and similar(y, o.position.y, precision):
+                        return o
+        return None
+
+    def _insert(self, obj):
+        p = obj.position
+        key = obj.kind, self._cell(p.x), self._cell(p.y)
+        self.cells.setdefault(key, []).append(obj)
+
+    def add(self, obj):
+        """Add obj unless a similar object is already known. Returns True if
+        it was added."""
+        if self.find(obj.kind, obj.position) is not None:
+            return False
+        self._insert(obj)
+        self.version += 1
+        return True
+
+    def resize(self, extent):
+        """Rehash for a map of a different size; the version is kept since
+        the set of objects doesn't change."""
+        objects = [o for bucket in self.cells.itervalues() for o in bucket]
+        self.cell_size = max(MIN_CELL_SIZE, self.tolerance * extent)
+        self.cells = {}
+        for o in objects:
+            self._insert(o)
+
+class Snapshot(object):
+    """The first count objects of a list that is only ever appended to, as
+    they were when the snapshot was taken. Since those entries never change
+    a planner on another thread can read them without a copy being made.
+
+    Instance variables:
+        objects -- the list
+        count -- int, how many of its objects are in the snapshot
+    """
+    __slots__ = ('objects', 'count')
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.count = len(objects)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return itertools.islice(self.objects, self.count)
+
+class World(object):
+    """Everything the rover has seen, kept for as long as it's useful.
+
+    For the session (every run on the map):
+        objects -- list of the StaticObjects seen, only ever appended to
+                   (see Snapshot). These aren't capped: they are obstacles
+                   the planners need, and since the index keeps each object
+                   once there are only as many as there are on the map.
+        index -- ObjectIndex of objects
+
+    For the current run, cleared by end_run:
+        martians -- list of the MartianSightings in the latest telemetry,
+                    cleared by begin_frame
+        tracker -- tracker.MartianTracker, which drops martians unseen for
+                   a while
+        telemetry_intervals, martian_intervals -- deques of the local and
+                   martian times of the latest MAX_INTERVALS + 1
+                   telemetry updates
+
+    So memory use levels off however long the session runs; see sizes.
+    """
+
+    def __init__(self):
+        self.martians = []
+        self.tracker = MartianTracker()
+        self.telemetry_intervals = collections.deque(maxlen=MAX_INTERVALS + 1)
+        self.martian_intervals = collections.deque(maxlen=MAX_INTERVALS + 1)
+        self.begin_session()
+
+    def begin_session(self, extent=0.0):
+        """Forget everything, for a new map whose largest coordinate is
+        extent"""
+        # a new list rather than clearing the old one, which snapshots
+        # taken before may still be reading
+        self.objects = []
+        self.index = ObjectIndex(extent)
+        self.end_run()
+
+    def end_run(self):
+        del self.martians[:]
+        self.tracker.reset()
+        self.telemetry_intervals.clear()
+        self.martian_intervals.clear()
+
+    def resize(self, extent):
+        """See ObjectIndex.resize"""
+        self.index.resize(extent)
+
+    @property
+    def version(self):
+        return self.index.version
+
+    def begin_frame(self):
+        """Call before noticing the objects of a telemetry update"""
+        del self.martians[:]
+
+    def notice(self, obj):
+        """Add an object from a telemetry update. Returns True if it's a
+        static object that wasn't known before."""
+        if obj.kind == MARTIAN:
+            # martians move, so rather than going in the index they are
+            # followed by the tracker
+            self.martians.append(obj)
+            return False
+        if not self.index.add(obj):
+            return False
+        self.objects.append(obj)
+        return True
+
+    def end_frame(self, time):
+        """Call after noticing the objects of the telemetry update at time
+        (martian seconds)"""
+        self.tracker.update(time, self.martians)
+
+    def snapshot(self):
+        """A Snapshot of the objects seen so far"""
+        return Snapshot(self.objects)
+
+    def sizes(self):
+        """dict, what -> how many entries are kept"""
+        return {
+            'objects': len(self.objects),
+            'index': len(self.index),
+            'martians': len(self.martians),
+            'tracks': len(self.tracker),
+            'intervals': len(self.telemetry_intervals) + len(self.martian_intervals),
+            }
+
+# vim: et sw=4 ts=4
@@ -0,0 +1,65 @@
+'''Compare the FrameBuffer against the old list-of-characters framing.
+
+Usage: bench_framing.py [recorded stream file]
+'''
+
+import sys
+import time
+
+import workloads
+from framing import FrameBuffer
+
+# typical read sizes: tiny writes, the default MSS and a full socket read
+CHUNK_SIZES = (64, 536, 1448, 4096)
+
+def list_framing(reads):
+    buf = []
+    n = 0
+    for data in reads:
+        buf.extend(data)
+        while True:
+            try:
+                idx = buf.index(';')
+            except ValueError:
+                break
+            msg_s = ''.join(buf[:idx + 1])
+            del buf[:idx + 1]
+            n += 1
+    return n
+
+def buffer_framing(reads):
+    fb = FrameBuffer()
+    n = 0
+    for data in reads:
+        n += len(fb.feed(data))
+    return n
+
+def timeit(f, reads, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        n = f(reads)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return n, best
+
+def main(args):
+    if args:
+        streams = [(name, open(name, 'rb').read()) for name in args]
+    else:
+        streams = [('%d objects' % n, workloads.stream(500, n))
+                for n in (0, 20, 100)]
+    for name, data in streams:
+        for size in CHUNK_SIZES:
+            reads = workloads.chunks(data, size)
+            n1, t1 = timeit(list_framing, reads)
+            n2, t2 = timeit(buffer_framing, reads)
+            assert n1 == n2, (n1, n2)
+            print '%-12s chunk %5d: %6d msgs  list %8.4fs  buffer %8.4fs  (%5.1fx)' % (
+                    name, size, n1, t1, t2, t1 / max(t2, 1e-9))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
+
+# vim: et sw=4 ts=4
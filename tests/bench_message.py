@@ -0,0 +1,34 @@
+'''Messages per second for Message.parse against the old token-popping
+parser, on telemetry with increasing numbers of visible objects.'''
+
+import time
+
+import workloads
+from message import Message
+from legacy_message import LegacyMessage
+
+OBJECT_COUNTS = (0, 10, 50, 100, 200)
+
+def rate(parse, msgs, min_time=0.2):
+    n = 0
+    start = time.time()
+    while True:
+        for msg in msgs:
+            parse(msg)
+        n += len(msgs)
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            return n / elapsed
+
+def main():
+    for count in OBJECT_COUNTS:
+        msgs = [workloads.telemetry_message(i, count) for i in range(20)]
+        old = rate(LegacyMessage.parse, msgs)
+        new = rate(Message.parse, msgs)
+        print '%3d objects: legacy %9.0f msg/s  single-pass %9.0f msg/s  (%4.1fx)' % (
+                count, old, new, new / old)
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
@@ -0,0 +1,39 @@
+'''Construction and obstacle stamping for MapGrid (set of cells) against
+ArrayMapGrid (numpy array) at several resolutions.'''
+
+import time
+
+from constants import ROVER_RADIUS, SAFETY_MARGIN
+import nav
+from nav import ArrayMapGrid, MapGrid
+import workloads
+
+RESOLUTIONS = (100, 201, 801)
+MAP_SIZE = 400.0
+N_OBSTACLES = 100
+# as PathStrategy inflates its grids
+INFLATION = ROVER_RADIUS + SAFETY_MARGIN
+
+def build(grid_class, resolution, obs):
+    start = time.time()
+    grid = grid_class(MAP_SIZE, MAP_SIZE, resolution, INFLATION)
+    built = time.time()
+    grid.add_obstacles(obs)
+    stamped = time.time()
+    return built - start, stamped - built
+
+def main():
+    obs = workloads.obstacles(N_OBSTACLES, MAP_SIZE)
+    classes = [MapGrid]
+    if nav.numpy is not None:
+        classes.append(ArrayMapGrid)
+    for resolution in RESOLUTIONS:
+        for grid_class in classes:
+            construct, stamp = build(grid_class, resolution, obs)
+            print 'resolution %3d %-12s construct %8.5fs  stamp %3d obstacles %8.5fs' % (
+                    resolution, grid_class.__name__, construct, len(obs), stamp)
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
@@ -0,0 +1,177 @@
+'''Benchmarks of the hot paths on generated workloads of several sizes.
+
+Usage: bench_suite.py [--output results.json] [--baseline baseline.json]
+                      [--threshold 0.25] [--filter name]
+
+Each case is timed as the best of a few rounds, in seconds per call. The
+results are written as JSON. Given a baseline (the JSON of an earlier run)
+every case is compared against it, and the exit status is 1 if any is more
+than threshold slower.
+
+make bench_baseline records a baseline in tests/bench_baseline.json, and
+make bench_check compares against it if it is there.'''
+
+import json
+import logging
+import optparse
+import platform
+import random
+import sys
+import time
+
+import workloads
+import client
+from constants import ROVER_RADIUS, SAFETY_MARGIN
+import mars_math
+import predict
+from message import Message
+from nav import MapGrid
+
+OBJECT_COUNTS = (0, 10, 50, 100, 200)
+KNOWN_OBJECTS = (100, 1000, 5000)
+HEADING_SAMPLES = (32, 96, 360)
+HEADING_OBJECTS = (0, 20, 80)
+MARTIAN_COUNTS = (1, 5, 20)
+RESOLUTIONS = (100, 201, 401)
+MAP_SIZE = 200.0
+N_OBSTACLES = 50
+# as PathStrategy inflates its grids
+INFLATION = ROVER_RADIUS + SAFETY_MARGIN
+
+def measure(f, min_time=0.1, rounds=3):
+    """Seconds per call of f, the best of a few rounds of at least
+    min_time each"""
+    best = None
+    for i in range(rounds):
+        n = 0
+        start = time.time()
+        while True:
+            f()
+            n += 1
+            elapsed = time.time() - start
+            if elapsed >= min_time:
+                break
+        if best is None or elapsed / n < best:
+            best = elapsed / n
+    return best
+
+def parse_cases():
+    for count in OBJECT_COUNTS:
+        msg = workloads.telemetry_message(0, count)
+        yield 'parse/objects=%d' % count, lambda msg=msg: Message.parse(msg)
+
+def controller(known):
+    rover = client.RoverController(None)
+    rover.setInitial(Message.parse(workloads.initial_message(1000.0))['initial'])
+    rng = random.Random(known)
+    for i in range(known // 20 + 1):
+        msg = workloads.telemetry_message(i, 20, rng, size=1000.0)
+        for object in Message.parse(msg)['telemetry'].objects:
+            rover.noticeObject(object)
+    return rover
+
+def notice_object_cases():
+    for known in KNOWN_OBJECTS:
+        rover = controller(known)
+        # a frame of things seen before, the usual case
+        frame = rover.objects[-20:]
+        def notice(rover=rover, frame=frame):
+            for object in frame:
+                rover.noticeObject(object)
+        yield 'notice_object/known=%d' % known, notice
+
+def find_heading_cases():
+    for n_objects in HEADING_OBJECTS:
+        rover = workloads.RoverState(n_objects)
+        for samples in HEADING_SAMPLES:
+            yield ('find_heading/objects=%d/samples=%d' % (n_objects, samples),
+                    lambda rover=rover, samples=samples:
+                    mars_math.find_heading(rover, samples))
+
+def martian_cases():
+    for n_martians in MARTIAN_COUNTS:
+        rover = workloads.RoverState(20, n_martians=n_martians)
+        yield ('martian_regions/martians=%d' % n_martians,
+                lambda rover=rover: predict.martian_regions(rover))
+        yield ('find_heading/objects=20/martians=%d' % n_martians,
+                lambda rover=rover: mars_math.find_heading(rover,
+                    regions=predict.martian_regions(rover)))
+
+def grid_cases():
+    obstacles = workloads.obstacles(N_OBSTACLES, MAP_SIZE)
+    start = mars_math.Point(-MAP_SIZE / 2.0 + 5.0, -MAP_SIZE / 2.0 + 5.0)
+    goal = mars_math.Point(0.0, 0.0)
+    for resolution in RESOLUTIONS:
+        def stamp(resolution=resolution):
+            MapGrid(MAP_SIZE, MAP_SIZE, resolution, INFLATION).add_obstacles(obstacles)
+        yield 'add_obstacle/resolution=%d' % resolution, stamp
+
+        grid = MapGrid(MAP_SIZE, MAP_SIZE, resolution, INFLATION)
+        grid.add_obstacles(obstacles)
+        for p in (start, goal):
+            grid.clear_cell(grid.node(p.x, p.y))
+        yield ('path/resolution=%d' % resolution,
+                lambda grid=grid: grid.path(start, goal))
+
+CASES = (parse_cases, notice_object_cases, find_heading_cases, martian_cases,
+        grid_cases)
+
+def run(name_filter=None, min_time=0.1):
+    results = {}
+    for cases in CASES:
+        for name, f in cases():
+            if name_filter and name_filter not in name:
+                continue
+            results[name] = measure(f, min_time)
+            print '%-40s %12.1f us' % (name, results[name] * 1e6)
+    return results
+
+def compare(results, baseline, threshold):
+    """Return the names of the cases more than threshold slower than in
+    baseline, printing the change for every case"""
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        change = results[name] / baseline[name] - 1.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print '%-40s %+7.1f%%%s' % (name, 100 * change, flag)
+    return regressions
+
+def main(args):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--output', help='write the results to this JSON file')
+    parser.add_option('--baseline', help='JSON results to compare against')
+    parser.add_option('--threshold', type='float', default=0.25,
+            help='fraction slower than the baseline that counts as a regression')
+    parser.add_option('--filter', help='only run cases with this in their name')
+    parser.add_option('--min-time', type='float', default=0.1,
+            help='seconds to spend on each round of a case')
+    options, args = parser.parse_args(args)
+    # utils sets up DEBUG logging to stderr, which would be most of what
+    # gets measured
+    logging.disable(logging.INFO)
+
+    results = run(options.filter, options.min_time)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                'time': time.time(), 'results': results},
+                f, indent=1, sort_keys=True)
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print '%d cases regressed by more than %d%%' % (
+                    len(regressions), 100 * options.threshold)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+
+# vim: et sw=4 ts=4
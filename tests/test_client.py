@@ -0,0 +1,99 @@
+import time
+from unittest import main, TestCase
+
+import client
+from message import Message, COMMANDS
+import replay
+import workloads
+
+class TestCommands(TestCase):
+    "Commands that wouldn't change the controls aren't sent"
+
+    def setUp(self):
+        self.client = client.TwistedClient()
+        self.client.makeConnection(replay.ReplayTransport())
+
+    def tearDown(self):
+        self.client.connectionLost(None)
+
+    def test_suppressed(self):
+        c = self.client
+        c.controlsReported('a', '-')
+        c.sendCommand('a')
+        c.sendCommand('a', 'l')
+        c.sendCommand(None, 'l')
+        c.sendCommand('-', 'l')
+        c.sendCommand('b', 'r')
+        self.assertEquals(c.transport.written, [])
+        c.flush()
+        self.assertEquals(c.transport.written, ['l;l;br;'])
+        self.assertEquals(c.controls, ('-', 'l'))
+        counters = c.rover_ctl.timings.counters
+        self.assertEquals(counters['commands sent'], 3)
+        self.assertEquals(counters['commands suppressed'], 2)
+
+    def test_stale_report(self):
+        c = self.client
+        c.controlsReported('a', 'L')
+        c.sendCommand('a', 'r')
+        # made before the command above went out
+        c.controlsReported('a', 'L')
+        c.sendCommand('a', 'r')
+        c.flush()
+        self.assertEquals(c.transport.written, ['r;r;'])
+        self.assertEquals(c.controls, ('a', '-'))
+
+    def test_unknown_controls(self):
+        c = self.client
+        c.sendCommand('a')
+        c.sendCommand('a')
+        c.flush()
+        self.assertEquals(c.transport.written, ['a;a;'])
+
+    def test_one_write_per_read(self):
+        c = self.client
+        data = workloads.stream(10, 5)
+        for chunk in workloads.chunks(data, 100000):
+            c.dataReceived(chunk)
+        # everything arrived in one read, so at most one write
+        self.assert_(len(c.transport.written) <= 1)
+        self.assertEquals(c.pending, [])
+
+class TestClock(TestCase):
+    "Martian time is never ahead of ours"
+
+    def test_fast_clock(self):
+        rover = client.RoverController(None)
+        rover.time_start = None
+        rover.recordMartianTime(0)
+        # ten martian seconds for every one of ours, like --warp 10
+        start = time.time()
+        for i in range(1, 20):
+            rover.recordMartianTime(10000 * (time.time() - start) + 100 * i)
+            self.assert_(rover.secondsBehind() >= 0, rover.secondsBehind())
+
+    def test_slow_message(self):
+        rover = client.RoverController(None)
+        rover.time_start = None
+        rover.recordMartianTime(0)
+        rover.time_start -= 1.0
+        # a late message doesn't move the start
+        start = rover.time_start
+        rover.recordMartianTime(100)
+        self.assertEquals(rover.time_start, start)
+        self.assert_(rover.secondsBehind() > 0.8)
+
+class TestCommandTable(TestCase):
+
+    def test_create(self):
+        self.assertEquals(Message.create('a', 'l'), 'al;')
+        self.assertEquals(Message.create('-', 'r'), 'r;')
+        self.assertEquals(Message.create('b'), 'b;')
+        self.assertRaises(AssertionError, Message.create, '-')
+        self.assertRaises(AssertionError, Message.create, 'a', 'L')
+        self.assertEquals(len(COMMANDS), 10)
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
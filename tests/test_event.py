@@ -0,0 +1,95 @@
+from unittest import main, TestCase
+
+from twisted.internet.task import Clock
+
+from event import Event, EventQueue, LARGE_NUM
+
+class TestEventQueue(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.queue = EventQueue(self.clock)
+        self.calls = []
+
+    def call(self, name):
+        self.calls.append((name, self.clock.seconds()))
+
+    def test_order(self):
+        for delay in (0.3, 0.1, 0.2, 0.1):
+            self.queue.schedule(delay, self.call, delay)
+        self.assertEquals(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(0.15)
+        self.assertEquals([c[0] for c in self.calls], [0.1, 0.1])
+        self.clock.advance(1.0)
+        self.assertEquals([c[0] for c in self.calls], [0.1, 0.1, 0.2, 0.3])
+        self.assertEquals(len(self.queue), 0)
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+        self.assertEquals(self.queue.next_time(), LARGE_NUM)
+
+    def test_single_timer(self):
+        self.queue.schedule(0.5, self.call, 'late')
+        self.queue.schedule(0.1, self.call, 'early')
+        timers = self.clock.getDelayedCalls()
+        self.assertEquals(len(timers), 1)
+        self.assertAlmostEquals(timers[0].getTime(), 0.1)
+        self.clock.advance(0.1)
+        self.assertEquals(self.calls, [('early', 0.1)])
+        self.assertAlmostEquals(self.clock.getDelayedCalls()[0].getTime(), 0.5)
+
+    def test_cancel(self):
+        first = self.queue.schedule(0.1, self.call, 'first')
+        self.queue.schedule(0.2, self.call, 'second')
+        self.queue.cancel(first)
+        self.assertEquals(len(self.queue), 1)
+        self.assertAlmostEquals(self.queue.next_time(), 0.2)
+        self.clock.advance(1.0)
+        self.assertEquals([c[0] for c in self.calls], ['second'])
+
+    def test_supersede(self):
+        self.queue.schedule(0.2, self.call, 'old', tag='turn')
+        self.queue.schedule(0.3, self.call, 'new', tag='turn')
+        self.queue.schedule(0.25, self.call, 'other')
+        self.clock.advance(1.0)
+        self.assertEquals([c[0] for c in self.calls], ['other', 'new'])
+        self.queue.schedule(0.2, self.call, 'dropped', tag='turn')
+        self.queue.cancel_tag('turn')
+        self.clock.advance(1.0)
+        self.assertEquals(len(self.calls), 2)
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+
+    def test_cancel_executed(self):
+        done = self.queue.schedule(0.1, self.call, 'done')
+        for i in range(4):
+            self.queue.schedule(0.2, self.call, i)
+        self.clock.advance(0.1)
+        self.queue.cancel(done)
+        self.assertEquals(self.queue.cancelled, 0)
+        self.assertEquals(len(self.queue), 4)
+        self.clock.advance(1.0)
+        self.assertEquals([c[0] for c in self.calls], ['done', 0, 1, 2, 3])
+
+    def test_raising_callback(self):
+        def fail():
+            raise ValueError('broken')
+        self.queue.schedule(0.1, fail)
+        self.queue.schedule(0.2, self.call, 'after')
+        self.assertRaises(ValueError, self.clock.advance, 0.1)
+        self.clock.advance(0.1)
+        self.assertEquals([c[0] for c in self.calls], ['after'])
+
+    def test_compaction(self):
+        events = [self.queue.schedule(i, self.call, i) for i in range(1, 101)]
+        for event in events[:90]:
+            self.queue.cancel(event)
+        self.assert_(len(self.queue.queue) < 50)
+        self.assertEquals(len(self.queue), 10)
+        self.clock.advance(200)
+        self.assertEquals([c[0] for c in self.calls], range(91, 101))
+
+    def test_execute(self):
+        self.assertEquals(Event(lambda a, b: a + b, (1, 2), 0.0).execute(), 3)
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
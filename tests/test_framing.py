@@ -0,0 +1,39 @@
+from unittest import main, TestCase
+from framing import FrameBuffer
+
+SAMPLE = ("I 100.000 100.000 30000 30.000 60.000 20.000 20.0 60.0 ;"
+          "T 3450 aL -234.040 811.100 47.5 8.450 b -220.000 750.000 12.000 ;"
+          "S 4000 ;E 4010 ;")
+
+class TestFrameBuffer(TestCase):
+    "Split a stream into messages regardless of how it was chunked"
+
+    def expected(self):
+        return [s + ';' for s in SAMPLE.split(';')[:-1]]
+
+    def test_whole(self):
+        fb = FrameBuffer()
+        self.assertEquals(fb.feed(SAMPLE), self.expected())
+        self.assertEquals(len(fb), 0)
+
+    def test_chunked(self):
+        for size in (1, 2, 3, 7, 16, 61):
+            fb = FrameBuffer()
+            frames = []
+            for i in range(0, len(SAMPLE), size):
+                frames.extend(fb.feed(SAMPLE[i:i + size]))
+            self.assertEquals(frames, self.expected())
+            self.assertEquals(len(fb), 0)
+
+    def test_partial(self):
+        fb = FrameBuffer()
+        self.assertEquals(fb.feed('S 40'), [])
+        self.assertEquals(len(fb), 4)
+        self.assertEquals(fb.feed('00 ;E'), ['S 4000 ;'])
+        self.assertEquals(len(fb), 1)
+        self.assertEquals(fb.feed(' 4010 ;'), ['E 4010 ;'])
+
+if __name__ == '__main__':
+    main() 
+
+# vim: et sw=4 ts=4
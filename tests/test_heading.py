@@ -1,6 +1,10 @@
+import random
+import unittest
 from unittest import TestCase, main
 from mars_math import * 
+import mars_math
 import math
+import workloads
 
 class VectorSim(TestCase): 
     def test(self): 
@@ -15,5 +19,45 @@ class FindHeading(TestCase):
         result = find_heading(start, [], 360)
         assert (result % (2 * math.pi)) <= 0.01, result
 
+@unittest.skipIf(mars_math.numpy is None, 'needs numpy')
+class BatchScoring(TestCase):
+    "The numpy scorer must pick the same heading as the pure Python one"
+
+    def test_occlusion(self):
+        rng = random.Random(1)
+        for n_objects in (0, 1, 10, 60):
+            rover = workloads.RoverState(n_objects, rng)
+            range_lists = [find_object_ranges(rover.vector, rover.vector.pos,
+                rover.objects, 1000.0, 40.0) for i in range(2)]
+            directions = [rng.uniform(-math.pi, 3 * math.pi) for i in range(200)]
+            expected = occlusion_scores(directions, range_lists)
+            got = batch_occlusion_scores(directions, map(range_arrays, range_lists))
+            self.assertEquals(got.tolist(), expected)
+
+    def test_object_ranges(self):
+        rng = random.Random(3)
+        for n_objects in (0, 1, 10, 60):
+            rover = workloads.RoverState(n_objects, rng)
+            pos = rover.vector.pos
+            expected = range_arrays(find_object_ranges(rover.vector, pos,
+                rover.objects, 30.0, 40.0))
+            got = object_range_arrays(rover.vector, pos, rover.objects, 30.0, 40.0)
+            for e, g in zip(expected, got):
+                self.assertEquals(len(e), len(g))
+                for x, y in zip(e, g):
+                    self.assertAlmostEquals(x, y, 9)
+
+    def test_find_heading(self):
+        rng = random.Random(2)
+        for trial in range(30):
+            rover = workloads.RoverState(rng.randrange(40), rng)
+            for horizons in ((0.0,), (0.0, 0.5, 1.0)):
+                random.seed(trial)
+                a, force_a = find_heading(rover, horizons=horizons, vectorize=False)
+                random.seed(trial)
+                b, force_b = find_heading(rover, horizons=horizons, vectorize=True)
+                self.assertEquals(a.radians, b.radians)
+                self.assertEquals(force_a, force_b)
+
 if __name__ == '__main__':
     main() 
@@ -0,0 +1,56 @@
+from unittest import main, TestCase
+
+import client
+from instrument import Histogram, Timings
+import replay
+import workloads
+
+class TestHistogram(TestCase):
+
+    def test_percentiles(self):
+        h = Histogram()
+        for i in range(1, 101):
+            h.add(i / 1000.0)
+        self.assertEquals(h.count, 100)
+        self.assertAlmostEquals(h.mean(), 0.0505)
+        for fraction, exact in ((0.5, 0.050), (0.95, 0.095), (0.99, 0.099)):
+            got = h.percentile(fraction)
+            self.assert_(exact <= got <= exact * 1.19, (fraction, got))
+        self.assertEquals(h.percentile(1.0), 0.1)
+
+    def test_out_of_range(self):
+        h = Histogram()
+        h.add(0.0)
+        h.add(30.0)
+        self.assert_(h.percentile(0.5) <= 10e-6)
+        self.assertEquals(h.percentile(0.99), 30.0)
+
+    def test_empty(self):
+        self.assertEquals(Histogram().percentile(0.5), 0.0)
+
+class TestClientTimings(TestCase):
+
+    def test_stages(self):
+        c = client.TwistedClient()
+        c.makeConnection(replay.ReplayTransport())
+        data = workloads.stream(10, 5)
+        # leave off the end of the run, which reports and resets
+        data = data[:data.rindex('E')]
+        for chunk in workloads.chunks(data, 500):
+            c.dataReceived(chunk)
+        timings = c.rover_ctl.timings
+        self.assertEquals(timings.stages['parse'].count, 11)
+        self.assertEquals(timings.stages['setTelemetry'].count, 10)
+        steered = timings.stages['strategy'].count if 'strategy' in timings.stages else 0
+        self.assertEquals(steered + timings.counters.get('steering skipped', 0), 10)
+        self.assertEquals(timings.stages['sendMessage'].count, len(c.transport.written))
+        self.assert_('p99' in timings.report())
+
+        c.dataReceived('E 1000 ;')
+        self.assertEquals(timings.counters, {})
+        self.assertEquals(timings.stages.keys(), ['dataReceived'])
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
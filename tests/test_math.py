@@ -9,6 +9,13 @@ class TestMarsMath(TestCase):
         assert mars_math.vector_sim (0.01, -0.01) > 0.9
         assert mars_math.vector_sim (0.0, -math.pi) < 0.1
 
+    def test_segment_distance(self):
+        P = mars_math.Point
+        a, b = P(0, 0), P(10, 0)
+        self.assertAlmostEquals(mars_math.segment_distance(P(5, 3), a, b), 3.0)
+        self.assertAlmostEquals(mars_math.segment_distance(P(13, 4), a, b), 5.0)
+        self.assertAlmostEquals(mars_math.segment_distance(P(-3, 4), a, a), 5.0)
+
 if __name__ == '__main__':
     main() 
 
@@ -1,6 +1,10 @@
+import random
 from unittest import main, TestCase
 from message import *
 
+import workloads
+from legacy_message import LegacyMessage
+
 
 class TestParseSampleTelemetry(TestCase): 
     "Try parsing the sample message from the manual"
@@ -12,10 +16,65 @@ class TestParseSampleTelemetry(TestCase):
         result = Message.parse(self.sample_message)
         assert result['type'] == 'telemetry'
         tel = result['telemetry']
-        self.assertEquals(tel['position'][0], -234.040)
-        self.assertEquals(tel['position'][1], 811.100)
-        self.assertEquals(tel['direction'], 47.5)
-        self.assertEquals(tel['velocity'], 8.45)
+        self.assertEquals(tel.position.x, -234.040)
+        self.assertEquals(tel.position.y, 811.100)
+        self.assertEquals(tel.direction, 47.5)
+        self.assertEquals(tel.velocity, 8.45)
+        boulder, martian = tel.objects
+        self.assertEquals(boulder.kind, BOULDER)
+        self.assertEquals(boulder.radius, 12.0)
+        self.assertEquals(martian.kind, MARTIAN)
+        self.assertEquals(martian.speed, 9.1)
+
+def as_dicts(result):
+    """Turn the records in a parsed message back into the dicts the old
+    parser returned"""
+    tel = result['telemetry']
+    if tel is None:
+        result['telemetry'] = {}
+        return result
+    objects = []
+    for o in tel.objects:
+        d = {'kind': o.kind, 'position': (o.position.x, o.position.y),
+                'radius': o.radius}
+        if o.kind == MARTIAN:
+            d['direction'], d['speed'] = o.direction, o.speed
+        objects.append(d)
+    result['telemetry'] = {
+            'acceleration': tel.acceleration,
+            'turning': tel.turning,
+            'position': (tel.position.x, tel.position.y),
+            'direction': tel.direction,
+            'velocity': tel.velocity,
+            'objects': objects,
+            }
+    return result
+
+class TestParseDifferential(TestCase):
+    "The single-pass parser must agree with the old token-popping one"
+
+    def check(self, msg):
+        self.assertEquals(as_dicts(Message.parse(msg)), LegacyMessage.parse(msg))
+
+    def test_simple(self):
+        for msg in ['B 10 ;', 'C 20 ;', 'K 30 ;', 'S 40 ;', 'E 50 ;',
+                workloads.initial_message(),
+                TestParseSampleTelemetry.sample_message]:
+            self.check(msg)
+
+    def test_telemetry(self):
+        rng = random.Random(42)
+        for n in (0, 1, 2, 9, 10, 50, 200):
+            for i in range(5):
+                self.check(workloads.telemetry_message(i, n, rng))
+
+    def test_home(self):
+        self.check('T 10 -- 0.0 0.0 0.0 0.0 h 0.000 0.000 5.000 ;')
+
+    def test_errors(self):
+        self.assertRaises(ValueError, Message.parse, 'X 10 ;')
+        self.assertRaises(ValueError, Message.parse, 'T 10 a- 1 2 3 4 b 1 ;')
+        self.assertRaises(AssertionError, Message.parse, 'T 10 a- 1 2 3 4 x 1 2 3 ;')
 
 if __name__ == '__main__':
     main() 
@@ -0,0 +1,463 @@
+import math
+import random
+import unittest
+from unittest import main, TestCase
+
+from mars_math import Point
+import nav
+import workloads
+from nav import A_star, AnytimeAStar, ArrayMapGrid, ClusterGraph, DStarLite, MapGrid, OutOfTime, PathNotFound
+
+def path_cost(path):
+    return sum(math.hypot(a.x - b.x, a.y - b.y) for a, b in zip(path[:-1], path[1:]))
+
+# radii of the random obstacles on the 100 m test maps
+RADII = (1.0, 4.0)
+
+def clear_start(grid, p):
+    "Keep random obstacles from covering the start or goal cells"
+    grid.clear_cell(grid.node(p.x, p.y))
+
+class TestAStar(TestCase):
+
+    def grid(self, seed):
+        grid = MapGrid(100, 100, 50)
+        grid.add_obstacles(workloads.obstacles(15, 100.0, random.Random(seed), RADII))
+        clear_start(grid, Point(0, 0))
+        clear_start(grid, Point(-40, 35))
+        return grid
+
+    def test_optimal(self):
+        "The heuristic must not cost us the shortest path"
+        for seed in range(5):
+            grid = self.grid(seed)
+            start, goal = grid.node(-40, 35), grid.node(0, 0)
+            dijkstra_stats = {}
+            try:
+                expected = A_star(start, goal, grid.adjacent, grid.cost,
+                        stats=dijkstra_stats)
+            except PathNotFound:
+                continue
+            path = grid.path(Point(-40, 35), Point(0, 0))
+            self.assertEquals(len(path), len(expected))
+            self.assertAlmostEquals(path_cost(path),
+                    path_cost(map(grid.coord, expected)), 6)
+            self.assert_(grid.stats['expanded'] < dijkstra_stats['expanded'])
+
+    def test_stats(self):
+        grid = MapGrid(100, 100, 50)
+        path = grid.path(Point(-40, 0), Point(40, 0))
+        self.assertEquals(len(path), 41)
+        # straight line, the heuristic is exact
+        self.assertEquals(grid.stats['expanded'], 40)
+        self.assert_(grid.stats['pushed'] >= grid.stats['expanded'])
+        self.assert_(grid.stats['peak_open'] <= grid.stats['pushed'])
+
+    def test_not_found(self):
+        grid = MapGrid(100, 100, 50)
+        grid.add_obstacle((0.0, 0.0), 10.0)
+        stats = {}
+        self.assertRaises(PathNotFound, A_star, grid.node(-40, 0),
+                grid.node(0, 0), grid.adjacent, grid.cost, grid.distance, stats)
+        self.assertEquals(stats['expanded'], 50 * 50 - len(grid.obstacles))
+
+class TestJumpPointSearch(TestCase):
+    "Jump point search must find paths as short as A*"
+
+    def check_path(self, grid, path, start, goal):
+        # MapGrid.node truncates, so coordinates don't always map back to
+        # their own cell
+        def cell(p):
+            return (int(round(grid.grid_width * (p.x + grid.width / 2.0) / grid.width)),
+                    int(round(grid.grid_height * (p.y + grid.height / 2.0) / grid.height)))
+        nodes = map(cell, path)
+        self.assertEquals(nodes[0], grid.node(start.x, start.y))
+        self.assertEquals(nodes[-1], grid.node(goal.x, goal.y))
+        for a, b in zip(nodes[:-1], nodes[1:]):
+            self.assert_(b in grid._adjacent(a))
+            self.failIf(b in grid.obstacles)
+
+    def test_random_fields(self):
+        rng = random.Random(11)
+        for grid_class in (MapGrid, ArrayMapGrid):
+            if grid_class is ArrayMapGrid and nav.numpy is None:
+                continue
+            for trial in range(20):
+                grid = grid_class(100, 100, 60)
+                grid.add_obstacles(workloads.obstacles(rng.randrange(40), 100.0, rng, RADII))
+                start = Point(rng.uniform(-49, 49), rng.uniform(-49, 49))
+                goal = Point(rng.uniform(-49, 49), rng.uniform(-49, 49))
+                try:
+                    expected = grid.path(start, goal)
+                except PathNotFound:
+                    self.assertRaises(PathNotFound, grid.path, start, goal, True)
+                    continue
+                a_star_stats = grid.stats
+                got = grid.path(start, goal, jump_points=True)
+                self.assertAlmostEquals(path_cost(got), path_cost(expected), 6)
+                self.check_path(grid, got, start, goal)
+                self.assert_(grid.stats['expanded'] <= a_star_stats['expanded'])
+
+    def test_open_ground(self):
+        grid = MapGrid(100, 100, 50)
+        path = grid.path(Point(-40, -30), Point(40, 20), jump_points=True)
+        self.assertEquals(len(path), 41)
+        self.assert_(grid.stats['expanded'] <= 2)
+
+class TestHierarchicalPath(TestCase):
+
+    def check_path(self, grid, path):
+        for a, b in zip(path[:-1], path[1:]):
+            self.assert_(b in grid._adjacent(a))
+            self.failIf(b in grid.obstacles)
+
+    def test_near_optimal(self):
+        rng = random.Random(13)
+        for trial in range(10):
+            grid = MapGrid(100, 100, 80)
+            grid.add_obstacles(workloads.obstacles(30, 100.0, rng, RADII))
+            start = grid.node(rng.uniform(-49, 49), rng.uniform(-49, 49))
+            goal = grid.node(rng.uniform(-49, 49), rng.uniform(-49, 49))
+            graph = ClusterGraph(grid, 10)
+            try:
+                expected = A_star(start, goal, grid.adjacent, grid.cost, grid.distance)
+            except PathNotFound:
+                # the clusters can't find a path A* can't
+                self.assertRaises(PathNotFound, graph.path, start, goal)
+                continue
+            got = graph.path(start, goal)
+            self.assertEquals((got[0], got[-1]), (start, goal))
+            self.check_path(grid, got)
+            cost = path_cost(map(grid.coord, got))
+            self.assert_(cost <= 1.3 * path_cost(map(grid.coord, expected)) + 1e-6)
+
+    def test_local_updates(self):
+        grid = MapGrid(100, 100, 80)
+        grid.add_obstacles(workloads.obstacles(20, 100.0, random.Random(17), RADII))
+        start, goal = Point(-45, -45), Point(45, 40)
+        grid.clear_cell(grid.node(goal.x, goal.y))
+        grid.hierarchical_path(start, goal, 10)
+        graph = grid.hierarchy
+        graph.precompute()
+        n_clusters = len(graph.edges)
+        self.assertEquals(n_clusters, 64)
+
+        # an obstacle inside a cluster only touches that cluster
+        grid.add_obstacle((-3.75, -3.75), 0.5)
+        self.assertEquals(len(graph.edges), n_clusters - 1)
+        # one on a border also touches the cluster across it
+        graph.precompute()
+        grid.add_obstacle((0.0, -3.75), 0.5)
+        self.assertEquals(len(graph.edges), n_clusters - 2)
+
+        got = grid.hierarchical_path(start, goal, 10)
+        fresh = ClusterGraph(grid, 10).path(grid.node(start.x, start.y), grid.node(goal.x, goal.y))
+        self.assertEquals([(p.x, p.y) for p in got],
+                [(p.x, p.y) for p in map(grid.coord, fresh)])
+
+class TestIncrementalPath(TestCase):
+    "incremental_path must find paths as short as a search from scratch"
+
+    def from_scratch(self, grid, start, goal):
+        planner = DStarLite(grid.node(start.x, start.y), grid.node(goal.x, goal.y),
+                grid._adjacent, grid.blocked_cost, grid.distance)
+        return map(grid.coord, planner.path())
+
+    def check_same_cost(self, grid, start, goal):
+        try:
+            expected = path_cost(self.from_scratch(grid, start, goal))
+        except PathNotFound:
+            self.assertRaises(PathNotFound, grid.incremental_path, start, goal)
+            return
+        got = grid.incremental_path(start, goal)
+        self.assertAlmostEquals(path_cost(got), expected, 6)
+        self.assertAlmostEquals(path_cost(got), path_cost(grid.path(start, goal)), 6)
+        for p in got[1:]:
+            self.failIf(grid.node(p.x, p.y) in grid.obstacles)
+        self.assertEquals(grid.node(got[0].x, got[0].y), grid.node(start.x, start.y))
+        self.assertEquals(grid.node(got[-1].x, got[-1].y), grid.node(goal.x, goal.y))
+
+    def test_replanning(self):
+        rng = random.Random(3)
+        for trial in range(3):
+            grid = MapGrid(100, 100, 50)
+            goal = Point(0.0, 0.0)
+            start = Point(-40.0, 35.0)
+            grid.add_obstacles(workloads.obstacles(10, 100.0, rng, RADII))
+            clear_start(grid, goal)
+            self.check_same_cost(grid, start, goal)
+            for step in range(5):
+                # move towards home and notice some more things
+                start = Point(start.x + 5.0, start.y - 4.0)
+                grid.add_obstacles(workloads.obstacles(3, 100.0, rng, RADII))
+                clear_start(grid, goal)
+                self.check_same_cost(grid, start, goal)
+
+    def test_new_goal(self):
+        grid = MapGrid(100, 100, 50)
+        self.check_same_cost(grid, Point(-30, -30), Point(0, 0))
+        self.check_same_cost(grid, Point(-30, -30), Point(20, 10))
+
+class TestAnytimePath(TestCase):
+    "The anytime search keeps to its bound and ends up with the shortest path"
+
+    def grid(self, seed):
+        grid = MapGrid(100, 100, 50)
+        grid.add_obstacles(workloads.obstacles(15, 100.0, random.Random(seed), RADII))
+        clear_start(grid, Point(0, 0))
+        clear_start(grid, Point(-40, 35))
+        return grid
+
+    def test_bound(self):
+        for seed in range(5):
+            grid = self.grid(seed)
+            start, goal = grid.node(-40, 35), grid.node(0, 0)
+            try:
+                shortest = path_cost(map(grid.coord, A_star(start, goal,
+                    grid.adjacent, grid.cost, grid.distance)))
+            except PathNotFound:
+                self.assertRaises(PathNotFound, AnytimeAStar(start, goal,
+                    grid.adjacent, grid.cost, grid.distance).improve)
+                continue
+            search = AnytimeAStar(start, goal, grid.adjacent, grid.cost, grid.distance)
+            while True:
+                # a deadline in the past still makes a little progress
+                path = search.improve(0)
+                if path is not None:
+                    cost = path_cost(map(grid.coord, path))
+                    self.assert_(cost <= search.bound * shortest + 1e-6)
+                if search.done():
+                    break
+            self.assertAlmostEquals(cost, shortest, 6)
+
+    def test_improves_on_later_calls(self):
+        grid = MapGrid(100, 100, 100)
+        grid.add_obstacles(workloads.obstacles(40, 100.0, random.Random(1), RADII))
+        start, goal = Point(-40, 35), Point(0, 0)
+        clear_start(grid, start)
+        clear_start(grid, goal)
+        bounds = []
+        for i in range(1000):
+            try:
+                grid.path(start, goal, budget=0.0)
+            except OutOfTime:
+                continue
+            bounds.append(grid.stats['bound'])
+            if bounds[-1] == 1.0:
+                break
+        self.assertEquals(bounds, sorted(bounds, reverse=True))
+        self.assertEquals(bounds[-1], 1.0)
+        self.assertAlmostEquals(path_cost(grid.path(start, goal, budget=0.0)),
+                path_cost(grid.path(start, goal)), 6)
+
+    def test_obstacles_restart(self):
+        grid = MapGrid(100, 100, 50)
+        grid.path(Point(-40, 0), Point(40, 0), budget=1.0)
+        grid.add_obstacle((0.0, 0.0), 5.0)
+        path = grid.path(Point(-40, 0), Point(40, 0), budget=1.0)
+        for p in path:
+            self.failIf(grid.node(p.x, p.y) in grid.obstacles)
+
+class TestStringPull(TestCase):
+    "string_pull keeps few waypoints and never cuts through an obstacle"
+
+    def assertClear(self, grid, pulled, samples=50):
+        """Points along the lines between the waypoints are in free cells.
+        A line may go through the corner where two blocked cells meet, but
+        the corner is also in the free cells either side of it, so the
+        points sampled are never on the corners of cells."""
+        walkable = grid.walkable_function()
+        for a, b in zip(pulled[:-1], pulled[1:]):
+            for k in range(samples):
+                t = (k + 0.5) / samples
+                x = a.x + t * (b.x - a.x)
+                y = a.y + t * (b.y - a.y)
+                self.assert_(walkable(*grid.node(x, y)), (a, b, x, y))
+
+    def test_inflated(self):
+        "PathStrategy's grids: coarse, with obstacles inflated"
+        rng = random.Random(11)
+        for trial in range(10):
+            grid = MapGrid(200, 200, 100, 1.5)
+            grid.add_obstacles(workloads.obstacles(40, 200.0, rng, (0.5, 10.0)))
+            start, goal = Point(-95, 95), Point(0, 0)
+            clear_start(grid, start)
+            clear_start(grid, goal)
+            try:
+                path = grid.path(start, goal)
+            except PathNotFound:
+                continue
+            self.assertClear(grid, grid.string_pull(path))
+
+    def test_open_ground(self):
+        grid = MapGrid(100, 100, 50)
+        path = grid.string_pull(grid.path(Point(-40, -30), Point(30, 10)))
+        self.assertEquals(len(path), 2)
+
+    def test_around_obstacle(self):
+        grid = MapGrid(100, 100, 50)
+        grid.add_obstacle((0.0, 0.0), 10.0)
+        walkable = grid.walkable_function()
+        self.failIf(nav.line_of_sight(grid.node(-30, 0), grid.node(30, 0), walkable))
+        path = grid.string_pull(grid.path(Point(-30, 0), Point(30, 0)))
+        self.assert_(3 <= len(path) <= 5)
+
+    def test_diagonal_corner(self):
+        walkable = lambda i, j: (i, j) not in ((1, 0), (0, 1))
+        self.failIf(nav.line_of_sight((0, 0), (1, 1), walkable))
+        self.assert_(nav.line_of_sight((0, 0), (1, 1), lambda i, j: True))
+
+    def test_random_fields(self):
+        for seed in range(5):
+            grid = MapGrid(100, 100, 80)
+            grid.add_obstacles(workloads.obstacles(25, 100.0, random.Random(seed), RADII))
+            start, goal = Point(-40, 35), Point(35, -40)
+            clear_start(grid, start)
+            clear_start(grid, goal)
+            try:
+                path = grid.path(start, goal)
+            except PathNotFound:
+                continue
+            pulled = grid.string_pull(path)
+            self.assertEquals(grid.node(pulled[0].x, pulled[0].y), grid.cell(path[0]))
+            self.assertEquals(grid.node(pulled[-1].x, pulled[-1].y), grid.cell(path[-1]))
+            self.assert_(len(pulled) < len(path))
+            self.assert_(path_cost(pulled) <= path_cost(path) + 1e-6)
+            self.assertClear(grid, pulled)
+            walkable = grid.walkable_function()
+            for a, b in zip(pulled[1:-1], pulled[2:]):
+                (i1, j1), (i2, j2) = grid.node(a.x, a.y), grid.node(b.x, b.y)
+                # a step to the next cell is taken even through a corner
+                if max(abs(i1 - i2), abs(j1 - j2)) > 1:
+                    self.assert_(nav.line_of_sight((i1, j1), (i2, j2), walkable))
+
+class TestFootprint(TestCase):
+
+    def test_disc(self):
+        grid = MapGrid(100, 100, 100)
+        # the middle of a cell
+        grid.add_obstacle((0.5, 0.5), 3.0)
+        i, j = grid.node(0.5, 0.5)
+        self.assert_((i + 3, j) in grid.obstacles)
+        self.assert_((i - 3, j) in grid.obstacles)
+        self.assert_((i + 2, j + 2) in grid.obstacles)
+        self.failIf((i + 4, j) in grid.obstacles)
+        # a square would have its corners
+        self.failIf((i + 3, j + 3) in grid.obstacles)
+        self.failIf((i - 3, j - 3) in grid.obstacles)
+
+    def test_inflation(self):
+        grid = MapGrid(100, 100, 100, inflation=1.5)
+        grid.add_obstacle((0.5, 0.5), 3.0)
+        i, j = grid.node(0.5, 0.5)
+        self.assert_((i + 5, j) in grid.obstacles)
+        self.assert_((i + 3, j + 3) in grid.obstacles)
+        self.failIf((i + 6, j) in grid.obstacles)
+
+    def test_cached(self):
+        a = MapGrid(100, 100, 100)
+        b = MapGrid(200, 200, 200, inflation=0.05)
+        self.assert_(a.footprint((0.5, 0.5), 3.0) is b.footprint((0.5, 0.5), 2.95))
+        self.assert_(a.footprint((0.5, 0.5), 3.0) is not a.footprint((0.5, 0.5), 4.0))
+        # elsewhere in the cell
+        self.assert_(a.footprint((0.5, 0.5), 3.0) is not a.footprint((0.0, 0.0), 3.0))
+
+    def test_edges(self):
+        grid = MapGrid(100, 100, 100)
+        grid.add_obstacle((-49.5, 49.5), 3.0)
+        self.assert_((0, 99) in grid.obstacles)
+        self.assert_((3, 99) in grid.obstacles)
+        self.failIf((4, 99) in grid.obstacles)
+
+    def test_small(self):
+        "A small obstacle only blocks its cell and the ones beside it"
+        grid = MapGrid(100, 100, 50)
+        grid.add_obstacle((11.0, 11.0), 0.2)
+        i, j = grid.node(11.0, 11.0)
+        self.assert_((i, j) in grid.obstacles)
+        for di, dj in grid.obstacles:
+            self.assert_(abs(di - i) <= 1 and abs(dj - j) <= 1)
+
+    def test_clearance(self):
+        "No free cell comes within the inflation of an obstacle"
+        rng = random.Random(7)
+        obstacles = workloads.obstacles(30, 200.0, rng, (0.5, 10.0))
+        grids = [MapGrid(200, 200, 100, 1.5), MapGrid(200, 200, 33, 1.5)]
+        if nav.numpy is not None:
+            grids.append(ArrayMapGrid(200, 200, 100, 1.5))
+        for grid in grids:
+            grid.add_obstacles(obstacles)
+            blocked = grid.obstacles
+            cell_w = grid.width / grid.grid_width
+            cell_h = grid.height / grid.grid_height
+            for i in range(grid.grid_width):
+                left = i * cell_w - grid.width / 2.0
+                for j in range(grid.grid_height):
+                    if (i, j) in blocked:
+                        continue
+                    bottom = j * cell_h - grid.height / 2.0
+                    for (x, y), radius in obstacles:
+                        # the nearest point of the cell
+                        near_x = min(max(x, left), left + cell_w)
+                        near_y = min(max(y, bottom), bottom + cell_h)
+                        self.assert_(math.hypot(x - near_x, y - near_y) > radius + 1.5,
+                                (grid.resolution, i, j, x, y, radius))
+
+@unittest.skipIf(nav.numpy is None, 'needs numpy')
+class TestArrayMapGrid(TestCase):
+
+    def test_same_cells(self):
+        rng = random.Random(5)
+        for resolution in (50, 101):
+            for inflation in (0.0, 1.5):
+                cells = MapGrid(100, 100, resolution, inflation)
+                array = ArrayMapGrid(100, 100, resolution, inflation)
+                for point, radius in workloads.obstacles(20, 100.0, rng, RADII) + [((49.5, -49.5), 6.0)]:
+                    cells.add_obstacle(point, radius)
+                    array.add_obstacle(point, radius)
+                    # the center is always blocked
+                    self.assert_(array.node(*point) in array.obstacles)
+                self.assertEquals(array.obstacles, cells.obstacles)
+
+    def test_clear_cell(self):
+        for grid in (MapGrid(100, 100, 50), ArrayMapGrid(100, 100, 50)):
+            grid.add_obstacle((0.0, 0.0), 3.0)
+            node = grid.node(0.0, 0.0)
+            self.assert_(grid.is_blocked(node))
+            grid.clear_cell(node)
+            self.failIf(grid.is_blocked(node))
+            self.failIf(node in grid.obstacles)
+        # the array grid's obstacles are a copy, and can't be assigned
+        grid.obstacles.add(node)
+        self.failIf(grid.is_blocked(node))
+        self.assertRaises(AttributeError, setattr, grid, 'obstacles', set())
+
+    def test_same_paths_without_obstacles(self):
+        cells = MapGrid(100, 100, 50)
+        array = ArrayMapGrid(100, 100, 50)
+        start, goal = Point(-40, 35), Point(10, -5)
+        self.assertAlmostEquals(path_cost(array.path(start, goal)),
+                path_cost(cells.path(start, goal)), 6)
+
+    def test_incremental(self):
+        rng = random.Random(9)
+        grid = ArrayMapGrid(100, 100, 50)
+        goal = Point(0, 0)
+        start = Point(-40, 35)
+        for step in range(4):
+            grid.add_obstacles(workloads.obstacles(5, 100.0, rng, RADII))
+            i, j = grid.node(goal.x, goal.y)
+            grid.blocked[i, j] = False
+            grid._rows = None
+            try:
+                expected = path_cost(grid.path(start, goal))
+            except PathNotFound:
+                continue
+            got = grid.incremental_path(start, goal)
+            self.assertAlmostEquals(path_cost(got), expected, 6)
+            start = Point(start.x + 5.0, start.y - 4.0)
+
+if __name__ == '__main__':
+    main() 
+
+# vim: et sw=4 ts=4
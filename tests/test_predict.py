@@ -0,0 +1,112 @@
+import math
+import random
+import unittest
+from unittest import main, TestCase
+
+import mars_math
+from mars_math import Angle, Point, Vector
+from message import MartianSighting
+import predict
+import workloads
+
+def arc_end(martian, omega, t):
+    """Where martian ends up after t seconds turning at omega"""
+    heading = math.radians(martian.direction)
+    if omega == 0:
+        return (martian.position.x + martian.speed * t * math.cos(heading),
+                martian.position.y + martian.speed * t * math.sin(heading))
+    r = martian.speed / omega
+    return (martian.position.x + r * (math.sin(heading + omega * t) - math.sin(heading)),
+            martian.position.y - r * (math.cos(heading + omega * t) - math.cos(heading)))
+
+class TestPredictedPath(TestCase):
+
+    def test_corners(self):
+        vec = Vector(Point(0, 0), 10.0, Angle(0.0))
+        left, straight, right = mars_math.predicted_path(vec, math.pi / 2, 1.0)
+        self.assertAlmostEquals(straight.x, 10.0)
+        # a quarter circle of length 10
+        r = 20.0 / math.pi
+        self.assertAlmostEquals(left.x, r)
+        self.assertAlmostEquals(left.y, r)
+        self.assertAlmostEquals(right.x, r)
+        self.assertAlmostEquals(right.y, -r)
+
+@unittest.skipIf(predict.numpy is None, 'needs numpy')
+class TestReachable(TestCase):
+
+    def test_shape(self):
+        rover = workloads.RoverState(0, n_martians=3)
+        x, y, radius = predict.reachable(rover.martians, 1.0, (0.0, 1.0))
+        self.assertEquals(x.shape, (3, 2))
+        self.assertEquals(radius.shape, (3, 2))
+        x, y, radius = predict.reachable([], 1.0)
+        self.assertEquals(x.shape, (0, len(predict.HORIZONS)))
+
+    def test_standing_still(self):
+        martian = MartianSighting(Point(3, 4), 90.0, 0.0)
+        x, y, radius = predict.reachable([martian], 1.0, (0.0,))
+        self.assertAlmostEquals(x[0, 0], 3.0)
+        self.assertAlmostEquals(y[0, 0], 4.0)
+        self.assertAlmostEquals(radius[0, 0], predict.MARTIAN_RADIUS)
+
+    def test_covers_turns(self):
+        "Every turn the martian could make ends up inside the disc"
+        rng = random.Random(0)
+        omega = math.radians(60.0)
+        martians = workloads.RoverState(0, rng, n_martians=20).martians
+        x, y, radius = predict.reachable(martians, omega, accel=0.0)
+        for i, martian in enumerate(martians):
+            for j, t in enumerate(predict.HORIZONS):
+                for k in range(-20, 21):
+                    end_x, end_y = arc_end(martian, omega * k / 20.0, t)
+                    self.assert_(math.hypot(end_x - x[i, j], end_y - y[i, j])
+                            <= radius[i, j] + 1e-9)
+
+    def test_corners_inside(self):
+        martian = MartianSighting(Point(-10, 5), 30.0, 8.0)
+        x, y, radius = predict.reachable([martian], 1.0, (0.5,))
+        vec = Vector(martian.position, martian.speed, Angle(math.radians(30.0)))
+        for p in mars_math.predicted_path(vec, 1.0, 0.5):
+            self.assert_(math.hypot(p.x - x[0, 0], p.y - y[0, 0]) <= radius[0, 0])
+
+    def test_segment_blocked(self):
+        regions = predict.reachable([MartianSighting(Point(10, 0), 90.0, 0.0)], 1.0, (0.0,))
+        self.assert_(predict.segment_blocked(Point(0, 0), Point(20, 0), regions))
+        self.assert_(not predict.segment_blocked(Point(0, 0), Point(5, 0), regions))
+        self.assert_(predict.segment_blocked(Point(0, 0), Point(9, 0), regions, margin=1.0))
+        self.assert_(not predict.segment_blocked(Point(0, 0), Point(20, 0), None))
+
+@unittest.skipIf(predict.numpy is None, 'needs numpy')
+class TestFindHeading(TestCase):
+
+    def test_same_heading(self):
+        "The numpy and pure Python scorers agree with martians about"
+        rng = random.Random(4)
+        for trial in range(20):
+            rover = workloads.RoverState(rng.randrange(20), rng, n_martians=rng.randrange(5))
+            regions = predict.martian_regions(rover)
+            random.seed(trial)
+            a, force_a = mars_math.find_heading(rover, vectorize=False, regions=regions)
+            random.seed(trial)
+            b, force_b = mars_math.find_heading(rover, vectorize=True, regions=regions)
+            self.assertEquals(a.radians, b.radians)
+            self.assertEquals(force_a, force_b)
+
+    def test_steers_around(self):
+        rover = workloads.RoverState(0)
+        rover.vector = Vector(Point(-30, 0), 5.0, Angle(0.0))
+        rover.turning = '-'
+        ahead, force = mars_math.find_heading(rover)
+        self.assert_(abs(ahead.degrees) < 10)
+        # a martian coming straight at the rover
+        rover.martians = [MartianSighting(Point(-20, 0), 180.0, 5.0)]
+        around, force = mars_math.find_heading(rover,
+                regions=predict.martian_regions(rover))
+        self.assert_(abs(around.degrees) > 10, around.degrees)
+        self.assert_(force)
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
@@ -0,0 +1,62 @@
+from StringIO import StringIO
+from unittest import main, TestCase
+
+import capture
+import client
+import replay
+import workloads
+
+class TestCapture(TestCase):
+
+    def test_round_trip(self):
+        times = iter([10.0, 10.5, 11.25])
+        stream = StringIO()
+        recorder = capture.Recorder(stream, clock=lambda: times.next())
+        recorder.received('T 0 aL 1 2 3 4 ;\nI ')
+        recorder.sent('a;')
+        records = list(capture.read_capture(StringIO(stream.getvalue())))
+        self.assertEquals(records, [(capture.RECEIVED, 0.5, 'T 0 aL 1 2 3 4 ;\nI '),
+            (capture.SENT, 1.25, 'a;')])
+
+    def test_truncated(self):
+        stream = StringIO('r 0.5 10\nT 0 ;\n')
+        self.assertRaises(ValueError, list, capture.read_capture(stream))
+
+class TestReplay(TestCase):
+    "A recorded run replays frame by frame"
+
+    def record(self, data):
+        stream = StringIO()
+        recorder = client.TwistedClient()
+        recorder.makeConnection(replay.ReplayTransport())
+        recorder.recorder = capture.Recorder(stream)
+        for chunk in workloads.chunks(data, 300):
+            recorder.dataReceived(chunk)
+        return stream.getvalue(), recorder.transport.written
+
+    def test_fast(self):
+        data = workloads.stream(10, 5)
+        captured, sent = self.record(data)
+        records = list(capture.read_capture(StringIO(captured)))
+        self.assertEquals(''.join(d for k, w, d in records if k == capture.RECEIVED), data)
+        self.assertEquals([d for k, w, d in records if k == capture.SENT], sent)
+
+        replayed = replay.replay(StringIO(captured))
+        types = [t.type for t in replayed.timings]
+        self.assertEquals(types, ['initial'] + ['telemetry'] * 10 + ['end'])
+        for timing in replayed.timings:
+            self.assert_(0 <= timing.parse <= timing.total)
+            self.assert_(timing.strategy <= timing.total)
+        self.assert_(replayed.transport.written)
+        summary = replay.summarize(replayed.timings)
+        self.assertEquals(summary.counters, {'frames': 12, 'telemetry': 10})
+        self.assertEquals(summary.stages['strategy'].count, 10)
+        self.assertEquals(summary.stages['parse'].count, 12)
+        out = StringIO()
+        replay.report(replayed.timings, out)
+        self.assertEquals(out.getvalue(), summary.report() + '\n')
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
@@ -0,0 +1,106 @@
+import copy
+from StringIO import StringIO
+from unittest import main, TestCase
+
+from twisted.internet import reactor
+
+import client
+from message import Message
+import simulator
+
+def world(**changes):
+    w = copy.deepcopy(simulator.DEFAULT_MAP)
+    w.update(changes)
+    return w
+
+class TestSimulation(TestCase):
+
+    def test_messages_parse(self):
+        sim = simulator.Simulation(world(boulders=[{'x': -70.0, 'y': -70.0, 'r': 2.0}],
+            runs=[{'vehicle': {'x': -80.0, 'y': -80.0, 'dir': 45.0},
+                'martians': [{'x': -60.0, 'y': -60.0, 'dir': 0.0}]}]))
+        initial = Message.parse(sim.initial_message())['initial']
+        self.assertEquals(initial['dx'], 200.0)
+        self.assertEquals(initial['max_speed'], 20.0)
+        telemetry = Message.parse(sim.telemetry_message())['telemetry']
+        self.assertEquals(sorted(o.kind for o in telemetry.objects), ['b', 'm'])
+        self.assertEquals(Message.parse(sim.end_message())['type'], 'end')
+
+    def test_commands(self):
+        sim = simulator.Simulation(world())
+        sim.command('al;')
+        sim.command('l;')
+        sim.command('l;')
+        self.assertEquals((sim.rover.accel, sim.rover.turn), ('a', 'L'))
+        sim.command('br;')
+        sim.command('b;')
+        sim.command('b;')
+        self.assertEquals((sim.rover.accel, sim.rover.turn), ('b', 'l'))
+
+    def test_top_speed(self):
+        sim = simulator.Simulation(world(timeLimit=100000,
+            runs=[{'vehicle': {'x': -95.0, 'y': 0.0, 'dir': 90.0}}]))
+        sim.command('a;')
+        sim.advance(30.0)
+        self.assert_(18.0 < sim.rover.speed <= 20.0)
+
+    def test_home(self):
+        sim = simulator.Simulation(world())
+        sim.command('a;')
+        events = sim.advance(30.0)
+        self.assertEquals([e[0] for e in events], ['S'])
+        self.assertEquals(sim.outcome, 'S')
+
+    def test_crater(self):
+        sim = simulator.Simulation(world(craters=[{'x': -40.0, 'y': -40.0, 'r': 5.0}]))
+        sim.command('a;')
+        events = sim.advance(30.0)
+        self.assertEquals([e[0] for e in events], ['C'])
+
+    def test_boulder_and_time_limit(self):
+        sim = simulator.Simulation(world(timeLimit=20000,
+            boulders=[{'x': -40.0, 'y': -40.0, 'r': 5.0}]))
+        sim.command('a;')
+        events = sim.advance(30.0)
+        self.assert_(events)
+        self.assertEquals(set(e[0] for e in events), set('B'))
+        self.assert_(sim.over)
+        self.assertEquals(sim.outcome, None)
+
+    def test_martian_chases(self):
+        sim = simulator.Simulation(world(runs=[{'vehicle': {'x': -80.0, 'y': -80.0, 'dir': 0.0},
+            'martians': [{'x': -60.0, 'y': -80.0, 'dir': 90.0}]}]))
+        events = sim.advance(20.0)
+        self.assertEquals([e[0] for e in events], ['K'])
+
+    def test_load_map(self):
+        w = simulator.load_map(StringIO('{"size": 100.0, "vehicleParams": {"maxSpeed": 10.0}}'))
+        self.assertEquals(w['size'], 100.0)
+        self.assertEquals(w['vehicleParams']['maxSpeed'], 10.0)
+        self.assertEquals(w['vehicleParams']['turn'], 20.0)
+
+class TestEndToEnd(TestCase):
+    "The client gets home on an empty map, several times faster than real time"
+
+    def test_run(self):
+        factory = simulator.SimulatorFactory(world(), warp=10.0)
+        port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+        seen = []
+        class Client(client.TwistedClient):
+            def messageReceived(self, msg):
+                seen.append(msg['type'])
+                client.TwistedClient.messageReceived(self, msg)
+        client_factory = client.TwistedClientFactory()
+        client_factory.protocol = Client
+        reactor.connectTCP('127.0.0.1', port.getHost().port, client_factory)
+        timeout = reactor.callLater(20, reactor.stop)
+        reactor.run()
+        if timeout.active():
+            timeout.cancel()
+        self.assertEquals(seen[0], 'initial')
+        self.assertEquals(seen[-2:], ['success', 'end'])
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
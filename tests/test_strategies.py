@@ -0,0 +1,130 @@
+import unittest
+from unittest import main, TestCase
+
+from twisted.internet import defer
+
+from constants import ROVER_RADIUS, SAFETY_MARGIN
+from mars_math import Angle, Point, Vector
+from message import StaticObject, BOULDER, CRATER, HOME
+import nav
+from nav import MapGrid
+import strategies
+from world import World
+
+class FakeRover(object):
+    def __init__(self):
+        self.map_size = 100.0, 100.0
+        self.world = World()
+        self.vector = Vector(Point(40, 40), 0, Angle(0))
+
+    @property
+    def objects(self):
+        return self.world.objects
+
+def fresh_grid(rover, resolution):
+    grid = MapGrid(rover.map_size[0], rover.map_size[1], resolution,
+            ROVER_RADIUS + SAFETY_MARGIN)
+    grid.add_obstacles(strategies.PathStrategy.obstacles(rover.objects))
+    return grid
+
+class TestUpdateGrid(TestCase):
+    "The grid kept by PathStrategy should match one built from scratch"
+
+    def test_incremental(self):
+        rover = FakeRover()
+        strategy = strategies.PathStrategy()
+        rover.objects.append(StaticObject(BOULDER, Point(10, 10), 2.0))
+        rover.objects.append(StaticObject(HOME, Point(0, 0), 5.0))
+        strategy.updateGrid(rover, 100)
+        grid = strategy.grid
+        rover.objects.append(StaticObject(CRATER, Point(-20, 5), 4.0))
+        strategy.updateGrid(rover, 100)
+        self.assert_(strategy.grid is grid)
+        self.assertEquals(strategy.stamped, 3)
+        self.assertEquals(grid.obstacles, fresh_grid(rover, 100).obstacles)
+
+    def test_resolution_change(self):
+        rover = FakeRover()
+        strategy = strategies.PathStrategy()
+        rover.objects.append(StaticObject(BOULDER, Point(10, 10), 2.0))
+        strategy.updateGrid(rover, 100)
+        strategy.updateGrid(rover, 201)
+        self.assertEquals(strategy.grid.resolution, 201)
+        self.assertEquals(strategy.grid.obstacles, fresh_grid(rover, 201).obstacles)
+
+    @unittest.skipIf(nav.numpy is None, 'needs numpy')
+    def test_array_grid(self):
+        rover = FakeRover()
+        strategy = strategies.PathStrategy(array_grid=True)
+        rover.objects.append(StaticObject(BOULDER, Point(10, 10), 2.0))
+        strategy.updateGrid(rover, 100)
+        self.assert_(isinstance(strategy.grid, strategies.ArrayMapGrid))
+        self.assert_(strategy.grid.node(10, 10) in strategy.grid.obstacles)
+
+class TestBackgroundPlanning(TestCase):
+    "Paths planned off the reactor are adopted only if they are the latest"
+
+    def setUp(self):
+        self.rover = FakeRover()
+        self.strategy = strategies.PathStrategy(background=True)
+        self.calls = []
+        self.strategy.defer_to_thread = self.defer
+
+    def defer(self, f, request):
+        d = defer.Deferred()
+        self.calls.append((d, f, request))
+        return d
+
+    def finish(self, index):
+        d, f, request = self.calls[index]
+        d.callback(f(request))
+
+    def test_adopts_result(self):
+        self.strategy.requestPath(self.rover)
+        self.assertEquals(self.strategy.path, [])
+        self.finish(0)
+        self.assert_(self.strategy.path)
+        self.assertFalse(self.strategy.in_flight)
+
+    def test_one_in_flight(self):
+        for i in range(3):
+            self.strategy.requestPath(self.rover)
+        # the second request was superseded by the third before it started
+        self.assertEquals(len(self.calls), 1)
+        self.assertEquals(self.strategy.queued.generation, 3)
+        self.finish(0)
+        self.assertEquals(len(self.calls), 2)
+        self.assertEquals(self.calls[1][2].generation, 3)
+
+    def test_newer_result_adopted(self):
+        self.strategy.requestPath(self.rover)
+        self.finish(0)
+        first = self.strategy.path
+        self.strategy.requestPath(self.rover)
+        self.rover.objects.append(StaticObject(BOULDER, Point(20, 20), 3.0))
+        # two more requests while the second is still being planned
+        self.strategy.requestPath(self.rover)
+        self.strategy.requestPath(self.rover)
+        self.finish(1)
+        # older than the latest request, but newer than the path followed
+        self.assert_(self.strategy.path is not first)
+        self.assertEquals(self.strategy.adopted, 2)
+        self.finish(2)
+        self.assertEquals(self.strategy.adopted, 4)
+
+    def test_stale_result_dropped(self):
+        newer = [Point(1, 1)]
+        self.strategy.adoptPath(3, newer)
+        self.strategy.adoptPath(2, [Point(2, 2)])
+        self.assert_(self.strategy.path is newer)
+        self.assertEquals(self.strategy.adopted, 3)
+
+    def test_snapshot(self):
+        self.strategy.requestPath(self.rover)
+        self.rover.objects.append(StaticObject(BOULDER, Point(20, 20), 3.0))
+        self.assertEquals(list(self.calls[0][2].objects), [])
+
+if __name__ == '__main__':
+    main() 
+
+# vim: et sw=4 ts=4
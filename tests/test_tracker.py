@@ -0,0 +1,101 @@
+import math
+from unittest import main, TestCase
+
+import client
+from mars_math import Point
+from message import MartianSighting, MARTIAN
+import replay
+import tracker
+import workloads
+
+def sighting(x, y, direction=0.0, speed=0.0):
+    return MartianSighting(Point(x, y), direction, speed)
+
+class TestTracker(TestCase):
+
+    def test_association(self):
+        t = tracker.MartianTracker()
+        # two martians heading towards each other along y = 0 and y = 4,
+        # reported in a different order every update
+        first = t.update(0.0, [sighting(-20, 0, 0.0, 10.0), sighting(20, 4, 180.0, 10.0)])
+        ids = [track.id for track in first]
+        for step in range(1, 30):
+            now = step * 0.1
+            a = sighting(-20 + 10 * now, 0, 0.0, 10.0)
+            b = sighting(20 - 10 * now, 4, 180.0, 10.0)
+            if step % 2:
+                seen = t.update(now, [a, b])
+            else:
+                seen = t.update(now, [b, a])
+                seen.reverse()
+            self.assertEquals([track.id for track in seen], ids)
+        self.assertEquals(len(t), 2)
+        a, b = seen
+        self.assertAlmostEquals(a.vx, 10.0, 6)
+        self.assertAlmostEquals(a.vy, 0.0, 6)
+        self.assertAlmostEquals(b.vx, -10.0, 6)
+
+    def test_turn_rate(self):
+        t = tracker.MartianTracker()
+        for step in range(20):
+            heading = 10.0 * step
+            # 10 degrees every 0.1 seconds, slow enough to stay in the gate
+            t.update(step * 0.1, [sighting(math.cos(math.radians(heading)),
+                math.sin(math.radians(heading)), heading + 90.0, 1.75)])
+        track, = list(t)
+        self.assertAlmostEquals(track.turn_rate, math.radians(100.0), 3)
+
+    def test_retired(self):
+        t = tracker.MartianTracker(max_missed=3)
+        track, = t.update(0.0, [sighting(0, 0)])
+        for step in range(1, 4):
+            self.assertEquals(t.update(step, []), [])
+            self.assertEquals(len(t), 1)
+        t.update(4, [])
+        self.assertEquals(len(t), 0)
+        # seen again after that it is a new martian
+        again, = t.update(5, [sighting(0, 0)])
+        self.assertNotEquals(again.id, track.id)
+
+    def test_outside_gate(self):
+        t = tracker.MartianTracker(gate=2.0)
+        a, = t.update(0.0, [sighting(0, 0)])
+        b, = t.update(0.1, [sighting(3, 0)])
+        self.assertNotEquals(a.id, b.id)
+        c, = t.update(0.2, [sighting(3.5, 0.5)])
+        self.assertEquals(b.id, c.id)
+
+    def test_history(self):
+        t = tracker.MartianTracker(history=4)
+        for step in range(10):
+            track, = t.update(step, [sighting(step * 0.5, 0, 0.0, 0.5)])
+        self.assertEquals([s.time for s in track.history()], [6, 7, 8, 9])
+        t = tracker.MartianTracker(history=4)
+        for step in range(2):
+            track, = t.update(step, [sighting(0, 0)])
+        self.assertEquals([s.time for s in track.history()], [0, 1])
+
+class TestController(TestCase):
+    "Martians are tracked rather than kept forever"
+
+    def test_bounded(self):
+        c = client.TwistedClient()
+        c.makeConnection(replay.ReplayTransport())
+        rover = c.rover_ctl
+        most = 0
+        # every telemetry update has 3 martians somewhere random
+        data = workloads.stream(200, 30)
+        for chunk in workloads.chunks(data, 4096):
+            c.dataReceived(chunk)
+            most = max(most, len(rover.tracker))
+            self.assert_(len(rover.martians) <= 3)
+        self.assert_(most <= 3 * (tracker.MAX_MISSED + 1), most)
+        self.assertEquals([o for o in rover.objects if o.kind == MARTIAN], [])
+        # the end of the run drops them all
+        self.assertEquals(len(rover.tracker), 0)
+        c.connectionLost(None)
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
@@ -0,0 +1,75 @@
+import logging
+from StringIO import StringIO
+from unittest import main, TestCase
+
+import utils
+
+class Unprintable(object):
+    formatted = 0
+
+    def __repr__(self):
+        Unprintable.formatted += 1
+        return 'Unprintable()'
+
+class TestLogging(TestCase):
+
+    def tearDown(self):
+        utils.configure('debug')
+
+    def test_background_handler(self):
+        stream = StringIO()
+        handler = utils.BackgroundHandler(stream, batch=7)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log = logging.getLogger('test_background_handler')
+        log.propagate = False
+        log.addHandler(handler)
+        for i in range(50):
+            log.warning('line %d', i)
+        handler.flush()
+        self.assertEquals(stream.getvalue().splitlines(), ['line %d' % i for i in range(50)])
+        log.warning('last')
+        handler.close()
+        self.failIf(handler.thread.is_alive())
+        self.assertEquals(stream.getvalue().splitlines()[-1], 'last')
+
+    def test_production_profile(self):
+        stream = StringIO()
+        handler = utils.configure('production', stream)
+        log = logging.getLogger('TwistedClient')
+        self.failIf(log.isEnabledFor(logging.INFO))
+        Unprintable.formatted = 0
+        log.debug('%r', Unprintable())
+        log.info('%r', Unprintable())
+        self.assertEquals(Unprintable.formatted, 0)
+        log.warning('%r', Unprintable())
+        handler.flush()
+        self.assertEquals(Unprintable.formatted, 1)
+        self.assert_(stream.getvalue().rstrip().endswith('Unprintable()'))
+
+    def test_debug_profile(self):
+        stream = StringIO()
+        utils.configure('debug', stream)
+        self.assert_(logging.getLogger('MapGrid').isEnabledFor(logging.DEBUG))
+        self.failIf(logging.getLogger('TwistedClient').isEnabledFor(logging.DEBUG))
+        logging.getLogger('MapGrid').debug('hello')
+        self.assert_('hello' in stream.getvalue())
+
+    def test_switching_back(self):
+        "The debug profile gets the caller and thread back after production"
+        utils.configure('production', StringIO())
+        utils.configure('debug', StringIO())
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        log = logging.getLogger('test_switching_back')
+        log.addHandler(handler)
+        log.warning('here')
+        log.removeHandler(handler)
+        record, = records
+        self.assertEquals(record.funcName, 'test_switching_back')
+        self.assert_(record.threadName)
+
+if __name__ == '__main__':
+    main()
+
+# vim: et sw=4 ts=4
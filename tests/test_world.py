@@ -0,0 +1,118 @@
+import random
+from unittest import main, TestCase
+
+import client
+from mars_math import Point
+from message import StaticObject, MartianSighting, BOULDER, CRATER
+import replay
+import workloads
+from world import ObjectIndex, World, similar_position
+
+def linear_add(known, obj):
+    "How RoverController.noticeObject used to dedup objects"
+    for o in known:
+        if o.kind == obj.kind and similar_position(obj.position, o.position):
+            return False
+    known.append(obj)
+    return True
+
+class TestObjectIndex(TestCase):
+
+    def test_resighting(self):
+        index = ObjectIndex(100.0)
+        self.assert_(index.add(StaticObject(BOULDER, Point(50.0, -20.0), 3.0)))
+        self.assertEquals(index.version, 1)
+        # same boulder, slightly different position
+        self.failIf(index.add(StaticObject(BOULDER, Point(49.0, -19.5), 3.0)))
+        # a crater in the same spot is a different object
+        self.assert_(index.add(StaticObject(CRATER, Point(50.0, -20.0), 3.0)))
+        self.assertEquals(index.version, 2)
+        self.assertEquals(len(index), 2)
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(7)
+        for extent in (0.0, 50.0, 500.0):
+            index = ObjectIndex(extent)
+            known = []
+            for i in range(2000):
+                # lots of re-sightings of a small set of objects
+                x = rng.choice(range(-50, 50, 5)) + rng.uniform(-1, 1)
+                y = rng.choice(range(-50, 50, 5)) + rng.uniform(-1, 1)
+                obj = StaticObject(rng.choice((BOULDER, CRATER)), Point(x, y), 1.0)
+                self.assertEquals(index.add(obj), linear_add(known, obj))
+            self.assertEquals(index.version, len(known))
+
+    def test_resize(self):
+        index = ObjectIndex()
+        index.add(StaticObject(BOULDER, Point(40.0, 40.0), 1.0))
+        index.resize(500.0)
+        self.assertEquals(index.version, 1)
+        self.failIf(index.add(StaticObject(BOULDER, Point(40.5, 40.5), 1.0)))
+
+class TestWorld(TestCase):
+
+    def test_no_object_dropped(self):
+        "Static objects are obstacles the planners need, so all are kept"
+        world = World()
+        world.begin_session(5000.0)
+        rng = random.Random(3)
+        new = 0
+        for i in range(20000):
+            new += world.notice(StaticObject(BOULDER,
+                Point(rng.uniform(-5000, 5000), rng.uniform(-5000, 5000)), 1.0))
+        self.assert_(new > 5000, new)
+        self.assertEquals(len(world.objects), new)
+        # seeing a known object again doesn't add it
+        self.failIf(world.notice(world.objects[0]))
+        self.assertEquals(len(world.objects), new)
+
+    def test_lifetimes(self):
+        world = World()
+        world.begin_session(100.0)
+        world.begin_frame()
+        world.notice(StaticObject(CRATER, Point(5, 5), 2.0))
+        world.notice(MartianSighting(Point(20, 20), 0.0, 5.0))
+        world.end_frame(1.0)
+        self.assertEquals(len(world.martians), 1)
+        self.assertEquals(len(world.tracker), 1)
+        world.end_run()
+        self.assertEquals(world.sizes(), {'objects': 1, 'index': 1,
+            'martians': 0, 'tracks': 0, 'intervals': 0})
+        world.begin_session(100.0)
+        self.assertEquals(world.sizes()['objects'], 0)
+
+    def test_snapshot(self):
+        world = World()
+        world.notice(StaticObject(CRATER, Point(5, 5), 2.0))
+        snapshot = world.snapshot()
+        world.notice(StaticObject(CRATER, Point(50, 5), 2.0))
+        self.assertEquals(len(snapshot), 1)
+        self.assertEquals([o.position.x for o in snapshot], [5.0])
+        # a new session doesn't disturb it either
+        world.begin_session()
+        self.assertEquals(len(list(snapshot)), 1)
+
+    def test_soak(self):
+        "Memory levels off however many runs there are"
+        c = client.TwistedClient()
+        c.makeConnection(replay.ReplayTransport())
+        world = c.rover_ctl.world
+        # every run of a session is on the same map
+        data = workloads.stream(50, 20)
+        for run in range(30):
+            for chunk in workloads.chunks(data, 4096):
+                c.dataReceived(chunk)
+            sizes = world.sizes()
+            if run == 0:
+                first = sizes
+            self.assertEquals(sizes, first)
+            self.assertEquals(sizes['objects'], sizes['index'])
+            self.assertEquals(sizes['tracks'], 0)
+            self.assertEquals(sizes['intervals'], 0)
+            self.assert_(len(c.rover_ctl.scheduler) <= 1)
+        c.connectionLost(None)
+
+if __name__ == '__main__':
+    main() 
+
+# vim: et sw=4 ts=4
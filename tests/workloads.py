@@ -0,0 +1,72 @@
+'''Generated server messages for the benchmarks'''
+
+import math
+import random
+
+from mars_math import Angle, Point, Vector
+from message import StaticObject, MartianSighting, BOULDER, CRATER
+
+def initial_message(size=200.0):
+    return 'I %1.3f %1.3f 30000 30.000 60.000 20.000 20.0 60.0 ;' % (size, size)
+
+def telemetry_message(time_stamp, n_objects, rng=None, size=200.0):
+    """A telemetry message with n_objects visible objects (roughly one in ten
+    of them a martian)"""
+    rng = rng or random.Random(time_stamp)
+    half = size / 2.0
+    parts = ['T %d aL %1.3f %1.3f %1.1f %1.3f' % (time_stamp,
+        rng.uniform(-half, half), rng.uniform(-half, half),
+        rng.uniform(0, 360), rng.uniform(0, 20))]
+    for i in range(n_objects):
+        x, y = rng.uniform(-half, half), rng.uniform(-half, half)
+        if i % 10 == 9:
+            parts.append('m %1.3f %1.3f %1.1f %1.3f' % (x, y,
+                rng.uniform(0, 360), rng.uniform(0, 15)))
+        else:
+            parts.append('%s %1.3f %1.3f %1.3f' % (rng.choice('bc'), x, y,
+                rng.uniform(0.5, 10)))
+    parts.append(';')
+    return ' '.join(parts)
+
+def stream(n_messages, n_objects, seed=0):
+    """A whole run as the server would send it"""
+    rng = random.Random(seed)
+    msgs = [initial_message()]
+    for i in range(n_messages):
+        msgs.append(telemetry_message(100 * i, n_objects, rng))
+    msgs.append('E %d ;' % (100 * n_messages))
+    return ''.join(msgs)
+
+def chunks(data, size):
+    """Split data into TCP sized reads"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+class RoverState(object):
+    """The parts of a RoverController that find_heading looks at, with
+    n_objects boulders and craters and n_martians martians around the rover"""
+
+    def __init__(self, n_objects, rng=None, n_martians=0):
+        rng = rng or random.Random(n_objects)
+        pos = Point(rng.uniform(-60, 60), rng.uniform(-60, 60))
+        self.vector = Vector(pos, rng.uniform(0, 20), Angle(rng.uniform(0, 2 * math.pi)))
+        self.turning = rng.choice('lLrR-')
+        self.max_turn = math.radians(20.0)
+        self.max_hard_turn = math.radians(60.0)
+        self.avg_interval = 0.1
+        self.objects = [StaticObject(rng.choice((BOULDER, CRATER)),
+            Point(pos.x + rng.uniform(-40, 40), pos.y + rng.uniform(-40, 40)),
+            rng.uniform(0.5, 8.0)) for i in range(n_objects)]
+        self.objects.append(MartianSighting(pos, 0.0, 1.0))
+        self.martians = [MartianSighting(
+            Point(pos.x + rng.uniform(-30, 30), pos.y + rng.uniform(-30, 30)),
+            rng.uniform(0, 360), rng.uniform(0, 12)) for i in range(n_martians)]
+
+def obstacles(n, size=200.0, rng=None, radii=(1.0, 8.0)):
+    """n (point, radius) pairs for MapGrid.add_obstacles, with radii between
+    the two given, on a map size meters across"""
+    rng = rng or random.Random(0)
+    half = size / 2.0 - 10.0
+    return [((rng.uniform(-half, half), rng.uniform(-half, half)),
+        rng.uniform(*radii)) for i in range(n)]
+
+# vim: et sw=4 ts=4